@@ -82,6 +82,15 @@ DATABASES = {
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 }
+# SQLITE_PROFILE=production — режим для одновременных отправок: WAL, synchronous=NORMAL, ожидание блокировки
+# вместо ошибки "database is locked" и BEGIN IMMEDIATE, чтобы транзакция сразу брала блокировку на запись
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "")
+if SQLITE_PROFILE == "production":
+    DATABASES["default"]["OPTIONS"] = {
+        "init_command": "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;",
+        "timeout": 20,
+        "transaction_mode": "IMMEDIATE",
+    }
 # if DEBUG is False:
 #     DATABASES = {
 #         "default": {
@@ -134,12 +143,57 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
-SESSION_ENGINE = "django.contrib.sessions.backends.db"
+# Для SESSION_MODE=cache нужен общий для всех воркеров кеш (Redis, Memcached или файловый)
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+# db — сессии в БД; cache — только в кеше, без записи в БД; cached_db — чтение из кеша, запись в БД.
+# signed_cookies не подходит: ключ сессии анонимного пользователя хранится в FormSubmission.session_key
+SESSION_ENGINE = {
+    "db": "django.contrib.sessions.backends.db",
+    "cache": "django.contrib.sessions.backends.cache",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+}[os.getenv("SESSION_MODE", "db")]
 SESSION_COOKIE_AGE = 1209600
 SESSION_COOKIE_HTTPONLY = True
 SESSION_COOKIE_SECURE = False
 SESSION_COOKIE_SAMESITE = 'Lax'
 
+FORM_CLASS_CACHE_SIZE = 128
+FORM_FRAGMENT_CACHE_TIMEOUT = 3600
+SUBMISSION_COUNT_CACHE_TIMEOUT = 300
+# Процессы для сборки Excel-файлов ZIP-экспорта; по умолчанию без пула, см. manage.py benchmark_export
+FORM_EXPORT_WORKERS = int(os.getenv("FORM_EXPORT_WORKERS", "1"))
+# Пул запускается (spawn заново импортирует Django в каждом процессе) только для выгрузок не меньше этого числа отправок
+FORM_EXPORT_PARALLEL_MIN_ROWS = int(os.getenv("FORM_EXPORT_PARALLEL_MIN_ROWS", "2000"))
+# Брать число отправок в админке из счётчиков на DynamicForm и UserSubmissionCount вместо COUNT по таблице отправок
+FORM_ADMIN_USE_COUNTERS = os.getenv("FORM_ADMIN_USE_COUNTERS", "0") == "1"
+# proxy — файлы идут через Django; direct — браузер загружает их прямо в S3/MinIO по подписанным ссылкам
+FORM_UPLOAD_MODE = os.getenv("FORM_UPLOAD_MODE", "proxy")
+FORM_UPLOAD_URL_EXPIRES = 900
+FORM_UPLOAD_MAX_SIZE = 50 * 1024 * 1024
+# Сколько ссылок на прямую загрузку выдаётся одному пользователю или IP-адресу в час; ничьи объекты удаляет
+# manage.py cleanup_uploads
+FORM_UPLOAD_TICKETS_PER_HOUR = int(os.getenv("FORM_UPLOAD_TICKETS_PER_HOUR", 60))
+# Сколько файлов одной отправки загружается в хранилище одновременно
+FORM_UPLOAD_WORKERS = int(os.getenv("FORM_UPLOAD_WORKERS", 4))
+# Миниатюры изображений: наибольшая сторона в пикселях и число фоновых потоков (0 — сразу после коммита в запросе)
+FORM_THUMBNAIL_SIZE = 600
+FORM_THUMBNAIL_WORKERS = int(os.getenv("FORM_THUMBNAIL_WORKERS", 2))
+# Отправки и правки ответов пишет один поток процесса, пачками по FORM_WRITER_BATCH_SIZE за транзакцию
+FORM_SERIAL_WRITER = os.getenv("FORM_SERIAL_WRITER", "1" if SQLITE_PROFILE == "production" else "0") == "1"
+FORM_WRITER_BATCH_SIZE = 50
+# Режим приёма для пиковой нагрузки: проверенные отправки пишутся в журнал FORM_INGEST_QUEUE и сразу подтверждаются,
+# а в основную базу их переносит воркер run_ingest_worker
+FORM_INGEST_MODE = os.getenv("FORM_INGEST_MODE", "0") == "1"
+FORM_INGEST_QUEUE = os.getenv("FORM_INGEST_QUEUE", BASE_DIR / "ingest.sqlite3")
+FORM_INGEST_BATCH_SIZE = 500
+# Асинхронные представления отправки и правки ответов — для запуска через config.asgi (uvicorn, daphne)
+FORM_ASYNC_VIEWS = os.getenv("FORM_ASYNC_VIEWS", "0") == "1"
+
 ADMIN_SITE_HEADER = "Администрирование форм"
 ADMIN_SITE_TITLE = "Forms Admin"
 ADMIN_INDEX_TITLE = "Управление динамическими формами"
@@ -155,4 +209,20 @@ MEDIA_URL = '/media/'
 
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Файлы из ответов: local — папка MEDIA_ROOT; s3 — бакет MinIO/S3 (config.storages.MinIOMediaStorage) с кешем
+# подписанных ссылок и multipart-загрузкой больших файлов. Экспорты хранятся в бакете при любом значении
+FORM_MEDIA_STORAGE = os.getenv("FORM_MEDIA_STORAGE", "local")
+STORAGES = {
+    "default": {
+        "BACKEND": {
+            "local": "django.core.files.storage.FileSystemStorage",
+            "s3": "config.storages.MinIOMediaStorage",
+        }[FORM_MEDIA_STORAGE],
+    },
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+AWS_S3_ENDPOINT_URL = os.getenv("AWS_S3_ENDPOINT_URL")
+AWS_S3_ACCESS_KEY_ID = os.getenv("AWS_S3_ACCESS_KEY_ID")
+AWS_S3_SECRET_ACCESS_KEY = os.getenv("AWS_S3_SECRET_ACCESS_KEY")
+AWS_S3_REGION_NAME = os.getenv("AWS_S3_REGION_NAME")
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
\ No newline at end of file
@@ -1,3 +1,8 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from boto3.s3.transfer import MB, TransferConfig
 from storages.backends.s3boto3 import S3Boto3Storage
 
 class MinIOMediaStorage(S3Boto3Storage):
@@ -5,8 +10,52 @@ class MinIOMediaStorage(S3Boto3Storage):
     location = 'media'
     file_overwrite = False
     custom_domain = False
+    # Файлы больше 8 МБ загружаются multipart-частями в несколько потоков
+    transfer_config = TransferConfig(multipart_threshold=8 * MB, multipart_chunksize=8 * MB, max_concurrency=4)
+    # Подписанная ссылка отдаётся из кеша первую половину своего срока, так что у клиента всегда остаётся запас
+    url_cache_ratio = 0.5
+    url_cache_size = 10000
+
+    def __init__(self, **settings):
+        super().__init__(**settings)
+        self._url_cache = OrderedDict()
+        self._url_lock = Lock()
+
+    def url(self, name, parameters=None, expire=None, http_method=None):
+        if parameters or http_method:
+            return super().url(name, parameters=parameters, expire=expire, http_method=http_method)
+        return self.urls_for([name], expire=expire)[name]
+
+    def urls_for(self, names, expire=None):
+        if expire is None:
+            expire = self.querystring_expire
+        now = time.monotonic()
+        urls = {}
+        missing = []
+        with self._url_lock:
+            for name in names:
+                cached = self._url_cache.get((name, expire))
+                if cached is not None and cached[1] > now:
+                    self._url_cache.move_to_end((name, expire))
+                    urls[name] = cached[0]
+                else:
+                    missing.append(name)
+        if not missing:
+            return urls
+
+        # Без querystring_auth ссылки не истекают, и кешировать их можно без срока
+        expires_at = now + expire * self.url_cache_ratio if self.querystring_auth else float("inf")
+        fresh = {name: super(MinIOMediaStorage, self).url(name, expire=expire) for name in dict.fromkeys(missing)}
+        with self._url_lock:
+            for name, url in fresh.items():
+                self._url_cache[(name, expire)] = (url, expires_at)
+                self._url_cache.move_to_end((name, expire))
+            while len(self._url_cache) > self.url_cache_size:
+                self._url_cache.popitem(last=False)
+        urls.update(fresh)
+        return urls
 
 class StaticStorage(S3Boto3Storage):
     bucket_name = 'local-bucket-form'
     location = "static"
-    default_acl = None
\ No newline at end of file
+    default_acl = None
@@ -1,14 +1,37 @@
+import tempfile
+from itertools import groupby
+from operator import attrgetter
+
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR
 from django.db import models
-from django.http import FileResponse
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.forms.models import BaseInlineFormSet
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
 from django.urls import reverse, path
-from django.utils.html import format_html
+from django.utils.html import format_html, format_html_join
+from django.utils.http import content_disposition_header
 from django.contrib.auth.models import User
 from django_json_widget.widgets import JSONEditorWidget
 from django_admin_relation_links import AdminChangeLinksMixin
 
-from .exporter import FormSubmissionExporter
-from .models import FileValue, FormSubmission, FieldValue, FormField, DynamicForm
+from .exporter import FormTableExporter, get_submission_exporter
+from .jobs import start_export_job
+from .media import attach_file_urls
+from .models import ExportJob, FileValue, FormSubmission, FieldValue, FormField, DynamicForm, SubmissionChangeSet
+from .search import index_submissions, rank_expression, search_filter, search_submissions
+from .services import count_submission, delete_submissions, touch_form_data
+from .stats import submission_choices, update_choice_stats
+
+
+def subquery_count(model, field):
+    # Число связанных строк одним подзапросом в общем SELECT, без COUNT на каждую строку списка
+    related = model.objects.filter(**{field: OuterRef("pk")}).order_by().values(field)
+    return Coalesce(Subquery(related.annotate(total=Count("pk")).values("total")), 0)
 
 
 class FormFieldInline(admin.StackedInline):
@@ -29,7 +52,15 @@ class FormFieldInline(admin.StackedInline):
 
 @admin.register(DynamicForm)
 class DynamicFormAdmin(AdminChangeLinksMixin, admin.ModelAdmin):
-    list_display = ("name", "created_at", "updated_at", "fields_link", "submissions_link")
+    list_display = (
+        "name",
+        "created_at",
+        "updated_at",
+        "fields_link",
+        "submissions_link",
+        "export_jobs_link",
+        "statistics_link",
+    )
     search_fields = ("name",)
     list_filter = ("created_at", "updated_at")
     inlines = [FormFieldInline]
@@ -37,24 +68,57 @@ class DynamicFormAdmin(AdminChangeLinksMixin, admin.ModelAdmin):
     save_on_top = True
     change_links = ["fields_link", "submissions_link"]
 
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request).annotate(fields_total=subquery_count(FormField, "form"))
+        if settings.FORM_ADMIN_USE_COUNTERS:
+            return queryset.annotate(submissions_total=F("submissions_count"))
+        return queryset.annotate(submissions_total=subquery_count(FormSubmission, "form"))
+
     def fields_link(self, obj):
-        count = obj.fields.count()
+        count = obj.fields_total
         url = reverse("admin:form_formfield_changelist") + f"?form__id__exact={obj.id}"
         return format_html('<a href="{}">{} полей</a>', url, count)
 
     fields_link.short_description = "Поля"
+    fields_link.admin_order_field = "fields_total"
 
     def submissions_link(self, obj):
         url = reverse("admin:form_export_submissions", args=[obj.id])
         return format_html(
-            '<a href="{}">📥 Скачать все</a> | <a href="{}?form__id__exact={}">{} отправок</a>',
+            '<a href="{}">📥 Скачать все</a> | Таблица: <a href="{}">XLSX</a> · <a href="{}">CSV</a> · '
+            '<a href="{}">JSONL</a> | <a href="{}?form__id__exact={}">{} отправок</a>',
             url,
+            reverse("admin:form_export_table", args=[obj.id, "xlsx"]),
+            reverse("admin:form_export_table", args=[obj.id, "csv"]),
+            reverse("admin:form_export_table", args=[obj.id, "jsonl"]),
             reverse("admin:form_formsubmission_changelist"),
             obj.id,
-            obj.submissions.count(),
+            obj.submissions_total,
         )
 
     submissions_link.short_description = "Отправки"
+    submissions_link.admin_order_field = "submissions_total"
+
+    def export_jobs_link(self, obj):
+        return format_html(
+            '<a href="{}">ZIP</a> · <a href="{}">XLSX</a> · <a href="{}">CSV</a> · <a href="{}">JSONL</a>',
+            *(reverse("admin:form_start_export_job", args=[obj.id, fmt]) for fmt, _ in ExportJob.FORMATS),
+        )
+
+    export_jobs_link.short_description = "Фоновый экспорт"
+
+    def statistics_link(self, obj):
+        return format_html('<a href="{}">📊 Ответы</a>', reverse("admin:form_statistics", args=[obj.id]))
+
+    statistics_link.short_description = "Статистика"
+
+    def save_model(self, request, obj, form, change):
+        # Счётчик отправок и версии меняются UPDATE-ами в обход админки: полный save() вернул бы значения,
+        # прочитанные при открытии страницы
+        if change:
+            obj.save(update_fields=[*form.changed_data, "updated_at"])
+        else:
+            super().save_model(request, obj, form, change)
 
     def get_urls(self):
         urls = super().get_urls()
@@ -64,15 +128,144 @@ class DynamicFormAdmin(AdminChangeLinksMixin, admin.ModelAdmin):
                 self.admin_site.admin_view(self.export_submissions),
                 name="form_export_submissions",
             ),
+            path(
+                "<int:form_id>/export-table/<str:export_format>/",
+                self.admin_site.admin_view(self.export_table),
+                name="form_export_table",
+            ),
+            path(
+                "<int:form_id>/export-job/<str:export_format>/",
+                self.admin_site.admin_view(self.start_export_job),
+                name="form_start_export_job",
+            ),
+            path(
+                "<int:form_id>/statistics/",
+                self.admin_site.admin_view(self.statistics_view),
+                name="form_statistics",
+            ),
         ]
         return custom_urls + urls
 
     def export_submissions(self, request, form_id):
         form = self.get_object(request, form_id)
-        submissions = form.submissions.all()
-        exporter = FormSubmissionExporter()
-        zip_file = exporter.export_submissions_to_zip(submissions)
-        return FileResponse(zip_file, as_attachment=True, filename=f"{form.name}_submissions.zip")
+        submissions = form.submissions.order_by("id")
+        exporter = get_submission_exporter(form.submissions_count)
+        response = StreamingHttpResponse(exporter.iter_submissions_zip(submissions), content_type="application/zip")
+        response["Content-Disposition"] = content_disposition_header(True, f"{form.name}_submissions.zip")
+        return response
+
+    def export_table(self, request, form_id, export_format):
+        form = self.get_object(request, form_id)
+        if form is None or export_format not in FormTableExporter.formats:
+            raise Http404
+        exporter = FormTableExporter(form)
+        filename = f"{form.name}_submissions.{export_format}"
+
+        if export_format == "xlsx":
+            # Книга собирается во временный файл, а не в память воркера
+            buffer = tempfile.TemporaryFile()
+            exporter.write_xlsx(buffer)
+            buffer.seek(0)
+            return FileResponse(buffer, as_attachment=True, filename=filename)
+
+        if export_format == "csv":
+            response = StreamingHttpResponse(exporter.iter_csv(), content_type="text/csv; charset=utf-8")
+        else:
+            response = StreamingHttpResponse(exporter.iter_jsonl(), content_type="application/x-ndjson; charset=utf-8")
+        response["Content-Disposition"] = content_disposition_header(True, filename)
+        return response
+
+    def start_export_job(self, request, form_id, export_format):
+        form = self.get_object(request, form_id)
+        if form is None or export_format not in dict(ExportJob.FORMATS):
+            raise Http404
+        job = start_export_job(form, export_format, user=request.user)
+        return redirect("admin:form_exportjob_change", job.pk)
+
+    def statistics_view(self, request, form_id):
+        form = self.get_object(request, form_id)
+        if form is None:
+            raise Http404
+        # Страница читает только готовые счётчики, ответы не перебираются
+        stats = form.choice_stats.filter(count__gt=0).select_related("field")
+        stats = stats.order_by("field__order", "field_id", "-count")
+        fields = []
+        for field, rows in groupby(stats, key=attrgetter("field")):
+            rows = list(rows)
+            total = sum(row.count for row in rows)
+            for row in rows:
+                row.percent = round(row.count * 100 / total, 1)
+            fields.append({"field": field, "rows": rows, "total": total})
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "original": form,
+            "title": f"Статистика ответов: {form.name}",
+            "fields": fields,
+        }
+        return TemplateResponse(request, "admin/form/dynamicform/statistics.html", context)
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "form",
+        "export_format",
+        "status",
+        "progress_display",
+        "rows_display",
+        "duration_display",
+        "created_at",
+        "download_link",
+    )
+    list_filter = ("status", "export_format", "created_at")
+    list_select_related = ("form",)
+    readonly_fields = (
+        "form",
+        "export_format",
+        "status",
+        "progress_display",
+        "rows_display",
+        "duration_display",
+        "requested_by",
+        "created_at",
+        "started_at",
+        "finished_at",
+        "download_link",
+        "error",
+    )
+    fields = readonly_fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def progress_display(self, obj):
+        return f"{obj.progress}%"
+
+    progress_display.short_description = "Прогресс"
+
+    def rows_display(self, obj):
+        return f"{obj.processed_rows} из {obj.total_rows}"
+
+    rows_display.short_description = "Отправки"
+
+    def duration_display(self, obj):
+        duration = obj.duration
+        return f"{duration.total_seconds():.1f} с" if duration is not None else "—"
+
+    duration_display.short_description = "Длительность"
+
+    def download_link(self, obj):
+        if obj.status != "done" or not obj.file:
+            return "—"
+        return format_html('<a href="{}">📥 Скачать</a>', obj.file.url)
+
+    download_link.short_description = "Результат"
 
 
 @admin.register(FormField)
@@ -99,12 +292,27 @@ class FormFieldAdmin(AdminChangeLinksMixin, admin.ModelAdmin):
     form_link.short_description = "Форма"
 
 
+class FieldValueFormSet(BaseInlineFormSet):
+    def get_queryset(self):
+        evaluated = hasattr(self, "_queryset")
+        queryset = super().get_queryset()
+        if not evaluated:
+            # Ссылки на файлы всех строк подписываются одним обращением к хранилищу, а не на каждой строке
+            attach_file_urls(file_value for field_value in queryset for file_value in field_value.files)
+        return queryset
+
+
 class FieldValueInline(admin.TabularInline):
     model = FieldValue
+    formset = FieldValueFormSet
     extra = 0
     readonly_fields = ("field_preview", "files_preview")
-    fields = ("field_preview", "text_value", "choice_value")
-    autocomplete_fields = ("field",)
+    fields = ("field_preview", "text_value", "choice_value", "files_preview")
+
+    def get_queryset(self, request):
+        # Поле, отправка (для str() строки) и файлы грузятся заранее, а не отдельным запросом на каждую строку
+        queryset = super().get_queryset(request).select_related("field", "submission__form")
+        return queryset.prefetch_related("file_values")
 
     def field_preview(self, obj):
         return f"{obj.field.label} ({obj.field.get_field_type_display()})"
@@ -112,21 +320,78 @@ class FieldValueInline(admin.TabularInline):
     field_preview.short_description = "Поле"
 
     def files_preview(self, obj):
-        return format_html("<br>".join(f'<a href="{fv.file.url}">{fv.file.name}</a>' for fv in obj.files.all()))
+        links = [(file_value.file_url, file_value.file.name) for file_value in obj.files if file_value.file]
+        return format_html_join(format_html("<br>"), '<a href="{}">{}</a>', links)
 
     files_preview.short_description = "Файлы"
 
 
+class SubmissionChangeSetInline(admin.TabularInline):
+    model = SubmissionChangeSet
+    extra = 0
+    can_delete = False
+    fields = ("changed_at", "changed_by", "changes_preview")
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("changed_by")
+
+    def changes_preview(self, obj):
+        return format_html_join(
+            format_html("<br>"), "{}: {} → {}", ((change["field"], change["old"], change["new"]) for change in obj.changes)
+        )
+
+    changes_preview.short_description = "Изменения"
+
+
 @admin.register(FormSubmission)
 class FormSubmissionAdmin(admin.ModelAdmin):
     list_display = ("id", "form_link", "user_link", "submitted_at", "session_preview")
     list_filter = ("form", "submitted_at", ("user", admin.RelatedOnlyFieldListFilter))
     search_fields = ("user__username", "session_key", "form__name")
     readonly_fields = ("submitted_at", "session_key")
-    inlines = (FieldValueInline,)
+    inlines = (FieldValueInline, SubmissionChangeSetInline)
     date_hierarchy = "submitted_at"
     list_select_related = ("form", "user")
 
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if not search_term:
+            return results, may_have_duplicates
+        # К обычному поиску добавляются все совпадения по ответам из полнотекстового индекса;
+        # по релевантности упорядочиваются первые SEARCH_LIMIT из них, остальные идут следом
+        ids = search_submissions(search_term)
+        results = (results | queryset.filter(search_filter(search_term))).annotate(search_rank=rank_expression(ids))
+        if ORDER_VAR not in request.GET:
+            # Без явной сортировки сначала идут самые релевантные отправки
+            results = results.order_by("search_rank", "-pk")
+        return results, may_have_duplicates
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # Счётчики отправок по форме и пользователю ведутся так же, как при отправке с сайта
+        if not change:
+            count_submission(obj.form_id, obj.user_id, 1)
+        elif "form" in form.changed_data or "user" in form.changed_data:
+            count_submission(form.initial["form"], form.initial["user"], -1)
+            count_submission(obj.form_id, obj.user_id, 1)
+
+    def delete_model(self, request, obj):
+        delete_submissions(FormSubmission.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        delete_submissions(queryset)
+
+    def save_related(self, request, form, formsets, change):
+        choices_before = list(submission_choices([form.instance.pk]))
+        super().save_related(request, form, formsets, change)
+        update_choice_stats(form.instance.form_id, choices_before, submission_choices([form.instance.pk]))
+        index_submissions([form.instance.pk])
+        touch_form_data(form.instance.form_id)
+
     def form_link(self, obj):
         url = reverse("admin:form_dynamicform_change", args=[obj.form.id])
         return format_html('<a href="{}">{}</a>', url, obj.form.name)
@@ -151,7 +416,7 @@ class FileValueAdmin(admin.ModelAdmin):
     list_display = ("id", "file_name", "submission_link", "is_image", "uploaded_at")
     list_filter = ("is_image", "uploaded_at")
     search_fields = ("file", "field_value__submission__id")
-    readonly_fields = ("file_preview", "uploaded_at")
+    readonly_fields = ("file_preview", "thumbnail", "uploaded_at")
     date_hierarchy = "uploaded_at"
 
     def file_name(self, obj):
@@ -165,12 +430,30 @@ class FileValueAdmin(admin.ModelAdmin):
 
     def file_preview(self, obj):
         if obj.is_image:
-            return format_html('<img src="{}" style="max-height: 200px;" />', obj.file.url)
-        return format_html('<a href="{}">Скачать файл</a>', obj.file.url)
+            return format_html(
+                '<a href="{}"><img src="{}" style="max-height: 200px;" /></a>', obj.file_url, obj.preview_url
+            )
+        return format_html('<a href="{}">Скачать файл</a>', obj.file_url)
 
     file_preview.allow_tags = True
     file_preview.short_description = "Превью"
 
+    # Файлы входят в выгрузку, поэтому их правка меняет версию ответов формы, как и правка самих ответов
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        touch_form_data(obj.field_value.submission.form_id)
+
+    def delete_model(self, request, obj):
+        form_id = obj.field_value.submission.form_id
+        super().delete_model(request, obj)
+        touch_form_data(form_id)
+
+    def delete_queryset(self, request, queryset):
+        form_ids = set(queryset.values_list("field_value__submission__form_id", flat=True))
+        super().delete_queryset(request, queryset)
+        for form_id in form_ids:
+            touch_form_data(form_id)
+
 
 admin.site.register(FileValue, FileValueAdmin)
 
@@ -180,10 +463,17 @@ class CustomUserAdmin(admin.ModelAdmin):
     search_fields = ("username", "email")
     list_filter = ("is_staff", "is_superuser", "is_active")
 
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if settings.FORM_ADMIN_USE_COUNTERS:
+            return queryset.annotate(submissions_total=Coalesce("submission_counter__count", 0))
+        return queryset.annotate(submissions_total=subquery_count(FormSubmission, "user"))
+
     def submissions_count(self, obj):
-        return obj.formsubmission_set.count()
+        return obj.submissions_total
 
     submissions_count.short_description = "Отправок форм"
+    submissions_count.admin_order_field = "submissions_total"
 
 
 admin.site.unregister(User)
@@ -0,0 +1,39 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from .forms import get_form_class
+from .models import DynamicForm
+
+FORM_FIELDS_TEMPLATE = "forms/_form_fields.html"
+
+
+def get_page_form(request, pk):
+    # ETag и сама страница используют одну и ту же загруженную форму
+    if not hasattr(request, "_page_form"):
+        request._page_form = DynamicForm.objects.filter(pk=pk).first()
+    return request._page_form
+
+
+def form_page_etag(request, pk):
+    dynamic_form = get_page_form(request, pk)
+    if dynamic_form is None:
+        return None
+    # В разметке есть имя пользователя и CSRF-токен, поэтому они тоже входят в ETag
+    user_id = request.user.pk if request.user.is_authenticated else ""
+    csrf_cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME, "")
+    version = f"{dynamic_form.pk}:{dynamic_form.schema_version}:{dynamic_form.updated_at.isoformat()}"
+    raw = f"{version}:{user_id}:{csrf_cookie}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def get_form_fields_html(dynamic_form):
+    key = f"form-fields:{dynamic_form.pk}:{dynamic_form.schema_version}"
+    html = cache.get(key)
+    if html is None:
+        form = get_form_class(dynamic_form)()
+        html = render_to_string(FORM_FIELDS_TEMPLATE, {"form": form})
+        cache.set(key, html, getattr(settings, "FORM_FRAGMENT_CACHE_TIMEOUT", 3600))
+    return html
@@ -1,56 +1,215 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
+from itertools import chain, islice
+import csv
+import json
+import multiprocessing
+import os
 import zipfile
+from django.conf import settings
+from django.utils import timezone
 from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, Border, Side
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
 from openpyxl.utils import get_column_letter
 
+from .loaders import CHUNK_SIZE, SubmissionBatchLoader, iter_batches
+from .workbooks import render_submission_workbook, render_submission_workbooks
 
-class FormSubmissionExporter:
-    def export_submission_to_excel(self, submission):
-        wb = Workbook()
-        ws = wb.active
-        ws.title = f"Submission {submission.id}"
 
-        header_font = Font(bold=True)
-        center_alignment = Alignment(horizontal="center", vertical="center")
-        thin_border = Border(
-            left=Side(style="thin"),
-            right=Side(style="thin"),
-            top=Side(style="thin"),
-            bottom=Side(style="thin"),
-        )
+class ZipStream:
+    def __init__(self):
+        self._chunks = []
 
-        ws.append(["Поле", "Значение"])
-        for cell in ws[1]:
-            cell.font = header_font
-            cell.alignment = center_alignment
-            cell.border = thin_border
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
 
-        for i, fv in enumerate(submission.values.select_related("field"), start=2):
-            field_label = fv.field.label
-            value = fv.text_value or fv.choice_value or ""
-            ws.append([field_label, value])
-            ws[f"A{i}"].border = thin_border
-            ws[f"B{i}"].border = thin_border
+    def flush(self):
+        pass
 
-        for col in range(1, 3):
-            column_letter = get_column_letter(col)
-            max_length = max(len(str(ws[f"{column_letter}{row}"].value or "")) for row in range(1, ws.max_row + 1))
-            ws.column_dimensions[column_letter].width = min(max_length + 2, 40)
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
 
-        ws["A1"].alignment = center_alignment
-        ws["B1"].alignment = center_alignment
 
-        buffer = BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
-        return buffer
+def serialize_submission(submission, field_values=None):
+    if field_values is None:
+        field_values = submission.values.select_related("field")
+    rows = []
+    for fv in field_values:
+        value = fv.text_value or fv.choice_value or ""
+        if isinstance(value, list):
+            value = ", ".join(str(item) for item in value)
+        rows.append((fv.field.label, value))
+    return {"id": submission.id, "rows": rows}
+
+
+class ProgressMixin:
+    progress_callback = None
+
+    def report_progress(self, count=1):
+        if self.progress_callback is not None:
+            self.progress_callback(count)
+
+
+class FormSubmissionExporter(ProgressMixin):
+    def export_submission_to_excel(self, submission):
+        _, data = render_submission_workbook(serialize_submission(submission))
+        return BytesIO(data)
 
     def export_submissions_to_zip(self, submissions):
         buffer = BytesIO()
         with zipfile.ZipFile(buffer, "w") as archive:
-            for sub in submissions:
-                excel = self.export_submission_to_excel(sub)
-                archive.writestr(f"submission_{sub.id}.xlsx", excel.getvalue())
+            for name, data in self.iter_workbooks(submissions):
+                archive.writestr(name, data)
         buffer.seek(0)
-        return buffer
\ No newline at end of file
+        return buffer
+
+    def iter_workbooks(self, submissions, chunk_size=CHUNK_SIZE):
+        for sub, field_values in SubmissionBatchLoader(submissions, chunk_size):
+            yield render_submission_workbook(serialize_submission(sub, field_values))
+
+    def iter_submissions_zip(self, submissions, chunk_size=CHUNK_SIZE):
+        # ZipFile умеет писать в поток без seek, поэтому архив отдаётся клиенту по мере сборки
+        stream = ZipStream()
+        with zipfile.ZipFile(stream, "w") as archive:
+            for name, data in self.iter_workbooks(submissions, chunk_size):
+                archive.writestr(name, data)
+                self.report_progress()
+                yield stream.drain()
+        yield stream.drain()
+
+
+class ParallelSubmissionExporter(FormSubmissionExporter):
+    def __init__(self, workers=None, batch_size=20):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+
+    def iter_workbooks(self, submissions, chunk_size=CHUNK_SIZE):
+        payloads = (
+            serialize_submission(sub, field_values)
+            for sub, field_values in SubmissionBatchLoader(submissions, chunk_size)
+        )
+        yield from self.render(payloads)
+
+    def render(self, payloads):
+        # Воркерам уходят только простые данные, ORM-объекты в процессы не передаются.
+        # spawn вместо fork: форк многопоточного веб-воркера может зависнуть на чужих блокировках
+        pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        pending = deque()
+        try:
+            for batch in iter_batches(payloads, self.batch_size):
+                pending.append(pool.submit(render_submission_workbooks, batch))
+                # Не больше двух пачек на воркер в очереди — память ограничена, порядок сохраняется
+                if len(pending) >= self.workers * 2:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+
+def get_submission_exporter(total_rows=0):
+    workers = settings.FORM_EXPORT_WORKERS
+    # Запуск пула окупается только на больших выгрузках, небольшие собираются в текущем процессе
+    if workers > 1 and total_rows >= settings.FORM_EXPORT_PARALLEL_MIN_ROWS:
+        return ParallelSubmissionExporter(workers=workers)
+    return FormSubmissionExporter()
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+class FormTableExporter(ProgressMixin):
+    formats = ("xlsx", "csv", "jsonl")
+
+    def __init__(self, dynamic_form):
+        self.dynamic_form = dynamic_form
+        self.fields = list(dynamic_form.fields.all())
+
+    def get_header(self):
+        return ["ID", "Дата отправки", "Пользователь", *(field.label for field in self.fields)]
+
+    def iter_records(self, chunk_size=CHUNK_SIZE):
+        submissions = self.dynamic_form.submissions.select_related("user").order_by("id")
+        for submission, field_values in SubmissionBatchLoader(submissions, chunk_size):
+            values = {fv.field_id: fv for fv in field_values}
+            answers = [self.get_answer(values.get(field.pk)) for field in self.fields]
+            self.report_progress()
+            yield submission, answers
+
+    def get_answer(self, field_value):
+        if field_value is None:
+            return None
+        if field_value.text_value is not None:
+            return field_value.text_value
+        if field_value.choice_value:
+            return field_value.choice_value
+        files = [fv.file.name for fv in field_value.file_values.all()]
+        return files or None
+
+    def get_author(self, submission):
+        return submission.user.username if submission.user else submission.session_key
+
+    def format_answer(self, answer):
+        if answer is None:
+            return ""
+        if isinstance(answer, list):
+            return ", ".join(str(item) for item in answer)
+        return str(answer)
+
+    def iter_rows(self, chunk_size=CHUNK_SIZE):
+        for submission, answers in self.iter_records(chunk_size):
+            submitted_at = timezone.localtime(submission.submitted_at).replace(tzinfo=None)
+            yield [submission.id, submitted_at, self.get_author(submission), *map(self.format_answer, answers)]
+
+    def write_xlsx(self, fileobj, chunk_size=CHUNK_SIZE):
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Ответы")
+        header = self.get_header()
+        widths = [len(title) for title in header]
+
+        # В write-only режиме ширины колонок задаются до первой строки,
+        # поэтому они считаются на лету по заголовку и первой порции строк
+        rows = self.iter_rows(chunk_size)
+        head = list(islice(rows, chunk_size))
+        for row in head:
+            for i, value in enumerate(row):
+                widths[i] = max(widths[i], len(str(value)))
+        for col, width in enumerate(widths, start=1):
+            ws.column_dimensions[get_column_letter(col)].width = min(width + 2, 40)
+
+        header_font = Font(bold=True)
+        header_cells = []
+        for title in header:
+            cell = WriteOnlyCell(ws, value=title)
+            cell.font = header_font
+            header_cells.append(cell)
+        ws.append(header_cells)
+        for row in chain(head, rows):
+            ws.append(row)
+
+        wb.save(fileobj)
+        return fileobj
+
+    def iter_csv(self, chunk_size=CHUNK_SIZE):
+        writer = csv.writer(Echo())
+        # BOM, чтобы Excel открывал кириллицу без перекодировки
+        yield "\ufeff" + writer.writerow(self.get_header())
+        for row in self.iter_rows(chunk_size):
+            yield writer.writerow(row)
+
+    def iter_jsonl(self, chunk_size=CHUNK_SIZE):
+        for submission, answers in self.iter_records(chunk_size):
+            record = {
+                "id": submission.id,
+                "submitted_at": submission.submitted_at.isoformat(),
+                "user": self.get_author(submission),
+                "answers": {field.label: answer for field, answer in zip(self.fields, answers)},
+            }
+            yield json.dumps(record, ensure_ascii=False) + "\n"
@@ -0,0 +1,96 @@
+from collections import OrderedDict, namedtuple
+from threading import Lock
+
+from django.conf import settings
+from django.forms import Form, CharField, ChoiceField, MultipleChoiceField, FileField, Textarea
+from django.forms import CheckboxSelectMultiple, Select
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+def build_form_fields(form_fields):
+    fields = {}
+    for field in form_fields:
+        if field.is_hidden:
+            continue
+
+        field_kwargs = {
+            "label": field.label,
+            "required": field.required,
+        }
+
+        if field.is_locked:
+            field_kwargs["disabled"] = True
+
+        if field.field_type == "text":
+            fields[field.label] = CharField(**field_kwargs)
+        elif field.field_type == "textarea":
+            field_kwargs["widget"] = Textarea
+            fields[field.label] = CharField(**field_kwargs)
+        elif field.field_type == "select":
+            field_kwargs["widget"] = Select
+            field_kwargs["choices"] = [(c, c) for c in field.choices or []]
+            fields[field.label] = ChoiceField(**field_kwargs)
+        elif field.field_type == "checkbox":
+            field_kwargs["widget"] = CheckboxSelectMultiple
+            field_kwargs["choices"] = [(c, c) for c in field.choices or []]
+            fields[field.label] = MultipleChoiceField(**field_kwargs)
+        elif field.field_type in ["file", "image"]:
+            field_kwargs.pop("required", None)
+            fields[field.label] = FileField(required=False, **field_kwargs)
+
+    return fields
+
+
+def build_form_class(form_fields):
+    form_fields = tuple(form_fields)
+    attrs = build_form_fields(form_fields)
+    # Поля модели сохраняются на классе, чтобы запись ответов не делала повторный запрос
+    attrs["form_fields"] = form_fields
+    return type("DynamicForm", (Form,), attrs)
+
+
+class FormClassCache:
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._classes = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, dynamic_form):
+        key = (dynamic_form.pk, dynamic_form.schema_version)
+        with self._lock:
+            form_class = self._classes.get(key)
+            if form_class is not None:
+                self._classes.move_to_end(key)
+                self.hits += 1
+                return form_class
+            self.misses += 1
+
+        form_class = build_form_class(dynamic_form.fields.all())
+
+        with self._lock:
+            for stale_key in [k for k in self._classes if k[0] == dynamic_form.pk and k != key]:
+                del self._classes[stale_key]
+            self._classes[key] = form_class
+            while len(self._classes) > self.maxsize:
+                self._classes.popitem(last=False)
+        return form_class
+
+    def cache_info(self):
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self._classes))
+
+    def clear(self):
+        with self._lock:
+            self._classes.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+form_class_cache = FormClassCache(maxsize=getattr(settings, "FORM_CLASS_CACHE_SIZE", 128))
+
+
+def get_form_class(dynamic_form):
+    return form_class_cache.get(dynamic_form)
@@ -0,0 +1,302 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict, namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from simple_history.utils import bulk_create_with_history
+
+from .models import FieldValue, FileValue, FormField, FormSubmission
+from .search import index_submissions
+from .services import SubmissionDraft, count_submission
+from .stats import choice_snapshot, update_choice_stats
+from .thumbnails import schedule_thumbnails
+from .transfers import UploadError, claim_uploads, delete_files, direct_names, stored_files
+
+logger = logging.getLogger(__name__)
+
+QueueEntry = namedtuple("QueueEntry", ["id", "token", "payload"])
+
+# Ошибка с этим префиксом — окончательный отказ: такие записи не повторяются и не считаются ожидающими
+REJECTED = "rejected: "
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+class DuplicateSubmission(Exception):
+    pass
+
+
+class IngestQueue:
+    # Журнал принятых, но ещё не записанных отправок. Отдельный файл SQLite: приём не ждёт блокировку основной базы,
+    # а запись удаляется из журнала только после коммита отправки в основную базу
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Отправка подтверждается пользователю только после fsync журнала
+            connection.execute("PRAGMA synchronous=FULL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, token TEXT NOT NULL UNIQUE, payload TEXT NOT NULL, "
+                "created_at REAL NOT NULL, error TEXT)"
+            )
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE сразу берёт блокировку записи: между проверкой и вставкой не вклинится другой приём
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    def has_pending(self, payload):
+        if payload["user"] is not None:
+            condition, params = "json_extract(payload, '$.user') = ?", [payload["user"]]
+        else:
+            condition = (
+                "json_extract(payload, '$.user') IS NULL AND json_extract(payload, '$.session_key') = ? "
+                "AND json_extract(payload, '$.form') = ?"
+            )
+            params = [payload["session_key"], payload["form"]]
+        row = self.connection.execute(
+            f"SELECT 1 FROM entries WHERE (error IS NULL OR error NOT LIKE ?) AND {condition} LIMIT 1",
+            [REJECTED + "%", *params],
+        ).fetchone()
+        return row is not None
+
+    def append(self, payload):
+        token = uuid.uuid4().hex
+        self.connection.execute(
+            "INSERT INTO entries (token, payload, created_at) VALUES (?, ?, ?)",
+            (token, json.dumps(payload, ensure_ascii=False), time.time()),
+        )
+        return token
+
+    def peek(self, limit):
+        rows = self.connection.execute(
+            "SELECT id, token, payload FROM entries WHERE error IS NULL ORDER BY id LIMIT ?", (limit,)
+        )
+        return [QueueEntry(entry_id, token, json.loads(payload)) for entry_id, token, payload in rows]
+
+    def pop(self, tokens):
+        # Забирает записи из журнала до выгрузки, например отправки бенчмарка
+        tokens = list(tokens)
+        placeholders = ", ".join(["?"] * len(tokens))
+        with self.transaction():
+            rows = self.connection.execute(
+                f"SELECT id, token, payload FROM entries WHERE token IN ({placeholders})", tokens
+            ).fetchall()
+            self.connection.execute(f"DELETE FROM entries WHERE token IN ({placeholders})", tokens)
+        return [QueueEntry(entry_id, token, json.loads(payload)) for entry_id, token, payload in rows]
+
+    def remove(self, entry_ids):
+        self.connection.executemany("DELETE FROM entries WHERE id = ?", [(entry_id,) for entry_id in entry_ids])
+
+    def mark_failed(self, entry_id, error):
+        self.connection.execute("UPDATE entries SET error = ? WHERE id = ?", (error, entry_id))
+
+    def mark_rejected(self, entry_id, reason):
+        self.mark_failed(entry_id, REJECTED + reason)
+
+    def retry_failed(self):
+        return self.connection.execute(
+            "UPDATE entries SET error = NULL WHERE error IS NOT NULL AND error NOT LIKE ?", (REJECTED + "%",)
+        ).rowcount
+
+    def status(self, token):
+        row = self.connection.execute("SELECT error FROM entries WHERE token = ?", (token,)).fetchone()
+        if row is None:
+            return None
+        if row[0] is None:
+            return "pending"
+        return "rejected" if row[0].startswith(REJECTED) else "failed"
+
+    def direct_names(self):
+        rows = self.connection.execute("SELECT value FROM entries, json_each(entries.payload, '$.direct')")
+        return {name for name, in rows}
+
+    def counts(self):
+        pending, failed = self.connection.execute(
+            "SELECT COUNT(*) - COUNT(error), COUNT(error) FROM entries"
+        ).fetchone()
+        return pending, failed
+
+
+def get_queue():
+    global _queue
+    with _queue_lock:
+        if _queue is None or _queue.path != str(settings.FORM_INGEST_QUEUE):
+            _queue = IngestQueue(settings.FORM_INGEST_QUEUE)
+    return _queue
+
+
+def submission_payload(draft, names, user=None, session_key=""):
+    return {
+        "form": draft.dynamic_form.pk,
+        "user": user.pk if user else None,
+        "session_key": "" if user else session_key,
+        "submitted_at": timezone.now().isoformat(),
+        "values": [
+            [field_value.field_id, field_value.text_value, field_value.choice_value]
+            for field_value in draft.field_values
+        ],
+        "files": [
+            [field_value.field_id, name, is_image] for (field_value, _, is_image), name in zip(draft.uploads, names)
+        ],
+        "direct": direct_names(draft.files),
+    }
+
+
+def is_submitted(payload, token=None):
+    # Как unique_together (user, session_key): у пользователя одна отправка. Для анонимной сессии ограничение в базе
+    # не срабатывает (user NULL), поэтому повтором считается та же форма из той же сессии — двойной клик
+    if payload["user"] is not None:
+        submissions = FormSubmission.objects.filter(user_id=payload["user"], session_key=payload["session_key"])
+    else:
+        submissions = FormSubmission.objects.filter(
+            user=None, session_key=payload["session_key"], form_id=payload["form"]
+        )
+    if token is not None:
+        submissions = submissions.exclude(ingest_token=token)
+    return submissions.exists()
+
+
+def enqueue_submission(dynamic_form, form, files, user=None, session_key=""):
+    # Файлы уже в хранилище к моменту подтверждения, в журнал попадают только их имена
+    draft = SubmissionDraft(dynamic_form, form, files)
+    with stored_files(draft.files) as names:
+        payload = submission_payload(draft, names, user, session_key)
+        queue = get_queue()
+        # Сначала журнал, потом база: запись уходит из журнала только после коммита отправки в базу
+        with queue.transaction():
+            if queue.has_pending(payload) or is_submitted(payload):
+                raise DuplicateSubmission("Вы уже отправили эту форму")
+            return queue.append(payload)
+
+
+def write_entries(entries):
+    with transaction.atomic():
+        written = set(
+            FormSubmission.objects.filter(ingest_token__in=[entry.token for entry in entries]).values_list(
+                "ingest_token", flat=True
+            )
+        )
+        # Записи, закоммиченные до сбоя воркера, но не удалённые из журнала, повторно не пишутся
+        entries = [entry for entry in entries if entry.token not in written]
+        if not entries:
+            return
+
+        claim_uploads(name for entry in entries for name in entry.payload.get("direct", []))
+        submissions = bulk_create_with_history(
+            [
+                FormSubmission(
+                    form_id=entry.payload["form"],
+                    user_id=entry.payload["user"],
+                    session_key=entry.payload["session_key"],
+                    ingest_token=entry.token,
+                )
+                for entry in entries
+            ],
+            FormSubmission,
+        )
+        # auto_now_add ставит время выгрузки, а отправка принята раньше
+        for submission, entry in zip(submissions, entries):
+            submission.submitted_at = datetime.fromisoformat(entry.payload["submitted_at"])
+        FormSubmission.objects.bulk_update(submissions, ["submitted_at"])
+
+        # Ответы на поля, удалённые после приёма, отбрасываются — как при каскадном удалении поля
+        field_ids = set(
+            FormField.objects.filter(
+                pk__in={field_id for entry in entries for field_id, *_ in entry.payload["values"]}
+            ).values_list("pk", flat=True)
+        )
+        field_values = []
+        file_values = []
+        for submission, entry in zip(submissions, entries):
+            values = {}
+            for field_id, text_value, choice_value in entry.payload["values"]:
+                if field_id in field_ids:
+                    values[field_id] = FieldValue(
+                        submission=submission, field_id=field_id, text_value=text_value, choice_value=choice_value
+                    )
+            for field_id, name, is_image in entry.payload["files"]:
+                if field_id in values:
+                    file_values.append(FileValue(field_value=values[field_id], file=name, is_image=is_image))
+            field_values.extend(values.values())
+        FieldValue.objects.bulk_create(field_values, batch_size=500)
+        file_values = FileValue.objects.bulk_create(file_values, batch_size=500)
+
+        schedule_thumbnails(file_value.pk for file_value in file_values if file_value.is_image)
+        form_values = defaultdict(list)
+        for field_value in field_values:
+            form_values[field_value.submission.form_id].append(field_value)
+        for form_id, values in form_values.items():
+            update_choice_stats(form_id, [], choice_snapshot(values))
+        index_submissions([submission.pk for submission in submissions])
+        for (form_id, user_id), count in Counter((sub.form_id, sub.user_id) for sub in submissions).items():
+            count_submission(form_id, user_id, count)
+
+
+def proxied_files(entry):
+    # Напрямую загруженные объекты могут принадлежать другой отправке; ничьи из них удалит cleanup_uploads
+    direct = set(entry.payload.get("direct", []))
+    return [name for _, name, _ in entry.payload["files"] if name not in direct]
+
+
+def drain_queue(batch_size=None):
+    queue = get_queue()
+    entries = queue.peek(batch_size or settings.FORM_INGEST_BATCH_SIZE)
+    if not entries:
+        return 0, 0
+
+    failed = 0
+    try:
+        write_entries(entries)
+    except Exception:
+        # Пачка не записалась — пишем по одной, чтобы одна плохая запись не держала остальные
+        logger.warning("Не удалось записать пачку из очереди приёма, повтор по одной", exc_info=True)
+        written = []
+        for entry in entries:
+            if is_submitted(entry.payload, entry.token):
+                # Повтор уже записанной отправки не запишется и после retry_failed — это окончательный отказ
+                logger.warning("Отправка %s из очереди приёма повторяет уже записанную", entry.token)
+                queue.mark_rejected(entry.id, "повторная отправка")
+                delete_files(proxied_files(entry))
+                failed += 1
+                continue
+            try:
+                write_entries([entry])
+            except UploadError as exc:
+                logger.warning("Отправка %s из очереди приёма: %s", entry.token, exc)
+                queue.mark_rejected(entry.id, str(exc))
+                delete_files(proxied_files(entry))
+                failed += 1
+            except Exception as exc:
+                logger.exception("Не удалось записать отправку %s из очереди приёма", entry.token)
+                queue.mark_failed(entry.id, repr(exc))
+                failed += 1
+            else:
+                written.append(entry)
+        entries = written
+    queue.remove([entry.id for entry in entries])
+    return len(entries), failed
@@ -0,0 +1,124 @@
+import logging
+import tempfile
+import time
+import traceback
+from datetime import timedelta
+
+from django.core.files import File
+from django.utils import timezone
+
+from .exporter import FormTableExporter, get_submission_exporter
+from .models import ExportJob
+
+logger = logging.getLogger(__name__)
+
+# Задача, которая выполняется дольше, считается брошенной упавшим воркером
+STALE_AFTER = timedelta(hours=1)
+
+
+def export_fingerprint(form):
+    return f"{form.schema_version}-{form.data_version}"
+
+
+def expire_stale_jobs():
+    # Иначе задача упавшего воркера навсегда осталась бы в статусе «running» и подходила бы по отпечатку
+    now = timezone.now()
+    return ExportJob.objects.filter(status="running", started_at__lt=now - STALE_AFTER).update(
+        status="failed", finished_at=now, error="Задача не завершилась вовремя: воркер, вероятно, был остановлен"
+    )
+
+
+def start_export_job(form, export_format, user=None):
+    expire_stale_jobs()
+    fingerprint = export_fingerprint(form)
+    # Если форма и ответы не менялись, отдаём последний результат вместо новой выгрузки
+    job = (
+        ExportJob.objects.filter(
+            form=form, export_format=export_format, fingerprint=fingerprint, status__in=("pending", "running", "done")
+        )
+        .order_by("-created_at")
+        .first()
+    )
+    if job is None:
+        job = ExportJob.objects.create(
+            form=form, export_format=export_format, fingerprint=fingerprint, requested_by=user
+        )
+    return job
+
+
+def claim_next_job():
+    expire_stale_jobs()
+    while True:
+        job = ExportJob.objects.filter(status="pending").order_by("created_at").first()
+        if job is None:
+            return None
+        # Условный UPDATE: из нескольких воркеров задачу получит только один
+        claimed = ExportJob.objects.filter(pk=job.pk, status="pending").update(
+            status="running", started_at=timezone.now()
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+class ProgressTracker:
+    def __init__(self, job, interval=1.0):
+        self.job = job
+        self.interval = interval
+        self.processed = 0
+        self._saved_at = time.monotonic()
+
+    def __call__(self, count=1):
+        self.processed += count
+        if time.monotonic() - self._saved_at >= self.interval:
+            self.flush()
+
+    def flush(self):
+        ExportJob.objects.filter(pk=self.job.pk).update(processed_rows=self.processed)
+        self.job.processed_rows = self.processed
+        self._saved_at = time.monotonic()
+
+
+def write_export(job, fileobj, progress):
+    form = job.form
+    if job.export_format == "zip":
+        exporter = get_submission_exporter(job.total_rows)
+        exporter.progress_callback = progress
+        for chunk in exporter.iter_submissions_zip(form.submissions.order_by("id")):
+            fileobj.write(chunk)
+        return
+
+    exporter = FormTableExporter(form)
+    exporter.progress_callback = progress
+    if job.export_format == "xlsx":
+        exporter.write_xlsx(fileobj)
+    elif job.export_format == "csv":
+        for line in exporter.iter_csv():
+            fileobj.write(line.encode("utf-8"))
+    else:
+        for line in exporter.iter_jsonl():
+            fileobj.write(line.encode("utf-8"))
+
+
+def run_export_job(job):
+    form = job.form
+    job.fingerprint = export_fingerprint(form)
+    job.total_rows = form.submissions.count()
+    job.save(update_fields=["fingerprint", "total_rows"])
+
+    progress = ProgressTracker(job)
+    try:
+        with tempfile.TemporaryFile() as buffer:
+            write_export(job, buffer, progress)
+            buffer.seek(0)
+            job.file.save(f"{form.pk}_submissions.{job.export_format}", File(buffer), save=False)
+    except Exception:
+        logger.exception("Export job %s failed", job.pk)
+        job.status = "failed"
+        job.error = traceback.format_exc()
+    else:
+        job.status = "done"
+    job.processed_rows = progress.processed
+    job.finished_at = timezone.now()
+    job.save()
+    return job
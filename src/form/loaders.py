@@ -0,0 +1,40 @@
+from collections import defaultdict
+from itertools import islice
+
+from django.db.models import Prefetch, prefetch_related_objects
+
+from .models import FieldValue, FileValue
+
+CHUNK_SIZE = 200
+
+
+def iter_batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class SubmissionBatchLoader:
+    def __init__(self, submissions, chunk_size=CHUNK_SIZE):
+        self.submissions = submissions
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        for chunk in iter_batches(self.submissions.iterator(chunk_size=self.chunk_size), self.chunk_size):
+            yield from self.load(chunk)
+
+    def load(self, chunk):
+        submission_ids = [submission.pk for submission in chunk]
+
+        field_values = list(
+            FieldValue.objects.filter(submission_id__in=submission_ids).select_related("field").order_by("id")
+        )
+        # Файлы всех ответов пачки — одним запросом, related-менеджер отдаёт их без обращения к базе
+        prefetch_related_objects(field_values, Prefetch("file_values", queryset=FileValue.objects.order_by("id")))
+
+        values_by_submission = defaultdict(list)
+        for field_value in field_values:
+            values_by_submission[field_value.submission_id].append(field_value)
+
+        for submission in chunk:
+            yield submission, values_by_submission[submission.pk]
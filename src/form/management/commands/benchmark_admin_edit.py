@@ -0,0 +1,85 @@
+import time
+
+from django.db import connection, transaction
+from django.core.management.base import BaseCommand
+from django.http import QueryDict
+from django.test.utils import CaptureQueriesContext
+
+from form.models import DynamicForm, FieldValue, FormField, FormSubmission
+from form.search import index_submissions
+from form.services import apply_admin_changes, bump_schema_version, touch_form_data
+from form.stats import choice_snapshot, update_choice_stats
+
+
+def legacy_save(submission, data):
+    # Прежняя реализация AdminSubmissionDetailView.post: save() на каждое изменённое значение
+    field_values = list(submission.values.select_related("field"))
+    choices_before = choice_snapshot(field_values)
+
+    with transaction.atomic():
+        for fv in field_values:
+            field_type = fv.field.field_type
+            form_key = f"field_{fv.id}"
+
+            if field_type in ["text", "textarea"]:
+                new_value = data.get(form_key)
+                if new_value != fv.text_value:
+                    fv.text_value = new_value
+                    fv.save()
+
+            elif field_type in ["select", "checkbox"]:
+                new_value = data.getlist(form_key) if field_type == "checkbox" else data.get(form_key)
+                if new_value != fv.choice_value:
+                    fv.choice_value = new_value
+                    fv.save()
+
+        update_choice_stats(submission.form_id, choices_before, choice_snapshot(field_values))
+        index_submissions([submission.pk])
+
+    touch_form_data(submission.form_id)
+
+
+def batched_save(submission, data):
+    apply_admin_changes(submission, list(submission.values.select_related("field")), data)
+
+
+class Command(BaseCommand):
+    help = "Сравнивает поштучное и пакетное сохранение правок администратора (данные создаются и откатываются)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fields", type=int, default=60)
+        parser.add_argument("--changed", type=int, default=20, help="Сколько полей меняется за одно сохранение")
+        parser.add_argument("--rounds", type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            submission = self.make_submission(options["fields"])
+            for name, save in (("Поштучно", legacy_save), ("Пакетно", batched_save)):
+                queries, elapsed = self.measure(save, submission, options["changed"], options["rounds"])
+                self.stdout.write(f"{name}: {queries} запросов, {elapsed * 1000:.1f} мс на сохранение")
+            transaction.set_rollback(True)
+
+    def make_submission(self, fields):
+        form = DynamicForm.objects.create(name="benchmark_admin_edit")
+        submission = FormSubmission.objects.create(form=form, session_key="benchmark_admin_edit")
+        form_fields = FormField.objects.bulk_create(
+            FormField(form=form, label=f"Поле {order}", field_type="text", order=order) for order in range(fields)
+        )
+        bump_schema_version(form.pk)
+        FieldValue.objects.bulk_create(
+            FieldValue(submission=submission, field=field, text_value="") for field in form_fields
+        )
+        return submission
+
+    def measure(self, save, submission, changed, rounds):
+        values = list(submission.values.order_by("pk"))
+        total_queries = 0
+        started = time.perf_counter()
+        for round_number in range(rounds):
+            data = QueryDict(mutable=True)
+            for index, field_value in enumerate(values):
+                data[f"field_{field_value.pk}"] = f"{round_number}-{index}" if index < changed else ""
+            with CaptureQueriesContext(connection) as queries:
+                save(submission, data)
+            total_queries += len(queries)
+        return total_queries // rounds, (time.perf_counter() - started) / rounds
@@ -0,0 +1,227 @@
+import asyncio
+import math
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.middleware.csrf import _get_new_csrf_string
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from form.models import DynamicForm, FormField, FormSubmission
+
+
+class SlowStorage(FileSystemStorage):
+    # Файловое хранилище с задержкой на каждый файл — как сетевой S3/MinIO
+    def __init__(self, latency=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+
+    def _save(self, name, content):
+        time.sleep(self.latency)
+        return super()._save(name, content)
+
+
+class SlowInput(BytesIO):
+    # Тело запроса приходит частями: перед каждой новой частью клиент «думает» delay секунд
+    def __init__(self, body, chunk_size, delay):
+        super().__init__(body)
+        self.chunk_size = chunk_size
+        self.delay = delay
+        self.sent = 0
+
+    def wait(self):
+        while self.sent < math.ceil(self.tell() / self.chunk_size):
+            time.sleep(self.delay)
+            self.sent += 1
+
+    def read(self, size=-1, /):
+        data = super().read(size)
+        self.wait()
+        return data
+
+    def readline(self, size=-1, /):
+        line = super().readline(size)
+        self.wait()
+        return line
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест отправки формы медленными клиентами: один ASGI-воркер против синхронного WSGI-воркера "
+        "(форма и файлы создаются на время теста и удаляются)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", default="1,10,50", help="Число одновременных клиентов через запятую")
+        parser.add_argument("--file-size", type=int, default=256 * 1024)
+        parser.add_argument("--chunks", type=int, default=4, help="На сколько частей клиент делит тело запроса")
+        parser.add_argument("--chunk-delay", type=float, default=0.05, help="Пауза клиента перед каждой частью, с")
+        parser.add_argument("--storage-latency", type=float, default=0.2, help="Задержка хранилища на файл, с")
+        parser.add_argument("--threads", type=int, default=1, help="Потоков у WSGI-воркера (gunicorn --threads)")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.token = _get_new_csrf_string()
+        client_counts = [int(count) for count in options["clients"].split(",")]
+        views = "асинхронные" if settings.FORM_ASYNC_VIEWS else "синхронные (FORM_ASYNC_VIEWS=1 — асинхронные)"
+        self.stdout.write(f"Представления отправки: {views}")
+
+        dynamic_form = DynamicForm.objects.create(name="benchmark_async_submit")
+        FormField.objects.create(form=dynamic_form, label="Имя", field_type="text", order=1)
+        FormField.objects.create(form=dynamic_form, label="Файл", field_type="file", order=2)
+        path = reverse("form_submit", args=[dynamic_form.pk])
+        try:
+            with tempfile.TemporaryDirectory() as location, override_settings(
+                ALLOWED_HOSTS=["localhost"],
+                STORAGES={
+                    **settings.STORAGES,
+                    "default": {
+                        "BACKEND": f"{__name__}.SlowStorage",
+                        "OPTIONS": {"location": location, "latency": options["storage_latency"]},
+                    },
+                },
+            ):
+                asgi, wsgi = ASGIHandler(), WSGIHandler()
+                for clients in client_counts:
+                    self.report("ASGI, 1 воркер", clients, asyncio.run(self.run_asgi(asgi, path, clients)))
+                    self.report(f"WSGI, потоков: {options['threads']}", clients, self.run_wsgi(wsgi, path, clients))
+        finally:
+            self.cleanup(dynamic_form)
+
+    def make_body(self):
+        content = ContentFile(b"x" * self.options["file_size"], name="resume.pdf")
+        return encode_multipart(BOUNDARY, {"csrfmiddlewaretoken": self.token, "Имя": "Иван", "Файл": content})
+
+    def split(self, body):
+        size = math.ceil(len(body) / self.options["chunks"])
+        return [body[start : start + size] for start in range(0, len(body), size)]
+
+    async def run_asgi(self, application, path, clients):
+        started = time.perf_counter()
+        results = await asyncio.gather(*(self.asgi_request(application, path) for _ in range(clients)))
+        return results, time.perf_counter() - started
+
+    async def asgi_request(self, application, path):
+        body = self.make_body()
+        chunks = self.split(body)
+        finished = asyncio.Event()
+        statuses = []
+
+        async def receive():
+            if chunks:
+                await asyncio.sleep(self.options["chunk_delay"])
+                chunk = chunks.pop(0)
+                return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+            # Тело отправлено — клиент ждёт ответа и только потом закрывает соединение
+            await finished.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                statuses.append(message["status"])
+            elif message["type"] == "http.response.body" and not message.get("more_body"):
+                finished.set()
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [
+                (b"host", b"localhost"),
+                (b"content-type", MULTIPART_CONTENT.encode()),
+                (b"content-length", str(len(body)).encode()),
+                (b"cookie", f"{settings.CSRF_COOKIE_NAME}={self.token}".encode()),
+            ],
+            "client": ("127.0.0.1", 0),
+            "server": ("localhost", 80),
+        }
+        started = time.perf_counter()
+        await application(scope, receive, send)
+        return statuses[0], time.perf_counter() - started
+
+    def run_wsgi(self, application, path, clients):
+        started = time.perf_counter()
+        # Синхронный воркер держит соединение, пока клиент досылает тело, — остальные ждут в очереди
+        with ThreadPoolExecutor(max_workers=self.options["threads"]) as pool:
+            futures = [pool.submit(self.wsgi_request, application, path, started) for _ in range(clients)]
+        return [future.result() for future in futures], time.perf_counter() - started
+
+    def wsgi_request(self, application, path, queued_at):
+        body = self.make_body()
+        environ = {
+            "REQUEST_METHOD": "POST",
+            "SCRIPT_NAME": "",
+            "PATH_INFO": path,
+            "QUERY_STRING": "",
+            "SERVER_NAME": "localhost",
+            "SERVER_PORT": "80",
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "REMOTE_ADDR": "127.0.0.1",
+            "HTTP_HOST": "localhost",
+            "HTTP_COOKIE": f"{settings.CSRF_COOKIE_NAME}={self.token}",
+            "CONTENT_TYPE": MULTIPART_CONTENT,
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": SlowInput(body, math.ceil(len(body) / self.options["chunks"]), self.options["chunk_delay"]),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": self.options["threads"] > 1,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        statuses = []
+
+        def start_response(status, headers, exc_info=None):
+            statuses.append(int(status.split()[0]))
+
+        response = application(environ, start_response)
+        try:
+            b"".join(response)
+        finally:
+            response.close()
+        # Задержка клиента считается с момента подключения, включая ожидание свободного воркера
+        return statuses[0], time.perf_counter() - queued_at
+
+    def report(self, name, clients, measurement):
+        results, elapsed = measurement
+        latencies = [latency for _, latency in results]
+        failed = sum(1 for status, _ in results if status != 302)
+        line = (
+            f"{name:<22} клиентов: {clients:>4}  всего: {elapsed:6.2f} с  "
+            f"{clients / elapsed:6.1f} отправок/с  "
+            f"p50: {statistics.median(latencies):5.2f} с  p95: {percentile(latencies, 95):5.2f} с"
+        )
+        if failed:
+            self.stdout.write(self.style.ERROR(f"{line}  ошибок: {failed}"))
+        else:
+            self.stdout.write(line)
+
+    def cleanup(self, dynamic_form):
+        session_store = import_module(settings.SESSION_ENGINE).SessionStore
+        session_keys = FormSubmission.objects.filter(form=dynamic_form).values_list("session_key", flat=True)
+        for session_key in session_keys:
+            session_store(session_key).delete()
+        dynamic_form.delete()
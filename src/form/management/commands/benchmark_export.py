@@ -0,0 +1,70 @@
+import time
+import zipfile
+from io import BytesIO
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from form.exporter import FormSubmissionExporter, ParallelSubmissionExporter
+from form.models import DynamicForm
+from form.synthetic import SEED_PREFIX
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает ZIP-экспорт отправок формы из базы в текущем процессе и через пул процессов (вместе с его "
+        "запуском); по умолчанию берётся самая большая синтетическая форма (см. seed_data)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--form", type=int, help="ID формы")
+        parser.add_argument("--workers", type=int, default=max(settings.FORM_EXPORT_WORKERS, 2))
+        parser.add_argument("--batch-size", type=int, default=20)
+
+    def handle(self, *args, **options):
+        dynamic_form = self.get_form(options["form"])
+        submissions = dynamic_form.submissions.order_by("id")
+
+        serial_time, serial_names = self.run(FormSubmissionExporter(), submissions)
+        exporter = ParallelSubmissionExporter(workers=options["workers"], batch_size=options["batch_size"])
+        parallel_time, parallel_names = self.run(exporter, submissions)
+
+        if serial_names != parallel_names:
+            self.stderr.write(self.style.ERROR("Порядок файлов в параллельном режиме отличается от последовательного"))
+
+        count = len(serial_names)
+        self.stdout.write(f"Форма: {dynamic_form}, отправок: {count}, процессов: {exporter.workers}")
+        self.stdout.write(f"В текущем процессе: {serial_time:.2f} с ({count / serial_time:.1f} файлов/с)")
+        self.stdout.write(f"Пул процессов:      {parallel_time:.2f} с ({count / parallel_time:.1f} файлов/с)")
+        style = self.style.SUCCESS if parallel_time < serial_time else self.style.WARNING
+        self.stdout.write(style(f"Ускорение: x{serial_time / parallel_time:.2f}"))
+        self.stdout.write(
+            f"Пул включается при FORM_EXPORT_WORKERS > 1 для выгрузок от "
+            f"{settings.FORM_EXPORT_PARALLEL_MIN_ROWS} отправок (FORM_EXPORT_PARALLEL_MIN_ROWS)"
+        )
+
+    def get_form(self, form_id):
+        if form_id is not None:
+            try:
+                return DynamicForm.objects.get(pk=form_id)
+            except DynamicForm.DoesNotExist:
+                raise CommandError(f"Форма {form_id} не найдена")
+        dynamic_form = (
+            DynamicForm.objects.filter(name__startswith=SEED_PREFIX)
+            .annotate(total=Count("submissions"))
+            .order_by("-total")
+            .first()
+        )
+        if dynamic_form is None:
+            raise CommandError("Нет синтетических данных: выполните manage.py seed_data или укажите --form")
+        return dynamic_form
+
+    def run(self, exporter, submissions):
+        # Архив собирается целиком, как при скачивании из админки; в память, чтобы не мерить диск
+        buffer = BytesIO()
+        started = time.perf_counter()
+        for chunk in exporter.iter_submissions_zip(submissions):
+            buffer.write(chunk)
+        elapsed = time.perf_counter() - started
+        return elapsed, zipfile.ZipFile(buffer).namelist()
@@ -0,0 +1,95 @@
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.utils.datastructures import MultiValueDict
+
+from form.forms import get_form_class
+from form.models import DynamicForm, FormField
+from form.services import bump_schema_version, create_submission
+
+
+class Command(BaseCommand):
+    help = (
+        "Одновременные отправки формы из нескольких потоков: число отправок в секунду и ошибок блокировки SQLite "
+        "при текущих настройках (SQLITE_PROFILE, FORM_SERIAL_WRITER); форма создаётся на время теста и удаляется"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--submissions", type=int, default=50, help="Отправок на поток")
+        parser.add_argument("--fields", type=int, default=20)
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            journal_mode = cursor.fetchone()[0]
+        options_dict = connection.settings_dict.get("OPTIONS", {})
+        self.stdout.write(
+            f"journal_mode={journal_mode}, timeout={options_dict.get('timeout', 5)} с, "
+            f"transaction_mode={options_dict.get('transaction_mode') or 'DEFERRED'}, "
+            f"писатель: {'один поток' if settings.FORM_SERIAL_WRITER else 'каждый запрос сам'}"
+        )
+
+        dynamic_form = self.make_form(options["fields"])
+        self.locked = 0
+        self.lock = threading.Lock()
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options["threads"]) as pool:
+                futures = [
+                    pool.submit(self.client, dynamic_form, options["submissions"]) for _ in range(options["threads"])
+                ]
+            latencies = [latency for future in futures for latency in future.result()]
+            elapsed = time.perf_counter() - started
+        finally:
+            dynamic_form.delete()
+
+        saved = len(latencies)
+        self.stdout.write(f"Потоков: {options['threads']}, сохранено отправок: {saved} за {elapsed:.2f} с")
+        if latencies:
+            latencies.sort()
+            self.stdout.write(
+                f"{saved / elapsed:.1f} отправок/с, p50: {statistics.median(latencies) * 1000:.1f} мс, "
+                f"p99: {latencies[int(len(latencies) * 0.99)] * 1000:.1f} мс"
+            )
+        style = self.style.ERROR if self.locked else self.style.SUCCESS
+        self.stdout.write(style(f"Ошибок \"database is locked\": {self.locked}"))
+
+    def make_form(self, fields):
+        dynamic_form = DynamicForm.objects.create(name="benchmark_sqlite_writes")
+        FormField.objects.bulk_create(
+            FormField(form=dynamic_form, label=f"Поле {order}", field_type="text", order=order)
+            for order in range(fields)
+        )
+        bump_schema_version(dynamic_form.pk)
+        FormField.objects.create(form=dynamic_form, label="Выбор", field_type="select", choices=["a", "b"], order=fields)
+        return dynamic_form
+
+    def client(self, dynamic_form, submissions):
+        form_class = get_form_class(dynamic_form)
+        data = {field.label: "ответ" for field in form_class.form_fields}
+        data["Выбор"] = "a"
+        latencies = []
+        try:
+            for _ in range(submissions):
+                form = form_class(data)
+                form.is_valid()
+                started = time.perf_counter()
+                try:
+                    create_submission(dynamic_form, form, MultiValueDict(), session_key=uuid.uuid4().hex)
+                except OperationalError as exc:
+                    if "locked" not in str(exc):
+                        raise
+                    with self.lock:
+                        self.locked += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+        finally:
+            connection.close()
+        return latencies
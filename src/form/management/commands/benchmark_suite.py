@@ -0,0 +1,260 @@
+import json
+import random
+import resource
+import statistics
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from form.forms import get_form_class
+from form.ingest import get_queue
+from form.models import DynamicForm, FileValue, FormSubmission
+from form.services import FILE_FIELD_TYPES, delete_submissions
+from form.synthetic import SEED_PREFIX, fake_post_data
+from form.transfers import delete_files
+
+SCENARIOS = ("form_list", "submit", "edit", "admin_list", "admin_detail", "export")
+# Сценарии, которые открываются под администратором
+STAFF_SCENARIOS = ("admin_list", "admin_detail", "export")
+
+
+def peak_rss_mb():
+    # ru_maxrss — пик за всё время процесса (в Linux в килобайтах, в macOS в байтах), поэтому он один на прогон,
+    # а не на сценарий: пик первого тяжёлого сценария перекрыл бы все следующие
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def latency_summary(latencies):
+    if len(latencies) < 2:
+        value = latencies[0] if latencies else 0
+        return {"p50": value, "p95": value, "p99": value, "mean": value}
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98], "mean": statistics.fmean(latencies)}
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный прогон по синтетическим данным (см. seed_data): список форм, отправка, правка, "
+        "админка и экспорт; пропускная способность, задержки p50/p95/p99, запросы к БД и пик памяти процесса, "
+        "результат в JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Сценарии через запятую")
+        parser.add_argument("--requests", type=int, default=50, help="Запросов на сценарий")
+        parser.add_argument("--warmup", type=int, default=3, help="Запросов на прогрев, не входят в результат")
+        parser.add_argument("--concurrency", type=int, default=1, help="Клиентов в отдельных потоках")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Сохранить результат в JSON-файл")
+        parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options["scenarios"].split(",") if name.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Неизвестные сценарии: {', '.join(sorted(unknown))}")
+
+        self.forms = list(DynamicForm.objects.filter(name__startswith=SEED_PREFIX).order_by("pk"))
+        if not self.forms:
+            raise CommandError("Нет синтетических данных, сначала выполните manage.py seed_data")
+        self.submission_ids = list(
+            FormSubmission.objects.filter(form__in=self.forms).order_by("pk").values_list("pk", flat=True)[:1000]
+        )
+        self.form_classes = {dynamic_form.pk: get_form_class(dynamic_form) for dynamic_form in self.forms}
+        self.submission_forms = dict(
+            FormSubmission.objects.filter(pk__in=self.submission_ids).values_list("pk", "form_id")
+        )
+        self.options = options
+        self.lock = threading.Lock()
+        self.created_ids = []
+        self.ingest_tokens = []
+        self.session_keys = []
+        self.admin = User.objects.create_superuser(f"benchmark-{uuid.uuid4().hex[:8]}", "", uuid.uuid4().hex)
+
+        results = {}
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+                for name in scenarios:
+                    results[name] = self.run_scenario(name)
+                    self.print_result(name, results[name])
+        finally:
+            self.cleanup()
+
+        report = {
+            "created_at": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "settings": {
+                name: str(getattr(settings, name))
+                for name in (
+                    "SQLITE_PROFILE",
+                    "FORM_SERIAL_WRITER",
+                    "FORM_INGEST_MODE",
+                    "FORM_ASYNC_VIEWS",
+                    "FORM_UPLOAD_MODE",
+                    "FORM_ADMIN_USE_COUNTERS",
+                )
+            },
+            "options": {name: options[name] for name in ("requests", "warmup", "concurrency", "seed")},
+            "dataset": {
+                "forms": len(self.forms),
+                "submissions": FormSubmission.objects.filter(form__in=self.forms).count(),
+            },
+            "scenarios": results,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        self.stdout.write(f"Пик памяти процесса за прогон: {report['peak_rss_mb']:.1f} МБ")
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Результат сохранён в {options['output']}")
+        if options["compare"]:
+            self.compare(report, options["compare"])
+
+    def run_scenario(self, name):
+        request = getattr(self, f"request_{name}")
+        concurrency = self.options["concurrency"]
+        total = self.options["requests"]
+
+        def client_loop(worker):
+            client = Client()
+            if name in STAFF_SCENARIOS:
+                client.force_login(self.admin)
+            rnd = random.Random(f"{self.options['seed']}-{name}-{worker}")
+            for index in range(self.options["warmup"]):
+                self.measure(request, client, rnd, index)
+            samples = [self.measure(request, client, rnd, index) for index in range(worker, total, concurrency)]
+            connection.close()
+            return samples
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [pool.submit(client_loop, worker) for worker in range(concurrency)]
+        samples = [sample for future in futures for sample in future.result()]
+        elapsed = time.perf_counter() - started
+
+        latencies = [latency for latency, _, _ in samples]
+        return {
+            "requests": len(samples),
+            "errors": sum(1 for _, _, status in samples if status >= 400),
+            "statuses": dict(Counter(str(status) for _, _, status in samples)),
+            "throughput_rps": len(samples) / elapsed if elapsed else 0,
+            "latency_ms": {key: value * 1000 for key, value in latency_summary(latencies).items()},
+            "queries_per_request": statistics.fmean(queries for _, queries, _ in samples) if samples else 0,
+        }
+
+    def measure(self, request, client, rnd, index):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = request(client, rnd, index)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            elapsed = time.perf_counter() - started
+        response.close()
+        return elapsed, len(queries), response.status_code
+
+    def pick_form(self, index):
+        return self.forms[index % len(self.forms)]
+
+    def pick_submission(self, index):
+        return self.submission_ids[index % len(self.submission_ids)]
+
+    def request_form_list(self, client, rnd, index):
+        return client.get(reverse("form_list"))
+
+    def request_submit(self, client, rnd, index):
+        # Каждая отправка — новый анонимный посетитель: у одной сессии может быть только одна отправка
+        client.cookies.clear()
+        dynamic_form = self.pick_form(index)
+        data = fake_post_data(self.form_classes[dynamic_form.pk].form_fields, rnd)
+        response = client.post(reverse("form_submit", args=[dynamic_form.pk]), data)
+        if response.status_code == 302:
+            match = resolve(urlparse(response.url).path)
+            with self.lock:
+                if match.url_name == "form_submission_detail":
+                    self.created_ids.append(match.kwargs["pk"])
+                elif match.url_name == "form_submission_pending":
+                    self.ingest_tokens.append(match.kwargs["token"])
+                if settings.SESSION_COOKIE_NAME in client.cookies:
+                    self.session_keys.append(client.cookies[settings.SESSION_COOKIE_NAME].value)
+        return response
+
+    def request_edit(self, client, rnd, index):
+        submission_id = self.pick_submission(index)
+        form_class = self.form_classes[self.submission_forms[submission_id]]
+        # Файлы при правке не меняются, их загрузку измеряет сценарий submit
+        fields = [field for field in form_class.form_fields if field.field_type not in FILE_FIELD_TYPES]
+        data = fake_post_data(fields, rnd)
+        return client.post(reverse("form_submission_edit", args=[submission_id]), data)
+
+    def request_admin_list(self, client, rnd, index):
+        url = reverse("admin:form_formsubmission_changelist")
+        return client.get(url, {"form__id__exact": self.pick_form(index).pk})
+
+    def request_admin_detail(self, client, rnd, index):
+        return client.get(reverse("admin:form_formsubmission_change", args=[self.pick_submission(index)]))
+
+    def request_export(self, client, rnd, index):
+        return client.get(reverse("admin:form_export_table", args=[self.pick_form(index).pk, "csv"]))
+
+    def print_result(self, name, result):
+        latency = result["latency_ms"]
+        line = (
+            f"{name:<13} {result['throughput_rps']:7.1f} запр/с  "
+            f"p50 {latency['p50']:7.1f}  p95 {latency['p95']:7.1f}  p99 {latency['p99']:7.1f} мс  "
+            f"{result['queries_per_request']:6.1f} SQL/запр"
+        )
+        if result["errors"]:
+            self.stdout.write(self.style.ERROR(f"{line}  ошибок: {result['errors']}"))
+        else:
+            self.stdout.write(line)
+
+    def compare(self, report, path):
+        with open(path, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)["scenarios"]
+        self.stdout.write(f"Сравнение с {path} (отрицательная разница p95 — быстрее):")
+        for name, result in report["scenarios"].items():
+            before = baseline.get(name)
+            if not before:
+                continue
+            throughput = self.change(result["throughput_rps"], before["throughput_rps"])
+            p95 = self.change(result["latency_ms"]["p95"], before["latency_ms"]["p95"])
+            queries = result["queries_per_request"] - before["queries_per_request"]
+            self.stdout.write(f"{name:<13} запр/с {throughput:+6.1f}%  p95 {p95:+6.1f}%  SQL/запр {queries:+.1f}")
+
+    def change(self, value, before):
+        return (value / before - 1) * 100 if before else 0
+
+    def cleanup(self):
+        # Отправки, созданные сценарием submit, удаляются вместе с файлами, чтобы прогоны были сопоставимы.
+        # В режиме очереди приёма они ещё в журнале или уже выгружены воркером
+        names = []
+        if self.ingest_tokens:
+            for entry in get_queue().pop(self.ingest_tokens):
+                names.extend(name for _, name, _ in entry.payload["files"])
+            self.created_ids.extend(
+                FormSubmission.objects.filter(ingest_token__in=self.ingest_tokens).values_list("pk", flat=True)
+            )
+        file_values = FileValue.objects.filter(field_value__submission_id__in=self.created_ids)
+        names.extend(name for pair in file_values.values_list("file", "thumbnail") for name in pair if name)
+        delete_submissions(FormSubmission.objects.filter(pk__in=self.created_ids))
+        delete_files(names)
+        session_store = import_module(settings.SESSION_ENGINE).SessionStore
+        for session_key in self.session_keys:
+            session_store(session_key).delete()
+        self.admin.delete()
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from form.transfers import delete_files
+from form.uploads import direct_uploads_enabled, orphaned_uploads
+
+
+class Command(BaseCommand):
+    help = "Удаляет напрямую загруженные в S3 объекты, которые так и не прикрепили к отправке"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Только показать, что будет удалено")
+
+    def handle(self, *args, **options):
+        if not direct_uploads_enabled():
+            raise CommandError("Прямая загрузка в S3 не включена (FORM_UPLOAD_MODE=direct)")
+        orphans = orphaned_uploads()
+        for name in orphans:
+            self.stdout.write(name)
+        if not options["dry_run"]:
+            delete_files(orphans)
+        self.stdout.write(self.style.SUCCESS(f"Неприкреплённых объектов: {len(orphans)}"))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from form.models import FileValue
+from form.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Создаёт миниатюры для загруженных изображений, у которых их ещё нет"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Пересоздать миниатюры и для тех, у кого они уже есть")
+
+    def handle(self, *args, **options):
+        file_values = FileValue.objects.filter(is_image=True).exclude(file="")
+        if not options["force"]:
+            file_values = file_values.filter(thumbnail="")
+        ids = list(file_values.order_by("pk").values_list("pk", flat=True))
+        self.stdout.write(f"Изображений к обработке: {len(ids)}")
+        created = generate_thumbnails(ids, force=options["force"])
+        self.stdout.write(self.style.SUCCESS(f"Создано миниатюр: {created}"))
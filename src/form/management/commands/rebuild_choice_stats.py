@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from form.stats import rebuild_choice_stats
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счётчики вариантов ответов по сохранённым ответам"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--form", type=int, action="append", dest="form_ids", help="ID формы (можно несколько)")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_choice_stats(options["form_ids"])
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано счётчиков: {count}"))
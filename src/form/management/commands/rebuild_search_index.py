@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from form.search import is_fts_available, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Перестраивает полнотекстовый индекс ответов на формы"
+
+    def handle(self, *args, **options):
+        if not is_fts_available():
+            self.stderr.write(self.style.WARNING("Полнотекстовый индекс поддерживается только на SQLite"))
+            return
+        count = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Проиндексировано отправок: {count}"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from form.services import recount_submissions
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает денормализованные счётчики отправок у форм и пользователей"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            recount_submissions()
+        self.stdout.write(self.style.SUCCESS("Счётчики отправок пересчитаны"))
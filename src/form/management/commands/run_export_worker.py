@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from form.jobs import claim_next_job, run_export_job
+
+
+class Command(BaseCommand):
+    help = "Обрабатывает очередь фоновых экспортов отправок"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=5.0, help="Пауза между опросами очереди, сек.")
+        parser.add_argument("--once", action="store_true", help="Обработать текущую очередь и завершиться")
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+                continue
+
+            self.stdout.write(f"Экспорт #{job.pk}: {job.form} ({job.export_format})")
+            job = run_export_job(job)
+            if job.status == "done":
+                self.stdout.write(self.style.SUCCESS(f"Экспорт #{job.pk} готов: {job.processed_rows} отправок"))
+            else:
+                self.stdout.write(self.style.ERROR(f"Экспорт #{job.pk} завершился ошибкой"))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from form.ingest import drain_queue, get_queue
+
+
+class Command(BaseCommand):
+    help = "Переносит отправки из журнала приёма (FORM_INGEST_MODE) в базу пачками"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=1.0, help="Пауза между опросами пустого журнала, сек.")
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--once", action="store_true", help="Выгрузить текущий журнал и завершиться")
+        parser.add_argument("--retry-failed", action="store_true", help="Вернуть в очередь записи с ошибкой")
+
+    def handle(self, *args, **options):
+        queue = get_queue()
+        if options["retry_failed"]:
+            self.stdout.write(f"Возвращено в очередь: {queue.retry_failed()}")
+
+        while True:
+            written, failed = drain_queue(options["batch_size"])
+            if written:
+                self.stdout.write(self.style.SUCCESS(f"Записано отправок: {written}"))
+            if failed:
+                self.stdout.write(self.style.ERROR(f"Не удалось записать: {failed}, они остаются в журнале"))
+            if written or failed:
+                continue
+            if options["once"]:
+                pending, failed = queue.counts()
+                self.stdout.write(f"В журнале: {pending} в очереди, {failed} с ошибкой")
+                break
+            time.sleep(options["interval"])
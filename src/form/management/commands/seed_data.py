@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from form.models import DynamicForm, FileValue
+from form.synthetic import SEED_PREFIX, seed_dataset
+from form.transfers import delete_files
+
+
+class Command(BaseCommand):
+    help = "Создаёт синтетические формы со всеми типами полей, отправки и файлы для нагрузочных тестов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--forms", type=int, default=5)
+        parser.add_argument("--fields", type=int, default=18, help="Полей в форме, типы чередуются")
+        parser.add_argument("--submissions", type=int, default=200, help="Отправок на форму")
+        parser.add_argument("--file-ratio", type=float, default=0.5, help="Доля заполненных полей с файлами")
+        parser.add_argument("--file-size", type=int, default=16 * 1024)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--clear", action="store_true", help="Сначала удалить ранее созданные синтетические формы")
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            self.clear()
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            form_ids, submission_ids = seed_dataset(
+                options["forms"],
+                options["fields"],
+                options["submissions"],
+                file_ratio=options["file_ratio"],
+                file_size=options["file_size"],
+                seed=options["seed"],
+            )
+        files = FileValue.objects.filter(field_value__submission__form_id__in=form_ids).count()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Форм: {len(form_ids)}, отправок: {len(submission_ids)}, файлов: {files} "
+                f"за {time.perf_counter() - started:.1f} с"
+            )
+        )
+
+    def clear(self):
+        forms = DynamicForm.objects.filter(name__startswith=SEED_PREFIX)
+        file_values = FileValue.objects.filter(field_value__submission__form__in=forms)
+        names = [name for pair in file_values.values_list("file", "thumbnail") for name in pair if name]
+        deleted = forms.count()
+        forms.delete()
+        delete_files(names)
+        self.stdout.write(f"Удалено синтетических форм: {deleted}, файлов: {len(names)}")
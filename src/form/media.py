@@ -0,0 +1,23 @@
+from .models import FileValue
+
+
+def storage_urls(storage, names):
+    names = list(dict.fromkeys(name for name in names if name))
+    if hasattr(storage, "urls_for"):
+        return storage.urls_for(names)
+    return {name: storage.url(name) for name in names}
+
+
+def attach_file_urls(file_values):
+    # Ссылки на все файлы и миниатюры страницы получаются одним обращением к хранилищу
+    file_values = list(file_values)
+    if not file_values:
+        return file_values
+    storage = FileValue._meta.get_field("file").storage
+    urls = storage_urls(
+        storage, [name for file_value in file_values for name in (file_value.file.name, file_value.thumbnail.name)]
+    )
+    for file_value in file_values:
+        file_value.file_url = urls.get(file_value.file.name, "")
+        file_value.preview_url = urls.get(file_value.thumbnail.name) or file_value.file_url
+    return file_values
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dynamicform',
+            name='schema_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Версия схемы'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:48
+
+import config.storages
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form', '0002_dynamicform_schema_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dynamicform',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Версия ответов'),
+        ),
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('export_format', models.CharField(choices=[('zip', 'ZIP (Excel на каждую отправку)'), ('xlsx', 'XLSX (одна таблица)'), ('csv', 'CSV'), ('jsonl', 'JSONL')], default='zip', max_length=10, verbose_name='Формат')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], db_index=True, default='pending', max_length=10, verbose_name='Статус')),
+                ('fingerprint', models.CharField(blank=True, db_index=True, max_length=64, verbose_name='Версия данных')),
+                ('total_rows', models.PositiveIntegerField(default=0, verbose_name='Всего отправок')),
+                ('processed_rows', models.PositiveIntegerField(default=0, verbose_name='Обработано')),
+                ('file', models.FileField(blank=True, null=True, storage=config.storages.MinIOMediaStorage, upload_to='exports/%Y/%m/%d/', verbose_name='Файл')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начат')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершён')),
+                ('form', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to='form.dynamicform', verbose_name='Форма')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Запросил')),
+            ],
+            options={
+                'verbose_name': 'Экспорт отправок',
+                'verbose_name_plural': 'Экспорты отправок',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
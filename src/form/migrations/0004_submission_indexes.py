@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:52
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def deduplicate_field_values(apps, schema_editor):
+    FieldValue = apps.get_model("form", "FieldValue")
+    FileValue = apps.get_model("form", "FileValue")
+    duplicates = (
+        FieldValue.objects.values("submission_id", "field_id")
+        .annotate(keep_id=Max("id"), total=Count("id"))
+        .filter(total__gt=1)
+    )
+    # Оставляем последнюю запись, файлы дублей переносим на неё
+    for duplicate in duplicates:
+        extra = FieldValue.objects.filter(
+            submission_id=duplicate["submission_id"], field_id=duplicate["field_id"]
+        ).exclude(pk=duplicate["keep_id"])
+        FileValue.objects.filter(field_value__in=extra).update(field_value_id=duplicate["keep_id"])
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form', '0003_export_jobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_field_values, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='formsubmission',
+            index=models.Index(fields=['form', 'submitted_at'], name='form_submission_form_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='formsubmission',
+            index=models.Index(fields=['user', 'form'], name='form_submission_user_form_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='fieldvalue',
+            constraint=models.UniqueConstraint(fields=('submission', 'field'), name='form_fieldvalue_submission_field_uniq'),
+        ),
+    ]
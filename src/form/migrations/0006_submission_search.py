@@ -0,0 +1,59 @@
+from collections import defaultdict
+from itertools import islice
+
+from django.db import migrations
+
+SEARCH_TABLE = "form_submission_search"
+
+
+def answer_text(text_value, choice_value):
+    parts = [text_value or ""]
+    if isinstance(choice_value, list):
+        parts.extend(str(choice) for choice in choice_value)
+    elif choice_value:
+        parts.append(str(choice_value))
+    return " ".join(part for part in parts if part)
+
+
+def create_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    # Теневая FTS5-таблица: rowid совпадает с id отправки, content — все текстовые ответы и выбранные варианты
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+        "USING fts5(content, form_id UNINDEXED, tokenize='unicode61 remove_diacritics 2')"
+    )
+    FieldValue = apps.get_model("form", "FieldValue")
+    FormSubmission = apps.get_model("form", "FormSubmission")
+
+    submissions = FormSubmission.objects.order_by("pk").values_list("pk", "form_id").iterator()
+    while batch := list(islice(submissions, 500)):
+        documents = defaultdict(list)
+        field_values = FieldValue.objects.filter(submission_id__in=[pk for pk, _ in batch]).order_by("id")
+        for submission_id, text_value, choice_value in field_values.values_list(
+            "submission_id", "text_value", "choice_value"
+        ):
+            text = answer_text(text_value, choice_value)
+            if text:
+                documents[submission_id].append(text)
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, form_id, content) VALUES (%s, %s, %s)",
+                [(pk, form_id, "\n".join(documents[pk])) for pk, form_id in batch],
+            )
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form', '0005_submission_date_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
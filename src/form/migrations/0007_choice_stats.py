@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:58
+
+from collections import Counter
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def choice_counts(field_id, choice_value):
+    # select хранится как [значение], checkbox — как список; вариант обрезается до длины ChoiceStat.choice
+    if not isinstance(choice_value, list):
+        choice_value = [] if choice_value in (None, "") else [choice_value]
+    return Counter((field_id, choice[:255]) for choice in set(map(str, choice_value)))
+
+
+def populate_choice_stats(apps, schema_editor):
+    ChoiceStat = apps.get_model("form", "ChoiceStat")
+    FieldValue = apps.get_model("form", "FieldValue")
+    rows = FieldValue.objects.filter(choice_value__isnull=False)
+    rows = rows.values_list("field_id", "field__form_id", "choice_value")
+    counts = Counter()
+    form_by_field = {}
+    for field_id, form_id, choice_value in rows.iterator():
+        form_by_field[field_id] = form_id
+        counts.update(choice_counts(field_id, choice_value))
+    ChoiceStat.objects.bulk_create(
+        [
+            ChoiceStat(form_id=form_by_field[field_id], field_id=field_id, choice=choice, count=count)
+            for (field_id, choice), count in counts.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form', '0006_submission_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChoiceStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('choice', models.CharField(max_length=255, verbose_name='Вариант')),
+                ('count', models.IntegerField(default=0, verbose_name='Количество')),
+                ('field', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='choice_stats', to='form.formfield', verbose_name='Поле')),
+                ('form', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='choice_stats', to='form.dynamicform', verbose_name='Форма')),
+            ],
+            options={
+                'verbose_name': 'Статистика варианта',
+                'verbose_name_plural': 'Статистика вариантов',
+                'constraints': [models.UniqueConstraint(fields=('field', 'choice'), name='form_choicestat_field_choice_uniq')],
+            },
+        ),
+        migrations.RunPython(populate_choice_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_submission_counters(apps, schema_editor):
+    DynamicForm = apps.get_model("form", "DynamicForm")
+    FormSubmission = apps.get_model("form", "FormSubmission")
+    UserSubmissionCount = apps.get_model("form", "UserSubmissionCount")
+
+    submissions = FormSubmission.objects.filter(form=OuterRef("pk")).order_by().values("form")
+    DynamicForm.objects.update(
+        submissions_count=Coalesce(Subquery(submissions.annotate(total=Count("pk")).values("total")), 0)
+    )
+    per_user = FormSubmission.objects.filter(user__isnull=False).order_by().values_list("user").annotate(Count("pk"))
+    UserSubmissionCount.objects.bulk_create(
+        [UserSubmissionCount(user_id=user_id, count=count) for user_id, count in per_user], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('form', '0007_choice_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSubmissionCount',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='submission_counter', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('count', models.IntegerField(default=0, verbose_name='Отправок')),
+            ],
+            options={
+                'verbose_name': 'Счётчик отправок пользователя',
+                'verbose_name_plural': 'Счётчики отправок пользователей',
+            },
+        ),
+        migrations.AddField(
+            model_name='dynamicform',
+            name='submissions_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Отправок'),
+        ),
+        migrations.RunPython(populate_submission_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form', '0008_submission_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmissionChangeSet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('changed_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата изменения')),
+                ('changes', models.JSONField(default=list, verbose_name='Изменения')),
+                ('changed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Изменил')),
+                ('submission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='change_sets', to='form.formsubmission', verbose_name='Отправка')),
+            ],
+            options={
+                'verbose_name': 'Изменение ответов',
+                'verbose_name_plural': 'Изменения ответов',
+                'ordering': ['-changed_at', '-id'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form', '0009_submission_change_sets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filevalue',
+            name='thumbnail',
+            field=models.FileField(blank=True, editable=False, max_length=255, upload_to='', verbose_name='Миниатюра'),
+        ),
+    ]
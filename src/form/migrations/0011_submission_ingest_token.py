@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form', '0010_filevalue_thumbnail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='formsubmission',
+            name='ingest_token',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True, unique=True, verbose_name='Токен приёма'),
+        ),
+        migrations.AddField(
+            model_name='historicalformsubmission',
+            name='ingest_token',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=32, null=True, verbose_name='Токен приёма'),
+        ),
+    ]
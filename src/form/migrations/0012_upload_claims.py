@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form', '0011_submission_ingest_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadClaim',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Имя объекта')),
+                ('claimed_at', models.DateTimeField(auto_now_add=True, verbose_name='Прикреплён')),
+            ],
+            options={
+                'verbose_name': 'Использованная загрузка',
+                'verbose_name_plural': 'Использованные загрузки',
+            },
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.contrib.auth.models import User
 from django.db import models
 from django.db.models import JSONField
+from django.utils import timezone
+from django.utils.functional import cached_property
 from simple_history.models import HistoricalRecords
 
 from config.storages import MinIOMediaStorage
@@ -9,6 +11,9 @@ class DynamicForm(models.Model):
     name = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    schema_version = models.PositiveIntegerField(default=0, editable=False, verbose_name="Версия схемы")
+    data_version = models.PositiveIntegerField(default=0, editable=False, verbose_name="Версия ответов")
+    submissions_count = models.IntegerField(default=0, editable=False, verbose_name="Отправок")
 
     def __str__(self):
         return self.name
@@ -58,10 +63,19 @@ class FormSubmission(models.Model):
         verbose_name="Аутентифицированный пользователь",
     )
     session_key = models.CharField(max_length=40, blank=True, db_index=True, verbose_name="Ключ сессии")
+    # Токен записи из очереди приёма: повторная выгрузка очереди после сбоя не создаёт дублей
+    ingest_token = models.CharField(
+        max_length=32, unique=True, null=True, blank=True, editable=False, verbose_name="Токен приёма"
+    )
     history = HistoricalRecords()
 
     class Meta:
         unique_together = (("user", "session_key"),)
+        indexes = [
+            models.Index(fields=["form", "submitted_at"], name="form_submission_form_date_idx"),
+            models.Index(fields=["submitted_at", "id"], name="form_submission_date_id_idx"),
+            models.Index(fields=["user", "form"], name="form_submission_user_form_idx"),
+        ]
         verbose_name = "Данные формы пользователя"
         verbose_name_plural = "Данные форм пользователей"
 
@@ -74,6 +88,20 @@ class FormSubmission(models.Model):
         super().save(*args, **kwargs)
 
 
+class UserSubmissionCount(models.Model):
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name="submission_counter", verbose_name="Пользователь"
+    )
+    count = models.IntegerField(default=0, verbose_name="Отправок")
+
+    class Meta:
+        verbose_name = "Счётчик отправок пользователя"
+        verbose_name_plural = "Счётчики отправок пользователей"
+
+    def __str__(self):
+        return f"{self.user} - {self.count}"
+
+
 class FieldValue(models.Model):
     submission = models.ForeignKey(FormSubmission, on_delete=models.CASCADE, related_name="values")
     field = models.ForeignKey(FormField, on_delete=models.CASCADE)
@@ -88,10 +116,31 @@ class FieldValue(models.Model):
         return f"{self.field.label} - {self.submission}"
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["submission", "field"], name="form_fieldvalue_submission_field_uniq"),
+        ]
         verbose_name = "Ответ из формы"
         verbose_name_plural = "Ответы из форм"
 
 
+class SubmissionChangeSet(models.Model):
+    submission = models.ForeignKey(
+        FormSubmission, on_delete=models.CASCADE, related_name="change_sets", verbose_name="Отправка"
+    )
+    changed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Изменил")
+    changed_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата изменения")
+    # Список {"field_id", "field", "old", "new"} по всем полям, изменённым за одно сохранение
+    changes = models.JSONField(default=list, verbose_name="Изменения")
+
+    class Meta:
+        ordering = ["-changed_at", "-id"]
+        verbose_name = "Изменение ответов"
+        verbose_name_plural = "Изменения ответов"
+
+    def __str__(self):
+        return f"{self.submission} - {self.changed_at}"
+
+
 class FileValue(models.Model):
     field_value = models.ForeignKey(FieldValue, on_delete=models.CASCADE, related_name="file_values")
     file = models.FileField(upload_to="forms/%Y/%m/%d/",  null=True, blank=True)
@@ -99,10 +148,104 @@ class FileValue(models.Model):
 
     caption = models.CharField(max_length=255, blank=True)
     is_image = models.BooleanField(default=False)
+    # Уменьшенная WebP-копия изображения, лежит рядом с оригиналом в подпапке thumbs/
+    thumbnail = models.FileField(max_length=255, blank=True, editable=False, verbose_name="Миниатюра")
 
     def __str__(self):
         return self.file.name
 
+    @cached_property
+    def file_url(self):
+        return self.file.url if self.file else ""
+
+    @cached_property
+    def preview_url(self):
+        return self.thumbnail.url if self.thumbnail else self.file_url
+
     class Meta:
         verbose_name = "Файл из ответа формы"
         verbose_name_plural = "Файлы из ответов на формы"
+
+
+class UploadClaim(models.Model):
+    # Объект, загруженный напрямую в хранилище: по токену его можно прикрепить только к одной отправке
+    name = models.CharField(max_length=255, unique=True, verbose_name="Имя объекта")
+    claimed_at = models.DateTimeField(auto_now_add=True, verbose_name="Прикреплён")
+
+    class Meta:
+        verbose_name = "Использованная загрузка"
+        verbose_name_plural = "Использованные загрузки"
+
+    def __str__(self):
+        return self.name
+
+
+class ChoiceStat(models.Model):
+    form = models.ForeignKey(DynamicForm, on_delete=models.CASCADE, related_name="choice_stats", verbose_name="Форма")
+    field = models.ForeignKey(FormField, on_delete=models.CASCADE, related_name="choice_stats", verbose_name="Поле")
+    choice = models.CharField(max_length=255, verbose_name="Вариант")
+    count = models.IntegerField(default=0, verbose_name="Количество")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["field", "choice"], name="form_choicestat_field_choice_uniq"),
+        ]
+        verbose_name = "Статистика варианта"
+        verbose_name_plural = "Статистика вариантов"
+
+    def __str__(self):
+        return f"{self.field.label} - {self.choice}: {self.count}"
+
+
+class ExportJob(models.Model):
+    STATUSES = (
+        ("pending", "В очереди"),
+        ("running", "Выполняется"),
+        ("done", "Готово"),
+        ("failed", "Ошибка"),
+    )
+    FORMATS = (
+        ("zip", "ZIP (Excel на каждую отправку)"),
+        ("xlsx", "XLSX (одна таблица)"),
+        ("csv", "CSV"),
+        ("jsonl", "JSONL"),
+    )
+
+    form = models.ForeignKey(DynamicForm, on_delete=models.CASCADE, related_name="export_jobs", verbose_name="Форма")
+    export_format = models.CharField(max_length=10, choices=FORMATS, default="zip", verbose_name="Формат")
+    status = models.CharField(max_length=10, choices=STATUSES, default="pending", db_index=True, verbose_name="Статус")
+    fingerprint = models.CharField(max_length=64, blank=True, db_index=True, verbose_name="Версия данных")
+    requested_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Запросил"
+    )
+    total_rows = models.PositiveIntegerField(default=0, verbose_name="Всего отправок")
+    processed_rows = models.PositiveIntegerField(default=0, verbose_name="Обработано")
+    file = models.FileField(
+        upload_to="exports/%Y/%m/%d/", storage=MinIOMediaStorage, null=True, blank=True, verbose_name="Файл"
+    )
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создан")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начат")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершён")
+
+    class Meta:
+        ordering = ["-created_at"]
+        verbose_name = "Экспорт отправок"
+        verbose_name_plural = "Экспорты отправок"
+
+    def __str__(self):
+        return f"{self.form.name} - {self.get_export_format_display()} - {self.get_status_display()}"
+
+    @property
+    def progress(self):
+        if self.status == "done":
+            return 100
+        if not self.total_rows:
+            return 0
+        return min(100, self.processed_rows * 100 // self.total_rows)
+
+    @property
+    def duration(self):
+        if not self.started_at:
+            return None
+        return (self.finished_at or timezone.now()) - self.started_at
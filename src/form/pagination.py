@@ -0,0 +1,77 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.core.cache import cache
+from django.db.models import Q
+
+
+class KeysetPage:
+    def __init__(self, object_list, has_next, has_previous, paginator):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.paginator = paginator
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def next_cursor(self):
+        return self.paginator.encode_cursor(self.object_list[-1]) if self.has_next else None
+
+    @property
+    def previous_cursor(self):
+        return self.paginator.encode_cursor(self.object_list[0]) if self.has_previous else None
+
+
+class KeysetPaginator:
+    # Страница ищется по индексу от ключа (submitted_at, id), без OFFSET и COUNT(*)
+    key_field = "submitted_at"
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def encode_cursor(self, obj):
+        raw = json.dumps([getattr(obj, self.key_field).isoformat(), obj.pk])
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            key, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return datetime.fromisoformat(key), int(pk)
+        except (binascii.Error, ValueError, TypeError):
+            return None
+
+    def get_page(self, after=None, before=None, last=False):
+        key = self.key_field
+        before = self.decode_cursor(before)
+        if before is not None or last:
+            queryset = self.queryset.order_by(f"-{key}", "-pk")
+            if before is not None:
+                value, pk = before
+                queryset = queryset.filter(Q(**{f"{key}__lte": value}) & (Q(**{f"{key}__lt": value}) | Q(pk__lt=pk)))
+            rows = list(queryset[: self.per_page + 1])
+            has_previous = len(rows) > self.per_page
+            return KeysetPage(rows[: self.per_page][::-1], before is not None, has_previous, self)
+
+        after = self.decode_cursor(after)
+        queryset = self.queryset.order_by(key, "pk")
+        if after is not None:
+            value, pk = after
+            queryset = queryset.filter(Q(**{f"{key}__gte": value}) & (Q(**{f"{key}__gt": value}) | Q(pk__gt=pk)))
+        rows = list(queryset[: self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        return KeysetPage(rows[: self.per_page], has_next, after is not None, self)
+
+
+def estimated_count(queryset, cache_key, timeout):
+    # Точный COUNT(*) на каждый запрос дорог, поэтому итог берётся из кеша и может слегка отставать
+    return cache.get_or_set(cache_key, queryset.count, timeout)
@@ -0,0 +1,119 @@
+import re
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+from .loaders import iter_batches
+from .models import FieldValue, FormSubmission
+
+SEARCH_TABLE = "form_submission_search"
+SEARCH_LIMIT = 200
+
+
+def is_fts_available():
+    return connection.vendor == "sqlite"
+
+
+def answer_text(text_value, choice_value):
+    parts = [text_value or ""]
+    if isinstance(choice_value, list):
+        parts.extend(str(choice) for choice in choice_value)
+    elif choice_value:
+        parts.append(str(choice_value))
+    return " ".join(part for part in parts if part)
+
+
+def index_submissions(submission_ids, batch_size=500):
+    if not is_fts_available():
+        return
+    # Теневая FTS5-таблица (миграция 0006): rowid совпадает с id отправки, content — все текстовые ответы и варианты
+    for ids in iter_batches(submission_ids, batch_size):
+        documents = defaultdict(list)
+        field_values = FieldValue.objects.filter(submission_id__in=ids).order_by("id")
+        for submission_id, text_value, choice_value in field_values.values_list(
+            "submission_id", "text_value", "choice_value"
+        ):
+            text = answer_text(text_value, choice_value)
+            if text:
+                documents[submission_id].append(text)
+        form_ids = dict(FormSubmission.objects.filter(pk__in=ids).values_list("pk", "form_id"))
+
+        placeholders = ", ".join(["%s"] * len(ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", ids)
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, form_id, content) VALUES (%s, %s, %s)",
+                [(pk, form_id, "\n".join(documents[pk])) for pk, form_id in form_ids.items()],
+            )
+
+
+def remove_submissions(submission_ids):
+    if not is_fts_available() or not submission_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(submission_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", list(submission_ids))
+
+
+def rebuild_search_index():
+    if not is_fts_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+    submission_ids = FormSubmission.objects.order_by("pk").values_list("pk", flat=True)
+    index_submissions(submission_ids.iterator())
+    return submission_ids.count()
+
+
+def build_match_query(query):
+    # Каждое слово ищется как префикс, спецсимволы FTS5 из запроса не проходят
+    terms = re.findall(r"\w+", query)
+    return " ".join('"{}"*'.format(term) for term in terms)
+
+
+def answer_matches(query, form_id=None):
+    # Без FTS5 — простой поиск по подстроке, без ранжирования
+    field_values = FieldValue.objects.filter(Q(text_value__icontains=query) | Q(choice_value__icontains=query))
+    if form_id:
+        field_values = field_values.filter(submission__form_id=form_id)
+    return field_values
+
+
+def search_submissions(query, form_id=None, limit=SEARCH_LIMIT, offset=0):
+    match = build_match_query(query)
+    if not match:
+        return []
+
+    if not is_fts_available():
+        ids = answer_matches(query, form_id).order_by("-submission_id").values_list("submission_id", flat=True)
+        return list(ids.distinct()[offset : offset + limit])
+
+    sql = f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s"
+    params = [match]
+    if form_id:
+        sql += " AND form_id = %s"
+        params.append(form_id)
+    sql += " ORDER BY rank LIMIT %s OFFSET %s"
+    params.extend([limit, offset])
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_filter(query):
+    # Все совпадения одним подзапросом, без лимита: для фильтрации списков, где ранжируется только начало выдачи
+    match = build_match_query(query)
+    if not match:
+        return Q(pk__in=[])
+    if not is_fts_available():
+        return Q(pk__in=answer_matches(query).values("submission_id"))
+    return Q(pk__in=RawSQL(f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", [match]))
+
+
+def rank_expression(submission_ids):
+    whens = [When(pk=pk, then=Value(position)) for position, pk in enumerate(submission_ids)]
+    if not whens:
+        return Value(0, output_field=IntegerField())
+    return Case(*whens, default=Value(len(whens)), output_field=IntegerField())
@@ -0,0 +1,276 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import DynamicForm, FormSubmission, FieldValue, FileValue, SubmissionChangeSet, UserSubmissionCount
+from .search import index_submissions, remove_submissions
+from .stats import choice_snapshot, submission_choices, update_choice_stats
+from .thumbnails import schedule_thumbnails
+from .transfers import astored_files, claim_uploads, direct_names, stored_files
+from .writer import awrite, write
+
+FILE_FIELD_TYPES = ("file", "image")
+EMPTY_VALUES = (None, "", [], (), {})
+
+
+def field_value_data(field, value):
+    if field.field_type == "checkbox":
+        return {"choice_value": value}
+    if field.field_type == "select":
+        # Пустой выбор — отсутствие ответа, а не [""], который попал бы в счётчики вариантов
+        return {"choice_value": None if value in EMPTY_VALUES else [value]}
+    return {"text_value": value}
+
+
+def touch_form_data(form_id):
+    # Версия ответов формы: по ней фоновый экспорт понимает, что данные не менялись
+    DynamicForm.objects.filter(pk=form_id).update(data_version=F("data_version") + 1)
+
+
+def bump_schema_version(form_id):
+    # Версия схемы — ключ кеша классов форм и фрагментов страницы. Сигнал FormField вызывает её на каждое поле,
+    # а bulk_create и bulk_update сигналов не шлют, поэтому после них её нужно вызвать явно
+    DynamicForm.objects.filter(pk=form_id).update(schema_version=F("schema_version") + 1, updated_at=timezone.now())
+
+
+def count_submission(form_id, user_id, delta):
+    # Денормализованные счётчики для админки; версия ответов меняется тем же UPDATE
+    DynamicForm.objects.filter(pk=form_id).update(
+        data_version=F("data_version") + 1, submissions_count=F("submissions_count") + delta
+    )
+    if user_id is None:
+        return
+    if delta > 0:
+        UserSubmissionCount.objects.bulk_create([UserSubmissionCount(user_id=user_id)], ignore_conflicts=True)
+    UserSubmissionCount.objects.filter(user_id=user_id).update(count=F("count") + delta)
+
+
+def delete_submissions(submissions):
+    # Счётчики вариантов, число отправок и поисковый индекс обновляются раз на пачку, а не сигналом на каждую строку
+    with transaction.atomic():
+        rows = list(submissions.order_by().values_list("pk", "form_id", "user_id"))
+        ids = [pk for pk, _, _ in rows]
+        by_form = defaultdict(list)
+        for pk, form_id, _ in rows:
+            by_form[form_id].append(pk)
+        # Ответы ещё в базе: вычитаем их из счётчиков вариантов до каскадного удаления
+        for form_id, form_submission_ids in by_form.items():
+            update_choice_stats(form_id, submission_choices(form_submission_ids), [])
+        FormSubmission.objects.filter(pk__in=ids).delete()
+        for (form_id, user_id), count in Counter((form_id, user_id) for _, form_id, user_id in rows).items():
+            count_submission(form_id, user_id, -count)
+        remove_submissions(ids)
+    return len(ids)
+
+
+def forget_form_submissions(form_id):
+    # Отправки уходят каскадом вместе с формой, её счётчики вариантов тоже; остаются счётчики пользователей и индекс
+    submissions = FormSubmission.objects.filter(form_id=form_id)
+    per_user = submissions.filter(user__isnull=False).order_by().values_list("user").annotate(Count("pk"))
+    for user_id, count in per_user:
+        UserSubmissionCount.objects.filter(user_id=user_id).update(count=F("count") - count)
+    remove_submissions(list(submissions.values_list("pk", flat=True)))
+
+
+def recount_submissions():
+    submissions = FormSubmission.objects.filter(form=OuterRef("pk")).order_by().values("form")
+    DynamicForm.objects.update(
+        submissions_count=Coalesce(Subquery(submissions.annotate(total=Count("pk")).values("total")), 0)
+    )
+    UserSubmissionCount.objects.all().delete()
+    per_user = FormSubmission.objects.filter(user__isnull=False).order_by().values_list("user").annotate(Count("pk"))
+    UserSubmissionCount.objects.bulk_create(
+        [UserSubmissionCount(user_id=user_id, count=count) for user_id, count in per_user], batch_size=500
+    )
+
+
+class SubmissionDraft:
+    # Ответы новой отправки и файлы к загрузке; собираются до обращения к хранилищу и базе
+    def __init__(self, dynamic_form, form, files):
+        self.dynamic_form = dynamic_form
+        self.field_values = []
+        self.uploads = []
+        for field in form.form_fields:
+            if field.is_hidden:
+                continue
+
+            if field.field_type in FILE_FIELD_TYPES:
+                field_value = FieldValue(field=field)
+                for uploaded_file in files.getlist(field.label):
+                    self.uploads.append((field_value, uploaded_file, field.field_type == "image"))
+            else:
+                field_value = FieldValue(field=field, **field_value_data(field, form.cleaned_data.get(field.label)))
+            self.field_values.append(field_value)
+
+    @property
+    def files(self):
+        return [uploaded_file for _, uploaded_file, _ in self.uploads]
+
+    def save(self, names, user=None, session_key=""):
+        with transaction.atomic():
+            claim_uploads(direct_names(self.files))
+            submission = FormSubmission.objects.create(form=self.dynamic_form, user=user, session_key=session_key)
+            for field_value in self.field_values:
+                # Повторная запись после отката пачки не должна переиспользовать id из прошлой попытки
+                field_value.pk = None
+                field_value.submission = submission
+            FieldValue.objects.bulk_create(self.field_values)
+            file_values = FileValue.objects.bulk_create(
+                FileValue(field_value=field_value, file=name, is_image=is_image)
+                for (field_value, _, is_image), name in zip(self.uploads, names)
+            )
+            schedule_thumbnails(file_value.pk for file_value in file_values if file_value.is_image)
+            update_choice_stats(self.dynamic_form.pk, [], choice_snapshot(self.field_values))
+            index_submissions([submission.pk])
+            count_submission(self.dynamic_form.pk, submission.user_id, 1)
+        return submission
+
+
+class SubmissionUpdate:
+    # Разница между сохранёнными ответами и отправленной формой правки
+    def __init__(self, submission, field_values, form, files):
+        self.submission = submission
+        self.existing_values = {field_value.field_id: field_value for field_value in field_values}
+        self.choices_before = choice_snapshot(self.existing_values.values())
+        self.new_values = []
+        self.changed_values = []
+        self.deleted_value_ids = []
+        self.replaced_file_value_ids = []
+        self.uploads = []
+
+        for field in form.form_fields:
+            if field.is_locked or field.is_hidden:
+                continue  # 🔒 Игнорируем заблокированные и скрытые поля
+
+            field_value = self.existing_values.get(field.pk)
+            value = form.cleaned_data.get(field.label)
+
+            if field.field_type in FILE_FIELD_TYPES:
+                uploaded_files = files.getlist(field.label)
+                if value is False:
+                    # Пользователь отметил «Очистить»
+                    if field_value:
+                        self.deleted_value_ids.append(field_value.pk)
+                    continue
+                if not uploaded_files:
+                    continue  # Новых файлов нет — хранилище не трогаем
+
+                if field_value is None:
+                    field_value = FieldValue(submission=submission, field=field)
+                    self.new_values.append(field_value)
+                else:
+                    self.replaced_file_value_ids.append(field_value.pk)
+                for uploaded_file in uploaded_files:
+                    self.uploads.append((field_value, uploaded_file, field.field_type == "image"))
+                continue
+
+            # Удаление, если значение пустое
+            if value in EMPTY_VALUES:
+                if field_value:
+                    self.deleted_value_ids.append(field_value.pk)
+                continue
+
+            data = field_value_data(field, value)
+            if field_value is None:
+                self.new_values.append(FieldValue(submission=submission, field=field, **data))
+            elif any(getattr(field_value, name) != new for name, new in data.items()):
+                for name, new in data.items():
+                    setattr(field_value, name, new)
+                self.changed_values.append(field_value)
+
+    @property
+    def files(self):
+        return [uploaded_file for _, uploaded_file, _ in self.uploads]
+
+    def save(self, names):
+        submission = self.submission
+        with transaction.atomic():
+            claim_uploads(direct_names(self.files))
+            if self.deleted_value_ids:
+                FieldValue.objects.filter(pk__in=self.deleted_value_ids).delete()
+            if self.replaced_file_value_ids:
+                FileValue.objects.filter(field_value_id__in=self.replaced_file_value_ids).delete()
+            for field_value in self.new_values:
+                field_value.pk = None
+            FieldValue.objects.bulk_create(self.new_values)
+            if self.changed_values:
+                FieldValue.objects.bulk_update(self.changed_values, ["text_value", "choice_value"])
+            file_values = FileValue.objects.bulk_create(
+                FileValue(field_value=field_value, file=name, is_image=is_image)
+                for (field_value, _, is_image), name in zip(self.uploads, names)
+            )
+            schedule_thumbnails(file_value.pk for file_value in file_values if file_value.is_image)
+            kept_values = [value for value in self.existing_values.values() if value.pk not in self.deleted_value_ids]
+            update_choice_stats(submission.form_id, self.choices_before, choice_snapshot(kept_values + self.new_values))
+            index_submissions([submission.pk])
+
+        touch_form_data(submission.form_id)
+        return submission
+
+
+def create_submission(dynamic_form, form, files, user=None, session_key=""):
+    draft = SubmissionDraft(dynamic_form, form, files)
+    # Файлы загружаются в хранилище до транзакции, строки FileValue пишутся только после успеха всех загрузок
+    with stored_files(draft.files) as names:
+        return write(draft.save, names, user=user, session_key=session_key)
+
+
+async def acreate_submission(dynamic_form, form, files, user=None, session_key=""):
+    draft = SubmissionDraft(dynamic_form, form, files)
+    async with astored_files(draft.files) as names:
+        return await awrite(draft.save, names, user=user, session_key=session_key)
+
+
+def update_submission(submission, form, files):
+    update = SubmissionUpdate(submission, submission.values.all(), form, files)
+    with stored_files(update.files) as names:
+        return write(update.save, names)
+
+
+async def aupdate_submission(submission, form, files):
+    field_values = [field_value async for field_value in submission.values.all()]
+    update = SubmissionUpdate(submission, field_values, form, files)
+    async with astored_files(update.files) as names:
+        return await awrite(update.save, names)
+
+
+def posted_field_value_data(field, data, key):
+    # Значение поля из формы правки администратора; отсутствующий ключ означает «без изменений»,
+    # кроме checkbox, где пустой выбор просто не попадает в POST
+    if field.field_type == "checkbox":
+        return field_value_data(field, data.getlist(key))
+    if field.field_type in ("text", "textarea", "select") and key in data:
+        return field_value_data(field, data.get(key))
+    return {}
+
+
+def apply_admin_changes(submission, field_values, data, user=None):
+    choices_before = choice_snapshot(field_values)
+    changed_values = []
+    changed_fields = set()
+    changes = []
+    for field_value in field_values:
+        for name, new in posted_field_value_data(field_value.field, data, f"field_{field_value.pk}").items():
+            old = getattr(field_value, name)
+            if old == new:
+                continue
+            setattr(field_value, name, new)
+            changed_values.append(field_value)
+            changed_fields.add(name)
+            changes.append({"field_id": field_value.field_id, "field": field_value.field.label, "old": old, "new": new})
+
+    if not changes:
+        return changes
+
+    with transaction.atomic():
+        # Обновляются только затронутые колонки: CASE по каждой колонке собирается на все строки пакета
+        FieldValue.objects.bulk_update(changed_values, sorted(changed_fields))
+        SubmissionChangeSet.objects.create(submission=submission, changed_by=user, changes=changes)
+        update_choice_stats(submission.form_id, choices_before, choice_snapshot(field_values))
+        index_submissions([submission.pk])
+
+    touch_form_data(submission.form_id)
+    return changes
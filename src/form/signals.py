@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import DynamicForm, FormField
+from .services import bump_schema_version, forget_form_submissions
+
+
+@receiver(post_save, sender=FormField)
+@receiver(post_delete, sender=FormField)
+def form_field_changed(sender, instance, **kwargs):
+    bump_schema_version(instance.form_id)
+
+
+# Отправки удаляются через services.delete_submissions: сигналы на каждую строку отключали быстрое удаление
+# и стоили нескольких запросов на отправку. Каскад от формы обрабатывается один раз на форму
+@receiver(pre_delete, sender=DynamicForm)
+def dynamic_form_deleting(sender, instance, **kwargs):
+    forget_form_submissions(instance.pk)
@@ -0,0 +1,99 @@
+// Прямая загрузка файлов в хранилище: браузер получает подписанную ссылку у Django,
+// отправляет файл в бакет, а в форму кладёт только подписанный токен загруженного объекта.
+(function () {
+  "use strict";
+
+  var UPLOAD_SUFFIX = "__upload";
+
+  function csrfToken(form) {
+    var input = form.querySelector("input[name=csrfmiddlewaretoken]");
+    return input ? input.value : "";
+  }
+
+  function requestTicket(form, input, file) {
+    var data = new FormData();
+    data.append("field", input.name);
+    data.append("filename", file.name);
+    data.append("content_type", file.type || "");
+    return fetch(form.dataset.uploadUrl, {
+      method: "POST",
+      body: data,
+      headers: {"X-CSRFToken": csrfToken(form)},
+      credentials: "same-origin",
+    }).then(function (response) {
+      return response.json().then(function (ticket) {
+        if (!response.ok) {
+          throw new Error(ticket.error || "Не удалось подготовить загрузку");
+        }
+        return ticket;
+      });
+    });
+  }
+
+  function uploadFile(ticket, file) {
+    var data = new FormData();
+    Object.keys(ticket.fields).forEach(function (name) {
+      data.append(name, ticket.fields[name]);
+    });
+    data.append("file", file);
+    return fetch(ticket.url, {method: "POST", body: data}).then(function (response) {
+      if (!response.ok) {
+        throw new Error("Хранилище отклонило файл " + file.name);
+      }
+      return ticket.token;
+    });
+  }
+
+  function addToken(form, input, token) {
+    var hidden = document.createElement("input");
+    hidden.type = "hidden";
+    hidden.name = input.name + UPLOAD_SUFFIX;
+    hidden.value = token;
+    form.appendChild(hidden);
+  }
+
+  function uploadInput(form, input) {
+    var files = Array.prototype.slice.call(input.files);
+    return Promise.all(
+      files.map(function (file) {
+        return requestTicket(form, input, file).then(function (ticket) {
+          return uploadFile(ticket, file);
+        });
+      })
+    ).then(function (tokens) {
+      tokens.forEach(function (token) {
+        addToken(form, input, token);
+      });
+      // Сами файлы больше не отправляются через Django
+      input.value = "";
+    });
+  }
+
+  document.querySelectorAll("form[data-upload-url]").forEach(function (form) {
+    form.addEventListener("submit", function (event) {
+      var inputs = Array.prototype.filter.call(form.querySelectorAll("input[type=file]"), function (input) {
+        return input.files.length > 0;
+      });
+      if (!inputs.length) {
+        return;
+      }
+      event.preventDefault();
+      var buttons = form.querySelectorAll("button[type=submit]");
+      buttons.forEach(function (button) {
+        button.disabled = true;
+      });
+      Promise.all(inputs.map(function (input) {
+        return uploadInput(form, input);
+      }))
+        .then(function () {
+          form.submit();
+        })
+        .catch(function (error) {
+          alert(error.message);
+          buttons.forEach(function (button) {
+            button.disabled = false;
+          });
+        });
+    });
+  });
+})();
@@ -0,0 +1,79 @@
+from collections import Counter
+
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+from .models import ChoiceStat, FieldValue
+
+CHOICE_MAX_LENGTH = ChoiceStat._meta.get_field("choice").max_length
+
+
+def choice_counts(values):
+    # values — пары (field_id, choice_value); select хранится как [значение], checkbox — как список
+    counts = Counter()
+    for field_id, choice_value in values:
+        if not isinstance(choice_value, list):
+            choice_value = [] if choice_value in (None, "") else [choice_value]
+        counts.update((field_id, choice[:CHOICE_MAX_LENGTH]) for choice in set(map(str, choice_value)))
+    return counts
+
+
+def choice_snapshot(field_values):
+    return [(field_value.field_id, field_value.choice_value) for field_value in field_values]
+
+
+def submission_choices(submission_ids):
+    return FieldValue.objects.filter(submission_id__in=submission_ids, choice_value__isnull=False).values_list(
+        "field_id", "choice_value"
+    )
+
+
+def apply_choice_deltas(form_id, deltas):
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    # Недостающие строки создаются с нулём, затем все счётчики меняются одним UPDATE
+    ChoiceStat.objects.bulk_create(
+        [ChoiceStat(form_id=form_id, field_id=field_id, choice=choice) for field_id, choice in deltas],
+        ignore_conflicts=True,
+    )
+    lookup = Q()
+    whens = []
+    for (field_id, choice), delta in deltas.items():
+        lookup |= Q(field_id=field_id, choice=choice)
+        whens.append(When(field_id=field_id, choice=choice, then=Value(delta)))
+    ChoiceStat.objects.filter(lookup).update(
+        count=F("count") + Case(*whens, default=Value(0), output_field=IntegerField())
+    )
+
+
+def update_choice_stats(form_id, before, after):
+    deltas = choice_counts(after)
+    deltas.subtract(choice_counts(before))
+    apply_choice_deltas(form_id, deltas)
+
+
+def rebuild_choice_stats(form_ids=None):
+    stats = ChoiceStat.objects.all()
+    field_values = FieldValue.objects.filter(choice_value__isnull=False)
+    if form_ids is not None:
+        stats = stats.filter(form_id__in=form_ids)
+        field_values = field_values.filter(field__form_id__in=form_ids)
+
+    counts = Counter()
+    form_by_field = {}
+    for field_id, form_id, choice_value in field_values.values_list(
+        "field_id", "field__form_id", "choice_value"
+    ).iterator():
+        form_by_field[field_id] = form_id
+        counts.update(choice_counts([(field_id, choice_value)]))
+
+    stats.delete()
+    ChoiceStat.objects.bulk_create(
+        [
+            ChoiceStat(form_id=form_by_field[field_id], field_id=field_id, choice=choice, count=count)
+            for (field_id, choice), count in counts.items()
+        ],
+        batch_size=500,
+    )
+    return len(counts)
@@ -0,0 +1,151 @@
+import io
+import random
+from datetime import timedelta
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils import timezone
+from PIL import Image
+
+from .loaders import iter_batches
+from .models import DynamicForm, FieldValue, FileValue, FormField, FormSubmission
+from .search import index_submissions
+from .services import FILE_FIELD_TYPES, bump_schema_version, field_value_data, recount_submissions
+from .stats import rebuild_choice_stats
+from .thumbnails import generate_thumbnails
+from .transfers import store_files
+
+# Синтетические формы отличаются по имени, по нему же их находят бенчмарк и --clear
+SEED_PREFIX = "[seed] "
+
+FIELD_LABELS = {
+    "text": ["Фамилия", "Имя", "Город", "Телефон", "Email"],
+    "textarea": ["О себе", "Мотивационное письмо", "Опыт работы"],
+    "select": ["Направление", "Форма обучения", "Уровень английского"],
+    "checkbox": ["Интересы", "Языки программирования", "Удобное время"],
+    "file": ["Резюме", "Диплом", "Портфолио"],
+    "image": ["Фото", "Скан паспорта"],
+}
+CHOICES = ["Первый вариант", "Второй вариант", "Третий вариант", "Четвёртый вариант", "Пятый вариант"]
+WORDS = (
+    "студент проект опыт команда город работа задача программа курс практика олимпиада университет исследование "
+    "разработка анализ данные система интерес результат конференция"
+).split()
+
+
+def fake_text(rnd, words):
+    return " ".join(rnd.choices(WORDS, k=words)).capitalize()
+
+
+def fake_answer(field, rnd):
+    if field.field_type == "text":
+        return fake_text(rnd, rnd.randint(1, 3))
+    if field.field_type == "textarea":
+        return fake_text(rnd, rnd.randint(20, 120))
+    if field.field_type == "select":
+        return rnd.choice(field.choices)
+    if field.field_type == "checkbox":
+        return rnd.sample(field.choices, rnd.randint(1, len(field.choices)))
+    return None
+
+
+def fake_png(rnd, size=(320, 240)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, tuple(rnd.randrange(256) for _ in range(3))).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def fake_upload(field, rnd, file_size):
+    if field.field_type == "image":
+        return SimpleUploadedFile(f"photo-{rnd.randrange(10**6)}.png", fake_png(rnd), "image/png")
+    return SimpleUploadedFile(f"resume-{rnd.randrange(10**6)}.pdf", rnd.randbytes(file_size), "application/pdf")
+
+
+def fake_post_data(form_fields, rnd, file_size=16 * 1024):
+    data = {}
+    for field in form_fields:
+        if field.is_hidden or field.is_locked:
+            continue
+        if field.field_type in FILE_FIELD_TYPES:
+            data[field.label] = fake_upload(field, rnd, file_size)
+        else:
+            data[field.label] = fake_answer(field, rnd)
+    return data
+
+
+def create_fields(dynamic_form, count):
+    field_types = [field_type for field_type, _ in FormField.FIELD_TYPES]
+    fields = []
+    for order in range(count):
+        field_type = field_types[order % len(field_types)]
+        labels = FIELD_LABELS[field_type]
+        fields.append(
+            FormField(
+                form=dynamic_form,
+                label=f"{labels[order // len(field_types) % len(labels)]} {order + 1}",
+                field_type=field_type,
+                choices=CHOICES if field_type in ("select", "checkbox") else None,
+                order=order,
+            )
+        )
+    fields = FormField.objects.bulk_create(fields)
+    bump_schema_version(dynamic_form.pk)
+    return fields
+
+
+def seed_submissions(dynamic_form, fields, count, rnd, file_ratio=0.5, file_size=16 * 1024, days=60):
+    # Отправки распределены по последним days дням, чтобы списки и пагинация работали на реальном разбросе дат
+    now = timezone.now()
+    submission_ids = []
+    image_ids = []
+    for batch in iter_batches(range(count), 500):
+        submissions = FormSubmission.objects.bulk_create(
+            FormSubmission(form=dynamic_form, session_key=f"seed-{rnd.getrandbits(64):016x}") for _ in batch
+        )
+        for submission in submissions:
+            submission.submitted_at = now - timedelta(seconds=rnd.randrange(days * 24 * 3600))
+        FormSubmission.objects.bulk_update(submissions, ["submitted_at"])
+
+        field_values = []
+        uploads = []
+        for submission in submissions:
+            for field in fields:
+                if field.field_type in FILE_FIELD_TYPES:
+                    if rnd.random() >= file_ratio:
+                        continue
+                    field_value = FieldValue(submission=submission, field=field)
+                    uploads.append((field_value, fake_upload(field, rnd, file_size), field.field_type == "image"))
+                else:
+                    data = field_value_data(field, fake_answer(field, rnd))
+                    field_value = FieldValue(submission=submission, field=field, **data)
+                field_values.append(field_value)
+        FieldValue.objects.bulk_create(field_values)
+
+        names, _ = store_files([uploaded_file for _, uploaded_file, _ in uploads])
+        file_values = FileValue.objects.bulk_create(
+            FileValue(field_value=field_value, file=name, is_image=is_image)
+            for (field_value, _, is_image), name in zip(uploads, names)
+        )
+        submission_ids.extend(submission.pk for submission in submissions)
+        image_ids.extend(file_value.pk for file_value in file_values if file_value.is_image)
+    return submission_ids, image_ids
+
+
+def seed_dataset(forms, fields, submissions, file_ratio=0.5, file_size=16 * 1024, seed=0):
+    rnd = random.Random(seed)
+    form_ids = []
+    submission_ids = []
+    image_ids = []
+    for number in range(1, forms + 1):
+        dynamic_form = DynamicForm.objects.create(name=f"{SEED_PREFIX}Анкета {number}")
+        form_fields = create_fields(dynamic_form, fields)
+        ids, images = seed_submissions(dynamic_form, form_fields, submissions, rnd, file_ratio, file_size)
+        form_ids.append(dynamic_form.pk)
+        submission_ids.extend(ids)
+        image_ids.extend(images)
+
+    # Отправки созданы в обход сервисов, поэтому производные данные пересчитываются одним проходом
+    rebuild_choice_stats(form_ids)
+    recount_submissions()
+    index_submissions(submission_ids)
+    generate_thumbnails(image_ids)
+    return form_ids, submission_ids
@@ -0,0 +1,1170 @@
+import asyncio
+import csv
+import importlib.util
+import json
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.files.storage import InMemoryStorage, default_storage
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+from django.utils import timezone
+from django.utils.datastructures import MultiValueDict
+from openpyxl import load_workbook
+from PIL import Image
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from .exporter import FormSubmissionExporter, FormTableExporter, ParallelSubmissionExporter, get_submission_exporter
+from .forms import form_class_cache, get_form_class
+from .ingest import drain_queue, get_queue, write_entries
+from .jobs import claim_next_job, run_export_job, start_export_job
+from .loaders import SubmissionBatchLoader
+from .media import storage_urls
+from .models import (
+    DynamicForm,
+    ExportJob,
+    FieldValue,
+    FileValue,
+    FormField,
+    FormSubmission,
+    SubmissionChangeSet,
+    UploadClaim,
+    UserSubmissionCount,
+)
+from .pagination import KeysetPaginator
+from .search import index_submissions, search_submissions
+from .services import (
+    apply_admin_changes,
+    count_submission,
+    create_submission,
+    delete_submissions,
+    touch_form_data,
+    update_submission,
+)
+from .stats import rebuild_choice_stats
+from .synthetic import create_fields
+from .thumbnails import thumbnail_name
+from .transfers import save_file
+from .views import AdminSubmissionListView, AsyncDynamicFormSubmissionView, AsyncFormSubmissionUpdateView
+from .writer import SubmissionWriter, awrite
+
+
+@skipUnless(connection.vendor == "sqlite", "План запроса проверяется на SQLite")
+class SubmissionQueryPlanTests(TestCase):
+    def assertSearchUsingIndex(self, queryset, index, columns):
+        plan = queryset.explain()
+        self.assertNotRegex(plan, r"\bSCAN\b", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+        self.assertRegex(plan, rf"SEARCH \w+ USING (COVERING )?INDEX {index} \({columns}\)", plan)
+
+    def test_field_value_lookup_uses_unique_index(self):
+        queryset = FieldValue.objects.filter(submission_id=1, field_id=1)
+        self.assertSearchUsingIndex(queryset, r"\w+", r"submission_id=\? AND field_id=\?")
+
+    def test_form_submissions_by_date_use_composite_index(self):
+        queryset = FormSubmission.objects.filter(form_id=1).order_by("submitted_at")
+        self.assertSearchUsingIndex(queryset, "form_submission_form_date_idx", r"form_id=\?")
+
+    def test_user_finished_forms_use_covering_index(self):
+        queryset = FormSubmission.objects.filter(user_id=1).values_list("form_id", flat=True)
+        self.assertSearchUsingIndex(queryset, "form_submission_user_form_idx", r"user_id=\?")
+
+    def test_user_form_lookup_uses_composite_index(self):
+        queryset = FormSubmission.objects.filter(user_id=1, form_id=1)
+        self.assertSearchUsingIndex(queryset, "form_submission_user_form_idx", r"user_id=\? AND form_id=\?")
+
+
+class FieldValueDeduplicationMigrationTests(TransactionTestCase):
+    migrate_from = [("form", "0003_export_jobs")]
+    migrate_to = [("form", "0004_submission_indexes")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_duplicates_are_merged_into_latest_value(self):
+        apps = self.migrate(self.migrate_from)
+        form = apps.get_model("form", "DynamicForm").objects.create(name="Анкета")
+        field = apps.get_model("form", "FormField").objects.create(form=form, label="Фото", field_type="file")
+        submission = apps.get_model("form", "FormSubmission").objects.create(form=form, session_key="abc")
+        OldFieldValue = apps.get_model("form", "FieldValue")
+        first = OldFieldValue.objects.create(submission=submission, field=field)
+        latest = OldFieldValue.objects.create(submission=submission, field=field)
+        apps.get_model("form", "FileValue").objects.create(field_value=first, file="forms/a.jpg")
+
+        apps = self.migrate(self.migrate_to)
+
+        NewFieldValue = apps.get_model("form", "FieldValue")
+        self.assertEqual(list(NewFieldValue.objects.values_list("pk", flat=True)), [latest.pk])
+        self.assertEqual(apps.get_model("form", "FileValue").objects.get().field_value_id, latest.pk)
+
+
+@override_settings(
+    STORAGES={
+        "default": {"BACKEND": "django.core.files.storage.InMemoryStorage"},
+        "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    },
+    FORM_THUMBNAIL_WORKERS=0,
+)
+class SubmissionServiceTests(TestCase):
+    def setUp(self):
+        self.form = DynamicForm.objects.create(name="Анкета")
+        self.name = FormField.objects.create(form=self.form, label="Имя", field_type="text", order=1)
+        self.color = FormField.objects.create(
+            form=self.form, label="Цвет", field_type="select", choices=["Синий", "Красный"], order=2
+        )
+        self.langs = FormField.objects.create(
+            form=self.form, label="Языки", field_type="checkbox", choices=["Python", "Go"], order=3
+        )
+        self.resume = FormField.objects.create(form=self.form, label="Резюме", field_type="file", order=4)
+
+    def bound_form(self, data, files=None):
+        form = get_form_class(self.form)(data, files or {})
+        self.assertTrue(form.is_valid(), form.errors)
+        return form
+
+    def create(self, data, files=None, session_key="session"):
+        files = MultiValueDict(
+            {label: value if isinstance(value, list) else [value] for label, value in (files or {}).items()}
+        )
+        return create_submission(self.form, self.bound_form(data, files), files, session_key=session_key)
+
+    def answers(self, submission):
+        return {
+            field_value.field.label: field_value.text_value
+            or field_value.choice_value
+            or field_value.files[0].file.name
+            for field_value in submission.values.select_related("field").prefetch_related("file_values")
+        }
+
+    def test_create_saves_answers_files_and_derived_data(self):
+        resume = SimpleUploadedFile("resume.pdf", b"%PDF", "application/pdf")
+        submission = self.create(
+            {"Имя": "Иван", "Цвет": "Синий", "Языки": ["Python", "Go"]}, {"Резюме": resume}, session_key="abc"
+        )
+
+        self.assertEqual(submission.session_key, "abc")
+        answers = self.answers(submission)
+        self.assertEqual(answers["Имя"], "Иван")
+        self.assertEqual(answers["Цвет"], ["Синий"])
+        self.assertEqual(sorted(answers["Языки"]), ["Go", "Python"])
+        self.assertTrue(default_storage.exists(answers["Резюме"]))
+
+        self.form.refresh_from_db()
+        self.assertEqual((self.form.submissions_count, self.form.data_version), (1, 1))
+        self.assertEqual(search_submissions("иван", form_id=self.form.pk), [submission.pk])
+        self.assertEqual(
+            set(self.form.choice_stats.values_list("choice", "count")), {("Синий", 1), ("Python", 1), ("Go", 1)}
+        )
+
+    def update(self, submission, data, files=None):
+        files = MultiValueDict(
+            {label: value if isinstance(value, list) else [value] for label, value in (files or {}).items()}
+        )
+        return update_submission(submission, self.bound_form(data, files), files)
+
+    def test_update_keeps_untouched_file_and_diffs_answers(self):
+        resume = SimpleUploadedFile("resume.pdf", b"%PDF", "application/pdf")
+        submission = self.create({"Имя": "Иван", "Цвет": "Синий", "Языки": ["Go"]}, {"Резюме": resume})
+        file_value = FileValue.objects.get()
+        name_value = submission.values.get(field=self.name)
+
+        self.update(submission, {"Имя": "Пётр", "Цвет": "Синий"})
+
+        answers = self.answers(submission)
+        self.assertEqual(answers, {"Имя": "Пётр", "Цвет": ["Синий"], "Резюме": file_value.file.name})
+        # Изменённый ответ обновляется на месте, файл без новой загрузки не трогается
+        self.assertEqual(submission.values.get(field=self.name).pk, name_value.pk)
+        self.assertEqual(list(FileValue.objects.values_list("pk", flat=True)), [file_value.pk])
+
+    def test_update_replaces_and_clears_files(self):
+        resume = SimpleUploadedFile("resume.pdf", b"%PDF", "application/pdf")
+        submission = self.create({"Имя": "Иван"}, {"Резюме": resume})
+        old_file = FileValue.objects.get()
+
+        self.update(
+            submission, {"Имя": "Иван"}, {"Резюме": SimpleUploadedFile("new.pdf", b"%PDF-2", "application/pdf")}
+        )
+        new_file = FileValue.objects.get()
+        self.assertNotEqual(new_file.pk, old_file.pk)
+        self.assertEqual(new_file.field_value_id, old_file.field_value_id)
+
+        self.update(submission, {"Имя": "Иван", "Резюме-clear": "on"})
+        self.assertFalse(FileValue.objects.exists())
+        self.assertFalse(submission.values.filter(field=self.resume).exists())
+        self.assertEqual(self.answers(submission), {"Имя": "Иван"})
+
+    def test_edit_page_offers_to_clear_stored_file(self):
+        resume = SimpleUploadedFile("resume.pdf", b"%PDF", "application/pdf")
+        submission = self.create({"Имя": "Иван"}, {"Резюме": resume})
+        url = reverse("form_submission_edit", args=[submission.pk])
+
+        response = self.client.get(url)
+        self.assertContains(response, FileValue.objects.get().file.url)
+        self.assertContains(response, 'name="Резюме-clear"')
+
+        response = self.client.post(url, {"Имя": "Иван", "Резюме-clear": "on"})
+        self.assertRedirects(response, reverse("form_submission_detail", args=[submission.pk]))
+        self.assertFalse(FileValue.objects.exists())
+
+    @override_settings(FORM_UPLOAD_WORKERS=3)
+    def test_failed_upload_removes_files_already_stored(self):
+        files = [SimpleUploadedFile(f"{name}.pdf", b"%PDF", "application/pdf") for name in ("a", "b", "сбой", "c")]
+        saved = []
+
+        def save(uploaded_file):
+            if uploaded_file.name == "сбой.pdf":
+                raise OSError("хранилище недоступно")
+            saved.append(save_file(uploaded_file))
+            return saved[-1]
+
+        with mock.patch("form.transfers.save_file", side_effect=save):
+            with self.assertRaises(OSError):
+                self.create({"Имя": "Иван"}, {"Резюме": files})
+
+        self.assertEqual(len(saved), 3)
+        self.assertFalse([name for name in saved if default_storage.exists(name)])
+        self.assertFalse(FormSubmission.objects.exists())
+
+    def test_failed_write_removes_stored_files(self):
+        resume = SimpleUploadedFile("resume.pdf", b"%PDF", "application/pdf")
+        saved = []
+
+        with mock.patch("form.transfers.save_file", side_effect=lambda f: saved.append(save_file(f)) or saved[-1]):
+            with mock.patch("form.services.index_submissions", side_effect=RuntimeError("сбой")):
+                with self.assertRaises(RuntimeError):
+                    self.create({"Имя": "Иван"}, {"Резюме": resume})
+
+        self.assertEqual(len(saved), 1)
+        self.assertFalse(default_storage.exists(saved[0]))
+        self.assertFalse(FileValue.objects.exists())
+
+    def test_image_upload_gets_thumbnail(self):
+        FormField.objects.create(form=self.form, label="Фото", field_type="image", order=5)
+        self.form.refresh_from_db()
+        original = BytesIO()
+        Image.new("RGB", (1200, 300), "red").save(original, "PNG")
+        photo = SimpleUploadedFile("фото.png", original.getvalue(), "image/png")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create({"Имя": "Иван"}, {"Фото": photo})
+
+        file_value = FileValue.objects.get()
+        self.assertTrue(file_value.is_image)
+        self.assertEqual(file_value.thumbnail.name, thumbnail_name(file_value.file.name))
+        with default_storage.open(file_value.thumbnail.name) as thumbnail, Image.open(thumbnail) as image:
+            self.assertEqual((image.format, image.size), ("WEBP", (600, 150)))
+
+    def choice_stats(self):
+        return {
+            (field_id, choice): count
+            for field_id, choice, count in self.form.choice_stats.filter(count__gt=0).values_list(
+                "field_id", "choice", "count"
+            )
+        }
+
+    def test_choice_stats_stay_exact_across_create_edit_delete(self):
+        first = self.create({"Цвет": "Синий", "Языки": ["Python", "Go"]}, session_key="first")
+        second = self.create({"Цвет": "Синий", "Языки": ["Python"]}, session_key="second")
+        self.create({"Цвет": "Красный"}, session_key="third")
+
+        self.update(first, {"Цвет": "Красный", "Языки": ["Go"]})
+        delete_submissions(FormSubmission.objects.filter(pk=second.pk))
+
+        expected = {(self.color.pk, "Красный"): 2, (self.langs.pk, "Go"): 1}
+        self.assertEqual(self.choice_stats(), expected)
+        # Счётчики, которые вели дельты, совпадают с пересчётом с нуля
+        rebuild_choice_stats([self.form.pk])
+        self.assertEqual(self.choice_stats(), expected)
+
+    def test_admin_changes_are_logged_and_keep_stats_exact(self):
+        submission = self.create({"Имя": "Иван", "Цвет": "Синий", "Языки": ["Go"]})
+        field_values = list(submission.values.select_related("field").order_by("field__order"))
+        name, color, langs, _ = field_values
+        data = MultiValueDict(
+            {f"field_{name.pk}": ["Пётр"], f"field_{color.pk}": [""], f"field_{langs.pk}": ["Python", "Go"]}
+        )
+
+        apply_admin_changes(submission, field_values, data)
+
+        self.assertEqual(
+            SubmissionChangeSet.objects.get(submission=submission).changes,
+            [
+                {"field_id": self.name.pk, "field": "Имя", "old": "Иван", "new": "Пётр"},
+                {"field_id": self.color.pk, "field": "Цвет", "old": ["Синий"], "new": None},
+                {"field_id": self.langs.pk, "field": "Языки", "old": ["Go"], "new": ["Python", "Go"]},
+            ],
+        )
+        self.assertIsNone(submission.values.get(field=self.color).choice_value)
+        expected = {(self.langs.pk, "Python"): 1, (self.langs.pk, "Go"): 1}
+        self.assertEqual(self.choice_stats(), expected)
+        rebuild_choice_stats([self.form.pk])
+        self.assertEqual(self.choice_stats(), expected)
+
+
+class FormClassCacheTests(TestCase):
+    def setUp(self):
+        form_class_cache.clear()
+        self.addCleanup(form_class_cache.clear)
+        self.form = DynamicForm.objects.create(name="Анкета")
+        FormField.objects.create(form=self.form, label="Имя", field_type="text", order=1)
+
+    def load(self):
+        return get_form_class(DynamicForm.objects.get(pk=self.form.pk))
+
+    def test_unchanged_schema_reuses_class(self):
+        first = self.load()
+        # Только чтение формы, поля не запрашиваются
+        with self.assertNumQueries(1):
+            second = self.load()
+
+        self.assertIs(first, second)
+        self.assertEqual(form_class_cache.cache_info()[:2], (1, 1))
+
+    def test_field_change_builds_new_class(self):
+        first = self.load()
+        field = FormField.objects.get()
+        field.label = "ФИО"
+        field.save()
+
+        second = self.load()
+
+        self.assertIsNot(first, second)
+        self.assertEqual(list(second.base_fields), ["ФИО"])
+        # Класс прошлой версии вытесняется сразу
+        self.assertEqual(form_class_cache.cache_info().currsize, 1)
+
+    def test_bulk_created_fields_invalidate_class(self):
+        self.load()
+        create_fields(self.form, 3)
+
+        self.assertEqual(len(self.load().base_fields), 4)
+
+
+class KeysetPaginatorTests(TestCase):
+    def setUp(self):
+        form = DynamicForm.objects.create(name="Анкета")
+        submissions = [FormSubmission.objects.create(form=form, session_key=f"session-{i}") for i in range(8)]
+        # Совпадающие даты: порядок внутри них держится на id
+        now = timezone.now()
+        for index, submission in enumerate(submissions):
+            submission.submitted_at = now + timedelta(minutes=index // 3)
+        FormSubmission.objects.bulk_update(submissions, ["submitted_at"])
+        self.paginator = KeysetPaginator(FormSubmission.objects.all(), 3)
+        self.expected = list(FormSubmission.objects.order_by("submitted_at", "pk").values_list("pk", flat=True))
+
+    def test_forward_pages_have_no_gaps_or_duplicates(self):
+        page = self.paginator.get_page()
+        self.assertFalse(page.has_previous)
+        found = [submission.pk for submission in page]
+        while page.has_next:
+            page = self.paginator.get_page(after=page.next_cursor)
+            self.assertTrue(page.has_previous)
+            found.extend(submission.pk for submission in page)
+        self.assertEqual(found, self.expected)
+
+    def test_backward_pages_have_no_gaps_or_duplicates(self):
+        page = self.paginator.get_page(last=True)
+        self.assertFalse(page.has_next)
+        found = [submission.pk for submission in page]
+        while page.has_previous:
+            page = self.paginator.get_page(before=page.previous_cursor)
+            self.assertTrue(page.has_next)
+            found[:0] = [submission.pk for submission in page]
+        self.assertEqual(found, self.expected)
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        page = self.paginator.get_page(after="not-a-cursor")
+        self.assertEqual([submission.pk for submission in page], self.expected[:3])
+
+
+class FormListSessionTests(TestCase):
+    def test_anonymous_list_does_not_create_session(self):
+        form = DynamicForm.objects.create(name="Анкета")
+        FormField.objects.create(form=form, label="Имя", field_type="text", order=1)
+        other = DynamicForm.objects.create(name="Опрос")
+
+        response = self.client.get(reverse("form_list"))
+
+        self.assertContains(response, "Анкета")
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertFalse(Session.objects.exists())
+
+        # Сессия появляется с первой отправкой, и отправленная форма пропадает из списка
+        self.client.post(reverse("form_submit", args=[form.pk]), {"Имя": "Иван"})
+        self.assertEqual(Session.objects.count(), 1)
+        response = self.client.get(reverse("form_list"))
+        self.assertEqual([item.pk for item in response.context["forms"]], [other.pk])
+
+
+class FormPageConditionalGetTests(TestCase):
+    def test_login_invalidates_cached_page(self):
+        form = DynamicForm.objects.create(name="Анкета")
+        url = reverse("form_submit", args=[form.pk])
+        # Первый ответ выдаёт CSRF-cookie, ETag считается уже с ней
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertNotIn("Last-Modified", response)
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(url, headers={"if-none-match": etag}).status_code, 304)
+
+        self.client.force_login(User.objects.create_user("applicant"))
+        # Дата формы не менялась, но страница после входа другая
+        response = self.client.get(
+            url, headers={"if-none-match": etag, "if-modified-since": "Fri, 01 Jan 2100 00:00:00 GMT"}
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class SubmissionAdminQueryBudgetTests(TestCase):
+    query_budget = 15
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+
+    def create_submission(self, fields_count):
+        form = DynamicForm.objects.create(name="Анкета")
+        submission = FormSubmission.objects.create(form=form, session_key=f"session-{fields_count}")
+        for order in range(fields_count):
+            field_type = "file" if order % 10 == 0 else "text"
+            field = FormField.objects.create(form=form, label=f"Поле {order}", field_type=field_type, order=order)
+            field_value = FieldValue.objects.create(submission=submission, field=field, text_value=f"Ответ {order}")
+            if field_type == "file":
+                FileValue.objects.create(field_value=field_value, file=f"forms/{order}.pdf")
+        return submission
+
+    def get_change_page(self, submission):
+        url = reverse("admin:form_formsubmission_change", args=[submission.pk])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_change_page_fits_query_budget(self):
+        response, queries = self.get_change_page(self.create_submission(60))
+        self.assertContains(response, "forms/50.pdf")
+        self.assertLessEqual(queries, self.query_budget)
+
+    def test_file_urls_are_resolved_once_per_page(self):
+        submission = self.create_submission(30)
+        with mock.patch("form.media.storage_urls", wraps=storage_urls) as resolve:
+            response, _ = self.get_change_page(submission)
+        resolve.assert_called_once()
+        for order in (0, 10, 20):
+            self.assertContains(response, f'<a href="/media/forms/{order}.pdf">forms/{order}.pdf</a>', html=True)
+
+    def test_query_count_does_not_grow_with_fields(self):
+        _, small = self.get_change_page(self.create_submission(6))
+        _, large = self.get_change_page(self.create_submission(60))
+        self.assertEqual(small, large)
+
+
+class ExportFreshnessTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(self.admin)
+        self.form = DynamicForm.objects.create(name="Анкета")
+        field = FormField.objects.create(form=self.form, label="Резюме", field_type="file", order=1)
+        self.submission = FormSubmission.objects.create(form=self.form, session_key="session")
+        field_value = FieldValue.objects.create(submission=self.submission, field=field)
+        self.file_value = FileValue.objects.create(field_value=field_value, file="forms/resume.pdf")
+
+    def data_version(self):
+        self.form.refresh_from_db()
+        return self.form.data_version
+
+    def test_file_delete_in_admin_changes_data_version(self):
+        before = self.data_version()
+        url = reverse("admin:form_filevalue_changelist")
+        self.client.post(url, {"action": "delete_selected", "_selected_action": [self.file_value.pk], "post": "yes"})
+        self.assertFalse(FileValue.objects.exists())
+        self.assertGreater(self.data_version(), before)
+
+    def test_submission_delete_in_admin_changes_data_version(self):
+        before = self.data_version()
+        url = reverse("admin:form_formsubmission_changelist")
+        self.client.post(url, {"action": "delete_selected", "_selected_action": [self.submission.pk], "post": "yes"})
+        self.assertFalse(FormSubmission.objects.exists())
+        self.assertGreater(self.data_version(), before)
+
+    def test_stale_running_job_is_not_reused(self):
+        stale = start_export_job(self.form, "csv", user=self.admin)
+        ExportJob.objects.filter(pk=stale.pk).update(status="running", started_at=timezone.now() - timedelta(hours=2))
+
+        job = start_export_job(self.form, "csv", user=self.admin)
+        self.assertNotEqual(job.pk, stale.pk)
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, "failed")
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.form = DynamicForm.objects.create(name="Анкета")
+        self.name = FormField.objects.create(form=self.form, label="Имя", field_type="text", order=1)
+        self.color = FormField.objects.create(
+            form=self.form, label="Цвет", field_type="select", choices=["Синий", "Красный"], order=2
+        )
+        self.langs = FormField.objects.create(
+            form=self.form, label="Языки", field_type="checkbox", choices=["Python", "Go"], order=3
+        )
+        self.resume = FormField.objects.create(form=self.form, label="Резюме", field_type="file", order=4)
+
+        self.submissions = []
+        answers = [("Иван", ["Синий"], ["Python"]), ("Пётр", ["Красный"], ["Python", "Go"]), ("Анна", None, None)]
+        for index, (name, color, langs) in enumerate(answers):
+            submission = FormSubmission.objects.create(form=self.form, session_key=f"session-{index}")
+            FieldValue.objects.create(submission=submission, field=self.name, text_value=name)
+            if color:
+                FieldValue.objects.create(submission=submission, field=self.color, choice_value=color)
+            if langs:
+                FieldValue.objects.create(submission=submission, field=self.langs, choice_value=langs)
+            resume = FieldValue.objects.create(submission=submission, field=self.resume)
+            FileValue.objects.create(field_value=resume, file=f"forms/resume-{index}.pdf")
+            self.submissions.append(submission)
+
+    def workbook_rows(self, data):
+        return [list(row) for row in load_workbook(BytesIO(data)).active.iter_rows(values_only=True)]
+
+    def test_parallel_exporter_keeps_order_and_content(self):
+        submissions = self.form.submissions.order_by("id")
+        serial = list(FormSubmissionExporter().iter_workbooks(submissions))
+
+        parallel = list(ParallelSubmissionExporter(workers=2, batch_size=1).iter_workbooks(submissions))
+
+        self.assertEqual([name for name, _ in parallel], [f"submission_{sub.pk}.xlsx" for sub in self.submissions])
+        self.assertEqual(
+            [self.workbook_rows(data) for _, data in parallel], [self.workbook_rows(data) for _, data in serial]
+        )
+        self.assertEqual(
+            self.workbook_rows(parallel[1][1])[:4],
+            [["Поле", "Значение"], ["Имя", "Пётр"], ["Цвет", "Красный"], ["Языки", "Python, Go"]],
+        )
+
+    @override_settings(FORM_EXPORT_WORKERS=4, FORM_EXPORT_PARALLEL_MIN_ROWS=100)
+    def test_pool_is_used_only_for_large_exports(self):
+        self.assertIs(type(get_submission_exporter(99)), FormSubmissionExporter)
+        exporter = get_submission_exporter(100)
+        self.assertIsInstance(exporter, ParallelSubmissionExporter)
+        self.assertEqual(exporter.workers, 4)
+        with override_settings(FORM_EXPORT_WORKERS=1):
+            self.assertIs(type(get_submission_exporter(10_000)), FormSubmissionExporter)
+
+    def test_zip_is_streamed_one_workbook_at_a_time(self):
+        chunks = list(FormSubmissionExporter().iter_submissions_zip(self.form.submissions.order_by("id")))
+
+        # По куску на каждую книгу и хвост с оглавлением архива
+        self.assertEqual(len(chunks), 4)
+        self.assertTrue(all(chunks[:3]))
+        with zipfile.ZipFile(BytesIO(b"".join(chunks))) as archive:
+            self.assertEqual(archive.namelist(), [f"submission_{sub.pk}.xlsx" for sub in self.submissions])
+            rows = self.workbook_rows(archive.read(f"submission_{self.submissions[0].pk}.xlsx"))
+        self.assertEqual(rows[1:3], [["Имя", "Иван"], ["Цвет", "Синий"]])
+
+    def test_table_exports_have_one_row_per_submission(self):
+        exporter = FormTableExporter(self.form)
+        header = ["ID", "Дата отправки", "Пользователь", "Имя", "Цвет", "Языки", "Резюме"]
+        expected = [
+            [self.submissions[0].pk, "session-0", "Иван", "Синий", "Python", "forms/resume-0.pdf"],
+            [self.submissions[1].pk, "session-1", "Пётр", "Красный", "Python, Go", "forms/resume-1.pdf"],
+            [self.submissions[2].pk, "session-2", "Анна", "", "", "forms/resume-2.pdf"],
+        ]
+
+        rows = list(csv.reader("".join(exporter.iter_csv()).lstrip("\ufeff").splitlines()))
+        self.assertEqual(rows[0], header)
+        self.assertEqual([[int(row[0]), *row[2:]] for row in rows[1:]], expected)
+
+        workbook = BytesIO()
+        exporter.write_xlsx(workbook)
+        rows = self.workbook_rows(workbook.getvalue())
+        self.assertEqual(rows[0], header)
+        self.assertIsInstance(rows[1][1], datetime)
+        self.assertEqual([[row[0], *[value or "" for value in row[2:]]] for row in rows[1:]], expected)
+
+        records = [json.loads(line) for line in exporter.iter_jsonl()]
+        self.assertEqual(
+            records[1]["answers"],
+            {"Имя": "Пётр", "Цвет": ["Красный"], "Языки": ["Python", "Go"], "Резюме": ["forms/resume-1.pdf"]},
+        )
+        self.assertEqual(
+            records[2]["answers"], {"Имя": "Анна", "Цвет": None, "Языки": None, "Резюме": ["forms/resume-2.pdf"]}
+        )
+        self.assertEqual([record["user"] for record in records], ["session-0", "session-1", "session-2"])
+
+    def test_loader_queries_per_chunk_not_per_submission(self):
+        loader = SubmissionBatchLoader(self.form.submissions.order_by("id"), chunk_size=2)
+
+        # Отправки одним запросом, на каждую пачку — ответы с полями и их файлы
+        with self.assertNumQueries(5):
+            loaded = [
+                (
+                    submission.pk,
+                    [(value.field.label, [f.file.name for f in value.file_values.all()]) for value in values],
+                )
+                for submission, values in loader
+            ]
+
+        self.assertEqual([pk for pk, _ in loaded], [submission.pk for submission in self.submissions])
+        self.assertEqual(loaded[2][1], [("Имя", []), ("Резюме", ["forms/resume-2.pdf"])])
+        self.assertEqual([label for label, _ in loaded[1][1]], ["Имя", "Цвет", "Языки", "Резюме"])
+
+    def test_table_export_query_count_does_not_grow_with_submissions(self):
+        # Поля формы, отправки с пользователями, ответы и файлы единственной пачки
+        with self.assertNumQueries(4):
+            list(FormTableExporter(self.form).iter_csv())
+
+        for index in range(3, 10):
+            submission = FormSubmission.objects.create(form=self.form, session_key=f"session-{index}")
+            FieldValue.objects.create(submission=submission, field=self.name, text_value=f"Ответ {index}")
+        with self.assertNumQueries(4):
+            lines = list(FormTableExporter(self.form).iter_csv())
+        self.assertEqual(len(lines), 11)
+
+    def export_storage(self):
+        # Готовые экспорты всегда уходят в бакет; в тестах его заменяет память
+        storage = mock.patch.object(ExportJob._meta.get_field("file"), "storage", InMemoryStorage())
+        storage.start()
+        self.addCleanup(storage.stop)
+
+    def test_worker_runs_job_to_done(self):
+        self.export_storage()
+        job = start_export_job(self.form, "csv")
+        self.assertEqual(job.status, "pending")
+
+        claimed = claim_next_job()
+        self.assertEqual((claimed.pk, claimed.status), (job.pk, "running"))
+        self.assertIsNotNone(claimed.started_at)
+        self.assertIsNone(claim_next_job())
+
+        run_export_job(claimed)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "done")
+        self.assertEqual((job.total_rows, job.processed_rows), (3, 3))
+        self.assertIsNotNone(job.finished_at)
+        with job.file.open("rb") as exported:
+            lines = exported.read().decode("utf-8-sig").splitlines()
+        self.assertEqual(lines[0], "ID,Дата отправки,Пользователь,Имя,Цвет,Языки,Резюме")
+        self.assertEqual(len(lines), 4)
+
+    def test_failure_is_recorded(self):
+        self.export_storage()
+        start_export_job(self.form, "xlsx")
+
+        with mock.patch("form.jobs.write_export", side_effect=RuntimeError("диск заполнен")):
+            with self.assertLogs("form.jobs", "ERROR"):
+                job = run_export_job(claim_next_job())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "failed")
+        self.assertIn("RuntimeError: диск заполнен", job.error)
+        self.assertFalse(job.file)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_unchanged_data_reuses_finished_job(self):
+        self.export_storage()
+        job = start_export_job(self.form, "jsonl")
+        run_export_job(claim_next_job())
+
+        self.form.refresh_from_db()
+        self.assertEqual(start_export_job(self.form, "jsonl").pk, job.pk)
+        self.assertNotEqual(start_export_job(self.form, "csv").pk, job.pk)
+
+        touch_form_data(self.form.pk)
+        self.form.refresh_from_db()
+        self.assertNotEqual(start_export_job(self.form, "jsonl").pk, job.pk)
+
+
+class AdminCounterTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        self.form = DynamicForm.objects.create(name="Анкета")
+        self.user = User.objects.create_user("applicant")
+
+    def management(self, *prefixes):
+        return {
+            f"{prefix}-{name}": value
+            for prefix in prefixes
+            for name, value in (("TOTAL_FORMS", 0), ("INITIAL_FORMS", 0), ("MIN_NUM_FORMS", 0), ("MAX_NUM_FORMS", 1000))
+        }
+
+    def test_form_save_does_not_write_counters(self):
+        url = reverse("admin:form_dynamicform_change", args=[self.form.pk])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {"name": "Анкета 2025", **self.management("fields")})
+        self.assertEqual(response.status_code, 302)
+
+        updates = [query["sql"] for query in queries if query["sql"].startswith('UPDATE "form_dynamicform"')]
+        self.assertTrue(updates)
+        for sql in updates:
+            self.assertNotIn("submissions_count", sql)
+            self.assertNotIn("data_version", sql)
+        self.form.refresh_from_db()
+        self.assertEqual(self.form.name, "Анкета 2025")
+
+    def test_submission_add_and_user_change_update_counters(self):
+        response = self.client.post(
+            reverse("admin:form_formsubmission_add"),
+            {"form": self.form.pk, "user": "", **self.management("values", "change_sets")},
+        )
+        self.assertEqual(response.status_code, 302)
+        submission = FormSubmission.objects.get()
+        self.form.refresh_from_db()
+        self.assertEqual(self.form.submissions_count, 1)
+
+        response = self.client.post(
+            reverse("admin:form_formsubmission_change", args=[submission.pk]),
+            {"form": self.form.pk, "user": self.user.pk, **self.management("values", "change_sets")},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.form.refresh_from_db()
+        self.assertEqual(self.form.submissions_count, 1)
+        self.assertEqual(self.user.submission_counter.count, 1)
+
+    def submit(self, count, user=None):
+        for index in range(count):
+            submission = FormSubmission.objects.create(form=self.form, user=user, session_key=f"session-{index}")
+            count_submission(self.form.pk, submission.user_id, 1)
+
+    def test_bulk_delete_in_admin_updates_counters(self):
+        self.submit(1, user=self.user)
+        self.submit(3)
+        selected = list(FormSubmission.objects.order_by("pk").values_list("pk", flat=True)[:3])
+
+        response = self.client.post(
+            reverse("admin:form_formsubmission_changelist"),
+            {"action": "delete_selected", "_selected_action": selected, "post": "yes"},
+        )
+        self.assertEqual(response.status_code, 302)
+
+        self.form.refresh_from_db()
+        self.assertEqual(self.form.submissions_count, 1)
+        self.assertEqual(UserSubmissionCount.objects.get(user=self.user).count, 0)
+
+    def test_form_delete_releases_user_counters(self):
+        other_form = DynamicForm.objects.create(name="Опрос")
+        other_user = User.objects.create_user("respondent")
+        self.submit(1, user=self.user)
+        FormSubmission.objects.create(form=other_form, user=other_user)
+        count_submission(other_form.pk, other_user.pk, 1)
+
+        self.client.post(reverse("admin:form_dynamicform_delete", args=[self.form.pk]), {"post": "yes"})
+
+        self.assertFalse(DynamicForm.objects.filter(pk=self.form.pk).exists())
+        self.assertEqual(UserSubmissionCount.objects.get(user=self.user).count, 0)
+        self.assertEqual(UserSubmissionCount.objects.get(user=other_user).count, 1)
+
+
+class SubmissionSearchPagingTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        form = DynamicForm.objects.create(name="Анкета")
+        field = FormField.objects.create(form=form, label="Город", field_type="text", order=1)
+        self.ids = []
+        for number in range(5):
+            submission = FormSubmission.objects.create(form=form, session_key=f"session-{number}")
+            FieldValue.objects.create(submission=submission, field=field, text_value="Казань")
+            self.ids.append(submission.pk)
+        index_submissions(self.ids)
+
+    @mock.patch.object(AdminSubmissionListView, "per_page", 2)
+    def test_search_results_are_paged(self):
+        url = reverse("admin_submission_list")
+        found = []
+        for page in (1, 2, 3):
+            response = self.client.get(url, {"q": "казань", "page": page})
+            found.extend(submission.pk for submission in response.context["submissions"])
+            self.assertEqual(response.context["search_page"]["has_next"], page < 3)
+        self.assertEqual(sorted(found), self.ids)
+
+    def test_admin_search_is_not_capped_by_ranking(self):
+        # Ранжируется только начало выдачи, но найтись должны все совпадения
+        with mock.patch("form.admin.search_submissions", return_value=self.ids[:1]):
+            response = self.client.get(reverse("admin:form_formsubmission_changelist"), {"q": "казань"})
+        self.assertEqual(response.context["cl"].result_count, 5)
+        self.assertEqual(response.context["cl"].result_list[0].pk, self.ids[0])
+
+
+# Файлы из ответов в бакете, который подменяет moto, как при FORM_MEDIA_STORAGE=s3
+s3_storage = override_settings(
+    STORAGES={
+        "default": {"BACKEND": "config.storages.MinIOMediaStorage"},
+        "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    },
+    AWS_S3_REGION_NAME="us-east-1",
+    AWS_S3_ACCESS_KEY_ID="testing",
+    AWS_S3_SECRET_ACCESS_KEY="testing",
+    AWS_S3_ENDPOINT_URL=None,
+    FORM_THUMBNAIL_WORKERS=0,
+)
+
+
+def mock_s3(test):
+    from moto import mock_aws
+
+    mock = mock_aws()
+    mock.start()
+    test.addCleanup(mock.stop)
+    s3 = default_storage.connection.meta.client
+    s3.create_bucket(Bucket=default_storage.bucket_name)
+    return s3
+
+
+@skipUnless(importlib.util.find_spec("moto"), "Нужен moto (uv sync --group dev)")
+@s3_storage
+@override_settings(FORM_UPLOAD_MODE="direct")
+class DirectUploadTests(TestCase):
+    def setUp(self):
+        self.s3 = mock_s3(self)
+        cache.clear()
+
+        self.form = DynamicForm.objects.create(name="Анкета")
+        FormField.objects.create(form=self.form, label="Имя", field_type="text", order=1)
+        FormField.objects.create(form=self.form, label="Фото", field_type="image", order=2)
+
+    def get_ticket(self, **data):
+        data = {"field": "Фото", "filename": "я.png", "content_type": "image/png", **data}
+        return self.client.post(reverse("form_direct_upload", args=[self.form.pk]), data)
+
+    def upload(self, ticket, body=b"\x89PNG", content_type="image/png"):
+        key = ticket["fields"]["key"]
+        self.s3.put_object(Bucket=default_storage.bucket_name, Key=key, Body=body, ContentType=content_type)
+
+    def submit(self, *tokens):
+        url = reverse("form_submit", args=[self.form.pk])
+        return self.client.post(url, {"Имя": "Иван", "Фото__upload": list(tokens)})
+
+    def test_uploaded_object_is_recorded_without_passing_through_django(self):
+        ticket = self.get_ticket().json()
+        self.assertTrue(ticket["fields"]["key"].startswith("media/forms/"))
+        self.upload(ticket)
+
+        response = self.submit(ticket["token"])
+
+        self.assertEqual(response.status_code, 302)
+        file_value = FileValue.objects.get()
+        self.assertTrue(file_value.is_image)
+        self.assertEqual("media/" + file_value.file.name, ticket["fields"]["key"])
+
+    def test_missing_object_is_rejected(self):
+        ticket = self.get_ticket().json()
+
+        response = self.submit(ticket["token"])
+
+        self.assertContains(response, "Файл не найден в хранилище")
+        self.assertFalse(FormSubmission.objects.exists())
+
+    def test_tampered_token_is_rejected(self):
+        ticket = self.get_ticket().json()
+        self.upload(ticket)
+
+        response = self.submit(ticket["token"] + "x")
+
+        self.assertContains(response, "Недействительная ссылка")
+        self.assertFalse(FileValue.objects.exists())
+
+    def test_token_attaches_object_only_once(self):
+        ticket = self.get_ticket().json()
+        self.upload(ticket)
+        self.assertEqual(self.submit(ticket["token"]).status_code, 302)
+
+        self.client.cookies.clear()
+        response = self.submit(ticket["token"])
+
+        self.assertContains(response, "уже прикреплён")
+        self.assertEqual(FileValue.objects.count(), 1)
+
+    def test_failed_submission_does_not_burn_token(self):
+        ticket = self.get_ticket().json()
+        self.upload(ticket)
+
+        with mock.patch("form.services.index_submissions", side_effect=RuntimeError("сбой")):
+            with self.assertRaises(RuntimeError):
+                self.submit(ticket["token"])
+        self.assertFalse(UploadClaim.objects.exists())
+
+        self.assertEqual(self.submit(ticket["token"]).status_code, 302)
+        self.assertEqual(FileValue.objects.count(), 1)
+
+    @override_settings(FORM_UPLOAD_TICKETS_PER_HOUR=2)
+    def test_tickets_are_rate_limited(self):
+        self.assertEqual(self.get_ticket().status_code, 200)
+        self.assertEqual(self.get_ticket().status_code, 200)
+
+        self.assertEqual(self.get_ticket().status_code, 429)
+
+    def test_cleanup_deletes_only_unattached_objects(self):
+        attached, orphan = self.get_ticket().json(), self.get_ticket().json()
+        self.upload(attached)
+        self.upload(orphan)
+        self.assertEqual(self.submit(attached["token"]).status_code, 302)
+
+        # Срок токенов вышел у обоих объектов
+        with mock.patch("form.uploads.upload_token_max_age", return_value=-60):
+            call_command("cleanup_uploads", stdout=StringIO())
+
+        keys = [obj["Key"] for obj in self.s3.list_objects_v2(Bucket=default_storage.bucket_name)["Contents"]]
+        self.assertEqual(keys, [attached["fields"]["key"]])
+
+    def test_ticket_only_for_file_fields(self):
+        response = self.get_ticket(field="Имя")
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_falls_back_to_proxy_mode_without_s3_storage(self):
+        with override_settings(STORAGES={"default": {"BACKEND": "django.core.files.storage.InMemoryStorage"}}):
+            self.assertEqual(self.get_ticket().status_code, 404)
+
+
+@skipUnless(importlib.util.find_spec("moto"), "Нужен moto (uv sync --group dev)")
+@s3_storage
+class SignedUrlCacheTests(TestCase):
+    def setUp(self):
+        mock_s3(self)
+        form = DynamicForm.objects.create(name="Анкета")
+        field = FormField.objects.create(form=form, label="Фото", field_type="image", order=1)
+        self.submission = FormSubmission.objects.create(form=form, session_key="session")
+        field_value = FieldValue.objects.create(submission=self.submission, field=field)
+        for name in ["forms/a.png", "forms/b.png"]:
+            FileValue.objects.create(field_value=field_value, file=name, thumbnail=name + ".webp", is_image=True)
+
+    def test_repeated_pages_reuse_signed_urls(self):
+        url = reverse("form_submission_detail", args=[self.submission.pk])
+        with mock.patch.object(S3Boto3Storage, "url", autospec=True, side_effect=S3Boto3Storage.url) as sign:
+            first = self.client.get(url)
+            self.assertEqual(sign.call_count, 4)
+
+            second = self.client.get(url)
+            self.assertEqual(sign.call_count, 4)
+
+        self.assertContains(first, "Signature=", count=4)
+        self.assertEqual(first.content, second.content)
+
+
+class SubmissionWriterTests(TransactionTestCase):
+    def test_failed_job_does_not_roll_back_batch(self):
+        form = DynamicForm.objects.create(name="Анкета")
+        writer = SubmissionWriter(batch_size=10)
+
+        def submit(session_key):
+            if session_key == "broken":
+                return writer.submit(FormSubmission.objects.create, form_id=0, session_key=session_key)
+            return writer.submit(FormSubmission.objects.create, form=form, session_key=session_key)
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(submit, key) for key in ["a", "b", "broken", "c", "d"]]
+
+        with self.assertRaises(Exception):
+            futures[2].result()
+        saved = [future.result().session_key for future in futures[:2] + futures[3:]]
+        self.assertEqual(sorted(FormSubmission.objects.values_list("session_key", flat=True)), sorted(saved))
+
+
+class AsyncViewUrls:
+    # Отправка и правка через асинхронные представления, как при FORM_ASYNC_VIEWS
+    urlpatterns = [
+        path("form/<int:pk>/submit/", AsyncDynamicFormSubmissionView.as_view(), name="form_submit"),
+        path("submissions/<int:pk>/edit/", AsyncFormSubmissionUpdateView.as_view(), name="form_submission_edit"),
+        path("", include("config.urls")),
+    ]
+
+
+@override_settings(ROOT_URLCONF=AsyncViewUrls)
+class AsyncViewTests(TransactionTestCase):
+    def setUp(self):
+        self.form = DynamicForm.objects.create(name="Анкета")
+        FormField.objects.create(form=self.form, label="Имя", field_type="text", order=1)
+
+    async def submit(self, name="Иван"):
+        return await self.async_client.post(reverse("form_submit", args=[self.form.pk]), {"Имя": name})
+
+    async def test_valid_post_creates_submission(self):
+        response = await self.submit()
+
+        submission = await FormSubmission.objects.aget()
+        detail_url = reverse("form_submission_detail", args=[submission.pk])
+        self.assertRedirects(response, detail_url, fetch_redirect_response=False)
+        self.assertEqual((await submission.values.aget()).text_value, "Иван")
+
+    async def test_update_changes_answer(self):
+        await self.submit()
+        submission = await FormSubmission.objects.aget()
+
+        url = reverse("form_submission_edit", args=[submission.pk])
+        response = await self.async_client.post(url, {"Имя": "Пётр"})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual((await submission.values.aget()).text_value, "Пётр")
+
+    async def test_duplicate_in_ingest_mode_is_rejected(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(FORM_INGEST_MODE=True, FORM_INGEST_QUEUE=f"{directory}/ingest.sqlite3"):
+                self.assertEqual((await self.submit()).status_code, 302)
+                response = await self.submit()
+                self.assertContains(response, "уже отправили")
+                self.assertEqual(await sync_to_async(get_queue().counts)(), (1, 0))
+
+    @override_settings(FORM_SERIAL_WRITER=True)
+    async def test_waiting_for_writer_does_not_block_sync_thread(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def job():
+            started.set()
+            return release.wait(5)
+
+        writing = asyncio.ensure_future(awrite(job))
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+        # Пока задание ждёт в потоке писателя, общий синхронный поток свободен и может его отпустить
+        await sync_to_async(release.set)()
+        self.assertTrue(await writing)
+
+
+class IngestQueueTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(FORM_INGEST_MODE=True, FORM_INGEST_QUEUE=f"{directory.name}/ingest.sqlite3")
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.form = DynamicForm.objects.create(name="Анкета")
+        FormField.objects.create(form=self.form, label="Имя", field_type="text", order=1)
+        FormField.objects.create(form=self.form, label="Цвет", field_type="select", choices=["Синий"], order=2)
+
+    def submit(self):
+        response = self.client.post(reverse("form_submit", args=[self.form.pk]), {"Имя": "Иван", "Цвет": "Синий"})
+        self.assertEqual(response.status_code, 302)
+        return response.url
+
+    def test_submission_is_pending_until_drained(self):
+        pending_url = self.submit()
+
+        self.assertFalse(FormSubmission.objects.exists())
+        self.assertContains(self.client.get(pending_url), "сохраняются")
+
+        self.assertEqual(drain_queue(), (1, 0))
+
+        submission = FormSubmission.objects.get()
+        self.assertRedirects(self.client.get(pending_url), reverse("form_submission_detail", args=[submission.pk]))
+        self.assertEqual(set(submission.values.values_list("text_value", flat=True)), {None, "Иван"})
+        self.assertEqual(get_queue().counts(), (0, 0))
+
+    def test_entries_written_before_crash_are_not_duplicated(self):
+        self.submit()
+        # Воркер закоммитил пачку, но упал до удаления записей из журнала
+        write_entries(get_queue().peek(10))
+
+        self.assertEqual(drain_queue(), (1, 0))
+        self.assertEqual(FormSubmission.objects.count(), 1)
+        self.assertEqual(FieldValue.objects.count(), 2)
+
+    def test_repeated_submission_is_rejected_before_queueing(self):
+        self.submit()
+        response = self.client.post(reverse("form_submit", args=[self.form.pk]), {"Имя": "Иван", "Цвет": "Синий"})
+        self.assertContains(response, "уже отправили")
+        self.assertEqual(get_queue().counts(), (1, 0))
+
+        drain_queue()
+        response = self.client.post(reverse("form_submit", args=[self.form.pk]), {"Имя": "Иван", "Цвет": "Синий"})
+        self.assertContains(response, "уже отправили")
+        self.assertEqual(FormSubmission.objects.count(), 1)
+
+    def test_duplicate_entry_is_rejected_for_good(self):
+        user = User.objects.create_user("applicant")
+        FormSubmission.objects.create(form=self.form, user=user)
+        # Запись принята в обход проверки, например старой версией приложения
+        token = get_queue().append(
+            {
+                "form": self.form.pk,
+                "user": user.pk,
+                "session_key": "",
+                "submitted_at": "2024-01-01T00:00:00+00:00",
+                "values": [],
+                "files": [],
+            }
+        )
+
+        self.assertEqual(drain_queue(), (0, 1))
+        self.assertEqual(get_queue().status(token), "rejected")
+        self.assertEqual(get_queue().retry_failed(), 0)
+        self.assertContains(self.client.get(reverse("form_submission_pending", args=[token])), "не сохранены")
+
+    def test_direct_upload_is_attached_only_once(self):
+        field = FormField.objects.create(form=self.form, label="Фото", field_type="file", order=3)
+        name = "forms/2024/01/01/" + "0" * 32 + "/скан.pdf"
+        tokens = [
+            get_queue().append(
+                {
+                    "form": self.form.pk,
+                    "user": None,
+                    "session_key": session_key,
+                    "submitted_at": "2024-01-01T00:00:00+00:00",
+                    "values": [[field.pk, None, None]],
+                    "files": [[field.pk, name, False]],
+                    "direct": [name],
+                }
+            )
+            for session_key in ["первая", "вторая"]
+        ]
+
+        self.assertEqual(drain_queue(), (1, 1))
+        self.assertEqual(get_queue().status(tokens[1]), "rejected")
+        self.assertEqual(list(FileValue.objects.values_list("file", flat=True)), [name])
+
+
+@override_settings(
+    STORAGES={
+        "default": {"BACKEND": "django.core.files.storage.InMemoryStorage"},
+        "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    },
+    FORM_THUMBNAIL_WORKERS=0,
+)
+class BenchmarkSuiteTests(TransactionTestCase):
+    def test_seeded_dataset_runs_every_scenario(self):
+        call_command("seed_data", forms=1, fields=6, submissions=3, file_ratio=1, stdout=StringIO())
+        self.assertEqual(FormSubmission.objects.count(), 3)
+        field_types = set(FormField.objects.values_list("field_type", flat=True))
+        self.assertEqual(field_types, {field_type for field_type, _ in FormField.FIELD_TYPES})
+
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            call_command("benchmark_suite", requests=2, warmup=0, output=output.name, stdout=StringIO())
+            report = json.load(output)
+
+        self.assertEqual(
+            list(report["scenarios"]), ["form_list", "submit", "edit", "admin_list", "admin_detail", "export"]
+        )
+        for result in report["scenarios"].values():
+            self.assertEqual(result["errors"], 0)
+            self.assertGreater(result["queries_per_request"], 0)
+        self.assertGreater(report["peak_rss_mb"], 0)
+        # Отправки, созданные прогоном, удаляются после него
+        self.assertEqual(FormSubmission.objects.count(), 3)
+
+    def test_submit_in_ingest_mode_leaves_no_journal_entries(self):
+        call_command("seed_data", forms=1, fields=6, submissions=3, file_ratio=1, stdout=StringIO())
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(FORM_INGEST_MODE=True, FORM_INGEST_QUEUE=f"{directory}/ingest.sqlite3"):
+                call_command("benchmark_suite", scenarios="submit", requests=2, warmup=0, stdout=StringIO())
+                self.assertEqual(get_queue().counts(), (0, 0))
+        self.assertEqual(FormSubmission.objects.count(), 3)
@@ -0,0 +1,91 @@
+import io
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .loaders import iter_batches
+from .models import FileValue
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_FORMAT = "WEBP"
+THUMBNAIL_QUALITY = 80
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def thumbnail_name(name):
+    directory, filename = posixpath.split(name)
+    return posixpath.join(directory, "thumbs", posixpath.splitext(filename)[0] + ".webp")
+
+
+def render_thumbnail(fileobj, size):
+    with Image.open(fileobj) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY)
+    return buffer.getvalue()
+
+
+def make_thumbnail(file_value):
+    storage = file_value.file.storage
+    try:
+        with storage.open(file_value.file.name, "rb") as original:
+            content = render_thumbnail(original, settings.FORM_THUMBNAIL_SIZE)
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        logger.warning("Не удалось сделать миниатюру для %s", file_value.file.name, exc_info=True)
+        return None
+    name = storage.save(thumbnail_name(file_value.file.name), ContentFile(content))
+    FileValue.objects.filter(pk=file_value.pk).update(thumbnail=name)
+    return name
+
+
+def generate_thumbnails(file_value_ids, force=False):
+    created = 0
+    for ids in iter_batches(file_value_ids, 100):
+        file_values = FileValue.objects.filter(pk__in=ids, is_image=True).exclude(file="")
+        if not force:
+            file_values = file_values.filter(thumbnail="")
+        for file_value in file_values:
+            created += make_thumbnail(file_value) is not None
+    return created
+
+
+def run_in_background(file_value_ids):
+    try:
+        generate_thumbnails(file_value_ids)
+    except Exception:
+        logger.exception("Ошибка при создании миниатюр")
+    finally:
+        close_old_connections()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.FORM_THUMBNAIL_WORKERS, thread_name_prefix="form-thumbs"
+            )
+    return _executor
+
+
+def schedule_thumbnails(file_value_ids):
+    # Миниатюры делаются после коммита, вне запроса; при FORM_THUMBNAIL_WORKERS=0 — сразу после коммита в том же потоке
+    file_value_ids = list(file_value_ids)
+    if not file_value_ids:
+        return
+    if settings.FORM_THUMBNAIL_WORKERS:
+        transaction.on_commit(lambda: get_executor().submit(run_in_background, file_value_ids))
+    else:
+        transaction.on_commit(lambda: generate_thumbnails(file_value_ids))
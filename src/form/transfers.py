@@ -0,0 +1,95 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .models import FileValue, UploadClaim
+
+logger = logging.getLogger(__name__)
+
+ALREADY_CLAIMED = "Этот файл уже прикреплён к отправке, загрузите его заново"
+
+
+class UploadError(Exception):
+    pass
+
+
+def save_file(uploaded_file):
+    field = FileValue._meta.get_field("file")
+    name = field.generate_filename(None, uploaded_file.name)
+    return field.storage.save(name, uploaded_file, max_length=field.max_length)
+
+
+def delete_files(names):
+    storage = FileValue._meta.get_field("file").storage
+    for name in names:
+        try:
+            storage.delete(name)
+        except Exception:
+            logger.warning("Не удалось удалить загруженный файл %s", name, exc_info=True)
+
+
+def direct_names(files):
+    # Строки среди файлов — имена объектов, которые браузер уже загрузил напрямую
+    return [uploaded_file for uploaded_file in files if isinstance(uploaded_file, str)]
+
+
+def claim_uploads(names):
+    # Токен прямой загрузки действует сутки, и без отметки тот же объект можно было бы прикрепить к нескольким
+    # отправкам. Отметка пишется в транзакции самой отправки: если запись не удалась, токен отправляется снова
+    claims = [UploadClaim(name=name) for name in names]
+    if not claims:
+        return
+    try:
+        with transaction.atomic():
+            UploadClaim.objects.bulk_create(claims)
+    except IntegrityError:
+        raise UploadError(ALREADY_CLAIMED)
+
+
+def store_files(files):
+    # Строки — объекты, уже загруженные браузером напрямую; остальные файлы отправляются в хранилище параллельно
+    pending = [uploaded_file for uploaded_file in files if not isinstance(uploaded_file, str)]
+    uploaded = []
+    if pending:
+        workers = min(settings.FORM_UPLOAD_WORKERS, len(pending))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="form-upload") as pool:
+            futures = [pool.submit(save_file, uploaded_file) for uploaded_file in pending]
+
+        error = None
+        for future in futures:
+            try:
+                uploaded.append(future.result())
+            except Exception as exc:
+                error = error or exc
+        if error is not None:
+            delete_files(uploaded)
+            raise error
+
+    names = iter(uploaded)
+    return [uploaded_file if isinstance(uploaded_file, str) else next(names) for uploaded_file in files], uploaded
+
+
+@contextmanager
+def stored_files(files):
+    names, uploaded = store_files(files)
+    try:
+        yield names
+    except BaseException:
+        # Записи FileValue не сохранились — загруженные для них объекты больше не нужны
+        delete_files(uploaded)
+        raise
+
+
+@asynccontextmanager
+async def astored_files(files):
+    # Загрузка идёт в отдельных потоках: не блокирует цикл событий и общий поток для работы с базой
+    names, uploaded = await sync_to_async(store_files, thread_sensitive=False)(files)
+    try:
+        yield names
+    except BaseException:
+        await sync_to_async(delete_files, thread_sensitive=False)(uploaded)
+        raise
@@ -0,0 +1,162 @@
+import os
+import posixpath
+import re
+import time
+import uuid
+from datetime import timedelta
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.datastructures import MultiValueDict
+from django.utils.text import get_valid_filename
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from .forms import get_form_class
+from .ingest import get_queue
+from .models import FileValue, UploadClaim
+from .services import FILE_FIELD_TYPES
+from .transfers import ALREADY_CLAIMED, UploadError
+
+UPLOAD_SALT = "form.uploads"
+# Имя скрытого поля с подписанными токенами загрузок: "<метка поля>__upload"
+UPLOAD_SUFFIX = "__upload"
+# Имя объекта прямой загрузки: <upload_to>/<uuid>/<имя файла>, см. upload_name
+DIRECT_NAME = re.compile(r"/[0-9a-f]{32}/[^/]+$")
+
+
+def get_upload_storage():
+    return FileValue._meta.get_field("file").storage
+
+
+def direct_uploads_enabled():
+    # Прямая загрузка возможна только в S3-совместимое хранилище, иначе файлы идут через Django
+    return settings.FORM_UPLOAD_MODE == "direct" and isinstance(get_upload_storage(), S3Boto3Storage)
+
+
+def upload_name(filename):
+    directory = timezone.now().strftime(FileValue._meta.get_field("file").upload_to)
+    return posixpath.join(directory, uuid.uuid4().hex, get_valid_filename(posixpath.basename(filename)) or "file")
+
+
+def upload_token_max_age():
+    # Форму могут отправить позже, чем истекла ссылка на загрузку, поэтому срок токена больше
+    return settings.FORM_UPLOAD_URL_EXPIRES + 24 * 3600
+
+
+def allow_upload_ticket(request):
+    # Ссылка разрешает положить в бакет до FORM_UPLOAD_MAX_SIZE, поэтому выдача ограничена на клиента в час
+    if request.user.is_authenticated:
+        client = f"user:{request.user.pk}"
+    else:
+        client = f"ip:{request.META.get('REMOTE_ADDR', '')}"
+    key = f"form-upload-tickets:{client}:{int(time.time() // 3600)}"
+    cache.add(key, 0, 3600)
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # Ключ вытеснен из кеша между add и incr
+        cache.add(key, 1, 3600)
+        count = 1
+    return count <= settings.FORM_UPLOAD_TICKETS_PER_HOUR
+
+
+def get_upload_field(dynamic_form, label):
+    for field in get_form_class(dynamic_form).form_fields:
+        if field.label == label and field.field_type in FILE_FIELD_TYPES and not (field.is_hidden or field.is_locked):
+            return field
+    raise UploadError("Поле не принимает файлы")
+
+
+def create_upload_ticket(dynamic_form, label, filename, content_type=""):
+    field = get_upload_field(dynamic_form, label)
+    if field.field_type == "image" and not content_type.startswith("image/"):
+        raise UploadError("Можно загрузить только изображение")
+
+    storage = get_upload_storage()
+    name = upload_name(filename)
+    conditions = [["content-length-range", 1, settings.FORM_UPLOAD_MAX_SIZE]]
+    fields = {}
+    if content_type:
+        fields["Content-Type"] = content_type
+        conditions.append({"Content-Type": content_type})
+    post = storage.connection.meta.client.generate_presigned_post(
+        Bucket=storage.bucket_name,
+        Key=storage._normalize_name(name),
+        Fields=fields,
+        Conditions=conditions,
+        ExpiresIn=settings.FORM_UPLOAD_URL_EXPIRES,
+    )
+    token = signing.dumps({"form": dynamic_form.pk, "field": field.pk, "name": name}, salt=UPLOAD_SALT)
+    return {"url": post["url"], "fields": post["fields"], "token": token}
+
+
+def verify_upload(token, dynamic_form, field):
+    try:
+        data = signing.loads(token, salt=UPLOAD_SALT, max_age=upload_token_max_age())
+    except signing.BadSignature:
+        raise UploadError("Недействительная ссылка на загруженный файл")
+    if data["form"] != dynamic_form.pk or data["field"] != field.pk:
+        raise UploadError("Файл загружен для другого поля")
+
+    storage = get_upload_storage()
+    try:
+        head = storage.connection.meta.client.head_object(
+            Bucket=storage.bucket_name, Key=storage._normalize_name(data["name"])
+        )
+    except ClientError:
+        raise UploadError("Файл не найден в хранилище")
+    if not 0 < head["ContentLength"] <= settings.FORM_UPLOAD_MAX_SIZE:
+        raise UploadError("Недопустимый размер файла")
+    if field.field_type == "image" and not head.get("ContentType", "").startswith("image/"):
+        raise UploadError("Можно загрузить только изображение")
+    # Ранняя проверка для понятной ошибки у поля; саму отметку ставит транзакция записи отправки
+    if UploadClaim.objects.filter(name=data["name"]).exists():
+        raise UploadError(ALREADY_CLAIMED)
+    return data["name"]
+
+
+def collect_uploads(form, dynamic_form, data, files):
+    # Файлы, пришедшие через Django, и уже загруженные напрямую объекты (их имена) в одном MultiValueDict
+    uploads = MultiValueDict({label: files.getlist(label) for label in files})
+    if not direct_uploads_enabled():
+        return uploads
+
+    for field in form.form_fields:
+        tokens = data.getlist(field.label + UPLOAD_SUFFIX)
+        if not tokens or field.field_type not in FILE_FIELD_TYPES or field.is_hidden or field.is_locked:
+            continue
+        names = []
+        for token in tokens:
+            try:
+                names.append(verify_upload(token, dynamic_form, field))
+            except UploadError as error:
+                form.add_error(field.label, str(error))
+        uploads.setlist(field.label, uploads.getlist(field.label) + names)
+    return uploads
+
+
+def orphaned_uploads():
+    # Объект прямой загрузки, который не прикрепили к отправке за срок токена, прикрепить уже нельзя
+    storage = get_upload_storage()
+    cutoff = timezone.now() - timedelta(seconds=upload_token_max_age())
+    root = storage._normalize_name("")
+    prefix = storage._normalize_name(FileValue._meta.get_field("file").upload_to.split("/")[0] + "/")
+    candidates = [
+        obj.key[len(root) :]
+        for obj in storage.bucket.objects.filter(Prefix=prefix)
+        if obj.last_modified < cutoff and DIRECT_NAME.search(obj.key)
+    ]
+
+    # Отправки из журнала приёма ещё не записаны в базу, но их объекты уже заняты
+    queued = set()
+    if os.path.exists(settings.FORM_INGEST_QUEUE):
+        queued = get_queue().direct_names()
+    orphans = []
+    for start in range(0, len(candidates), 500):
+        batch = candidates[start : start + 500]
+        attached = set(FileValue.objects.filter(file__in=batch).values_list("file", flat=True))
+        orphans.extend(name for name in batch if name not in attached and name not in queued)
+    return orphans
@@ -1,27 +1,40 @@
+from django.conf import settings
 from django.urls import path
 from django.contrib.auth import views as auth_views
 from .views import (
     DynamicFormListView,
     DynamicFormDetailView,
     DynamicFormSubmissionView,
+    AsyncDynamicFormSubmissionView,
+    DirectUploadView,
     FormSubmissionSuccessView,
     RegisterView,
     FormSubmissionDetailView,
+    FormSubmissionPendingView,
     FormSubmissionUpdateView,
+    AsyncFormSubmissionUpdateView,
     AdminSubmissionListView,
     AdminSubmissionDetailView,
 )
 
+# Под ASGI отправка и правка ответов обрабатываются асинхронными представлениями
+if settings.FORM_ASYNC_VIEWS:
+    submit_view, edit_view = AsyncDynamicFormSubmissionView, AsyncFormSubmissionUpdateView
+else:
+    submit_view, edit_view = DynamicFormSubmissionView, FormSubmissionUpdateView
+
 urlpatterns = [
     path("login/", auth_views.LoginView.as_view(template_name="registration/login.html"), name="login"),
     path("logout/", auth_views.LogoutView.as_view(next_page="login"), name="logout"),
     path("register/", RegisterView.as_view(), name="register"),
     path("", DynamicFormListView.as_view(), name="form_list"),
     path("form/<int:pk>/", DynamicFormDetailView.as_view(), name="form_detail"),
-    path("form/<int:pk>/submit/", DynamicFormSubmissionView.as_view(), name="form_submit"),
+    path("form/<int:pk>/submit/", submit_view.as_view(), name="form_submit"),
+    path("form/<int:pk>/uploads/", DirectUploadView.as_view(), name="form_direct_upload"),
     path("submission/<int:pk>/success/", FormSubmissionSuccessView.as_view(), name="form_success"),
     path("submissions/<int:pk>/", FormSubmissionDetailView.as_view(), name="form_submission_detail"),
-    path("submissions/<int:pk>/edit/", FormSubmissionUpdateView.as_view(), name="form_submission_edit"),
+    path("submissions/pending/<str:token>/", FormSubmissionPendingView.as_view(), name="form_submission_pending"),
+    path("submissions/<int:pk>/edit/", edit_view.as_view(), name="form_submission_edit"),
     path("admins/submissions/", AdminSubmissionListView.as_view(), name="admin_submission_list"),
     path("admins/submissions/<int:pk>/", AdminSubmissionDetailView.as_view(), name="admin_submission_detail"),
 ]
\ No newline at end of file
@@ -1,14 +1,47 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.mixins import UserPassesTestMixin
-from django.db import transaction
+from django.db import connections
+from django.db.models import Prefetch
 from django.urls import reverse_lazy
 from django.views import View
 from django.views.generic import ListView, DetailView, FormView
-from django.shortcuts import get_object_or_404, redirect, render
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect, render
+from django.http import Http404, JsonResponse
+from django.utils.decorators import method_decorator
+from django.utils.functional import cached_property
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from .caching import form_page_etag, get_form_fields_html, get_page_form
+from .forms import get_form_class
+from .ingest import DuplicateSubmission, enqueue_submission, get_queue
+from .media import attach_file_urls
 from .models import DynamicForm, FormSubmission, FieldValue, FileValue
-from django.forms import Form, CharField, ChoiceField, MultipleChoiceField, FileField, Textarea
-from django.forms import CheckboxSelectMultiple, Select
+from .pagination import KeysetPaginator, estimated_count
+from .search import search_submissions
+from .services import (
+    FILE_FIELD_TYPES,
+    acreate_submission,
+    apply_admin_changes,
+    aupdate_submission,
+    create_submission,
+    update_submission,
+)
+from .uploads import UploadError, allow_upload_ticket, collect_uploads, create_upload_ticket, direct_uploads_enabled
+
+
+def in_own_thread(func):
+    # Обращения к хранилищу не занимают общий поток для работы с базой. Соединение с базой, открытое в потоке
+    # пула, само не закроется (request_finished его не видит), поэтому закрывается сразу после вызова
+    def call(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            connections.close_all()
+
+    return sync_to_async(call, thread_sensitive=False)
 
 
 class RegisterView(FormView):
@@ -26,121 +59,169 @@ class DynamicFormListView(ListView):
     template_name = "forms/form_list.html"
     context_object_name = "forms"
 
-    def get_queryset(self):
+    @cached_property
+    def finished_submissions(self):
         user = self.request.user
         if user.is_authenticated:
-            finished_submissions = FormSubmission.objects.filter(user=user).values_list("form_id", flat=True)
+            submissions = FormSubmission.objects.filter(user=user)
         else:
+            # Сессия создаётся только при первой отправке, просмотр списка ничего не пишет в БД
             session_key = self.request.session.session_key
             if not session_key:
-                self.request.session.create()
-                session_key = self.request.session.session_key
-            finished_submissions = FormSubmission.objects.filter(session_key=session_key).values_list(
-                "form_id", flat=True
-            )
+                return []
+            submissions = FormSubmission.objects.filter(session_key=session_key)
+        return list(submissions.select_related("form"))
 
-        return DynamicForm.objects.exclude(id__in=finished_submissions)
+    def get_queryset(self):
+        finished_form_ids = {submission.form_id for submission in self.finished_submissions}
+        return DynamicForm.objects.exclude(id__in=finished_form_ids)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user = self.request.user
-        if user.is_authenticated:
-            finished_submissions = FormSubmission.objects.filter(user=user).select_related("form")
-        else:
-            session_key = self.request.session.session_key
-            if not session_key:
-                self.request.session.create()
-                session_key = self.request.session.session_key
-            finished_submissions = FormSubmission.objects.filter(session_key=session_key).select_related("form")
-
-        context["finished_submissions"] = finished_submissions
+        context["finished_submissions"] = self.finished_submissions
         return context
 
 
+form_page_conditions = [
+    cache_control(private=True, no_cache=True),
+    # Только ETag: в нём учтены пользователь и CSRF-токен, а Last-Modified по одной дате формы отдал бы 304
+    # на страницу, отрисованную до входа или выхода
+    condition(etag_func=form_page_etag),
+]
+
+
+@method_decorator(form_page_conditions, name="get")
 class DynamicFormDetailView(DetailView):
     model = DynamicForm
     template_name = "forms/form_detail.html"
     context_object_name = "form"
 
+    def get_object(self, queryset=None):
+        dynamic_form = get_page_form(self.request, self.kwargs["pk"])
+        if dynamic_form is None:
+            raise Http404
+        return dynamic_form
+
 
 class DynamicFormSubmissionView(View):
     template_name = "forms/form_submit.html"
 
-    def get_form_class(self, dynamic_form, submission=None):
-        fields = {}
-        for field in dynamic_form.fields.all():
-            if field.is_hidden:
-                continue
-
-            field_kwargs = {
-                "label": field.label,
-                "required": field.required,
-            }
-
-            if field.is_locked:
-                field_kwargs["disabled"] = True
-
-            if field.field_type == "text":
-                fields[field.label] = CharField(**field_kwargs)
-            elif field.field_type == "textarea":
-                field_kwargs["widget"] = Textarea
-                fields[field.label] = CharField(**field_kwargs)
-            elif field.field_type == "select":
-                field_kwargs["widget"] = Select
-                field_kwargs["choices"] = [(c, c) for c in field.choices or []]
-                fields[field.label] = ChoiceField(**field_kwargs)
-            elif field.field_type == "checkbox":
-                field_kwargs["widget"] = CheckboxSelectMultiple
-                field_kwargs["choices"] = [(c, c) for c in field.choices or []]
-                fields[field.label] = MultipleChoiceField(**field_kwargs)
-            elif field.field_type in ["file", "image"]:
-                field_kwargs.pop("required", None)
-                fields[field.label] = FileField(required=False, **field_kwargs)
-
-        return type("DynamicForm", (Form,), fields)
-
+    @method_decorator(form_page_conditions)
     def get(self, request, pk):
-        dynamic_form = get_object_or_404(DynamicForm, pk=pk)
-        form_class = self.get_form_class(dynamic_form)
-        form = form_class()
-        return render(request, self.template_name, {"form": form, "dynamic_form": dynamic_form})
+        dynamic_form = get_page_form(request, pk)
+        if dynamic_form is None:
+            raise Http404
+        form_fields_html = get_form_fields_html(dynamic_form)
+        return render(
+            request,
+            self.template_name,
+            {
+                "form_fields_html": form_fields_html,
+                "dynamic_form": dynamic_form,
+                "direct_uploads": direct_uploads_enabled(),
+            },
+        )
 
     def post(self, request, pk):
         dynamic_form = get_object_or_404(DynamicForm, pk=pk)
-        form_class = self.get_form_class(dynamic_form)
+        form_class = get_form_class(dynamic_form)
         form = form_class(request.POST, request.FILES)
 
         if form.is_valid():
-            if request.user.is_authenticated:
-                submission = FormSubmission.objects.create(form=dynamic_form, user=request.user)
-            else:
+            # Загрузки проверяются только у валидной формы, ошибки в них тоже попадают в form.errors
+            files = collect_uploads(form, dynamic_form, request.POST, request.FILES)
+            if not form.errors:
+                try:
+                    return self.save_submission(request, dynamic_form, form, files)
+                except (DuplicateSubmission, UploadError) as error:
+                    form.add_error(None, str(error))
+
+        return render(
+            request,
+            self.template_name,
+            {"form": form, "dynamic_form": dynamic_form, "direct_uploads": direct_uploads_enabled()},
+        )
+
+    def save_submission(self, request, dynamic_form, form, files):
+        save = enqueue_submission if settings.FORM_INGEST_MODE else create_submission
+        if request.user.is_authenticated:
+            submission = save(dynamic_form, form, files, user=request.user)
+        else:
+            session_key = request.session.session_key
+            if not session_key:
+                request.session.create()
                 session_key = request.session.session_key
-                if not session_key:
-                    request.session.create()
-                    session_key = request.session.session_key
-                submission = FormSubmission.objects.create(form=dynamic_form, session_key=session_key)
-
-            for field in dynamic_form.fields.all():
-                if field.is_hidden:
-                    continue
-
-                value = form.cleaned_data.get(field.label)
-                if field.field_type in ["file", "image"]:
-                    field_value = FieldValue.objects.create(submission=submission, field=field)
-                    for uploaded_file in request.FILES.getlist(field.label):
-                        FileValue.objects.create(
-                            field_value=field_value, file=uploaded_file, is_image=(field.field_type == "image")
-                        )
-                elif field.field_type == "checkbox":
-                    FieldValue.objects.create(submission=submission, field=field, choice_value=value)
-                elif field.field_type == "select":
-                    FieldValue.objects.create(submission=submission, field=field, choice_value=[value])
-                else:
-                    FieldValue.objects.create(submission=submission, field=field, text_value=value)
+            submission = save(dynamic_form, form, files, session_key=session_key)
 
-            return redirect("form_submission_detail", pk=submission.pk)
+        if settings.FORM_INGEST_MODE:
+            return redirect("form_submission_pending", token=submission)
+        return redirect("form_submission_detail", pk=submission.pk)
+
+
+class AsyncDynamicFormSubmissionView(DynamicFormSubmissionView):
+    # Вариант для ASGI: пока файлы грузятся в хранилище, воркер обслуживает другие запросы
+    async def get(self, request, pk):
+        # Условный GET (ETag) считается синхронно — это одно чтение формы
+        return await sync_to_async(super().get)(request, pk)
+
+    async def post(self, request, pk):
+        dynamic_form = await aget_object_or_404(DynamicForm, pk=pk)
+        form_class = await sync_to_async(get_form_class)(dynamic_form)
+        form = form_class(request.POST, request.FILES)
+
+        if form.is_valid():
+            files = await in_own_thread(collect_uploads)(form, dynamic_form, request.POST, request.FILES)
+            if not form.errors:
+                try:
+                    return await self.save_submission(request, dynamic_form, form, files)
+                except (DuplicateSubmission, UploadError) as error:
+                    form.add_error(None, str(error))
+
+        # Контекст-процессор auth обращается к базе, поэтому шаблон рендерится в синхронном потоке
+        return await sync_to_async(render)(
+            request,
+            self.template_name,
+            {"form": form, "dynamic_form": dynamic_form, "direct_uploads": direct_uploads_enabled()},
+        )
+
+    async def save_submission(self, request, dynamic_form, form, files):
+        # Журнал приёма — отдельный файл, его запись не занимает поток для работы с основной базой
+        if settings.FORM_INGEST_MODE:
+            save = in_own_thread(enqueue_submission)
+        else:
+            save = acreate_submission
+        user = await request.auser()
+        if user.is_authenticated:
+            submission = await save(dynamic_form, form, files, user=user)
+        else:
+            session_key = request.session.session_key
+            if not session_key:
+                await request.session.acreate()
+                session_key = request.session.session_key
+            submission = await save(dynamic_form, form, files, session_key=session_key)
 
-        return render(request, self.template_name, {"form": form, "dynamic_form": dynamic_form})
+        if settings.FORM_INGEST_MODE:
+            return redirect("form_submission_pending", token=submission)
+        return redirect("form_submission_detail", pk=submission.pk)
+
+
+class DirectUploadView(View):
+    def post(self, request, pk):
+        dynamic_form = get_object_or_404(DynamicForm, pk=pk)
+        if not direct_uploads_enabled():
+            raise Http404
+        if not allow_upload_ticket(request):
+            return JsonResponse({"error": "Слишком много загрузок, попробуйте позже"}, status=429)
+        try:
+            ticket = create_upload_ticket(
+                dynamic_form,
+                request.POST.get("field", ""),
+                request.POST.get("filename", ""),
+                request.POST.get("content_type", ""),
+            )
+        except UploadError as error:
+            return JsonResponse({"error": str(error)}, status=400)
+        return JsonResponse(ticket)
 
 
 class FormSubmissionSuccessView(DetailView):
@@ -149,6 +230,20 @@ class FormSubmissionSuccessView(DetailView):
     context_object_name = "submission"
 
 
+class FormSubmissionPendingView(View):
+    template_name = "forms/form_submission_pending.html"
+
+    def get(self, request, token):
+        # Сначала журнал, потом база: запись удаляется из журнала только после коммита отправки
+        status = get_queue().status(token)
+        submission = FormSubmission.objects.filter(ingest_token=token).first()
+        if submission is not None:
+            return redirect("form_submission_detail", pk=submission.pk)
+        if status is None:
+            raise Http404
+        return render(request, self.template_name, {"failed": status == "failed", "rejected": status == "rejected"})
+
+
 class FormSubmissionDetailView(DetailView):
     model = FormSubmission
     template_name = "forms/form_submission_detail.html"
@@ -157,50 +252,25 @@ class FormSubmissionDetailView(DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["field_values"] = FieldValue.objects.filter(submission=self.object).select_related("field")
-        context["file_values"] = FileValue.objects.filter(field_value__submission=self.object)
+        context["file_values"] = attach_file_urls(FileValue.objects.filter(field_value__submission=self.object))
         return context
 
 
 class FormSubmissionUpdateView(View):
     template_name = "forms/form_edit.html"
 
-    def get_form_class(self, submission):
-        fields = {}
-        for field in submission.form.fields.all():
-            if field.is_hidden:
-                continue
-
-            field_kwargs = {
-                "label": field.label,
-                "required": field.required,
-            }
-
-            if field.is_locked:
-                field_kwargs["disabled"] = True
-
-            if field.field_type == "text":
-                fields[field.label] = CharField(**field_kwargs)
-            elif field.field_type == "textarea":
-                field_kwargs["widget"] = Textarea
-                fields[field.label] = CharField(**field_kwargs)
-            elif field.field_type == "select":
-                field_kwargs["widget"] = Select
-                field_kwargs["choices"] = [(c, c) for c in field.choices or []]
-                fields[field.label] = ChoiceField(**field_kwargs)
-            elif field.field_type == "checkbox":
-                field_kwargs["widget"] = CheckboxSelectMultiple
-                field_kwargs["choices"] = [(c, c) for c in field.choices or []]
-                fields[field.label] = MultipleChoiceField(**field_kwargs)
-            elif field.field_type in ["file", "image"]:
-                field_kwargs.pop("required", None)
-                fields[field.label] = FileField(required=False, **field_kwargs)
-
-        return type("DynamicForm", (Form,), fields)
-
     def get_initial(self, submission):
         initial = {}
-        for value in submission.values.all():
-            if value.text_value is not None:
+        values = submission.values.select_related("field").prefetch_related(
+            Prefetch("file_values", queryset=FileValue.objects.order_by("id"))
+        )
+        for value in values:
+            if value.field.field_type in FILE_FIELD_TYPES:
+                # С начальным файлом ClearableFileInput показывает ссылку на него и флажок «Очистить»
+                file_values = value.file_values.all()
+                if file_values:
+                    initial[value.field.label] = file_values[0].file
+            elif value.text_value is not None:
                 initial[value.field.label] = value.text_value
             elif value.choice_value:
                 if value.field.field_type == "checkbox":
@@ -210,65 +280,59 @@ class FormSubmissionUpdateView(View):
         return initial
 
     def get(self, request, pk):
-        submission = get_object_or_404(FormSubmission, pk=pk)
-        form_class = self.get_form_class(submission)
+        submission = get_object_or_404(FormSubmission.objects.select_related("form"), pk=pk)
+        form_class = get_form_class(submission.form)
         form = form_class(initial=self.get_initial(submission))
-        return render(request, self.template_name, {"form": form, "submission": submission})
+        return render(
+            request,
+            self.template_name,
+            {"form": form, "submission": submission, "direct_uploads": direct_uploads_enabled()},
+        )
 
     def post(self, request, pk):
-        submission = get_object_or_404(FormSubmission, pk=pk)
-        form_class = self.get_form_class(submission)
+        submission = get_object_or_404(FormSubmission.objects.select_related("form"), pk=pk)
+        form_class = get_form_class(submission.form)
         form = form_class(request.POST, request.FILES)
 
         if form.is_valid():
-            for field in submission.form.fields.all():
-                if field.is_locked:
-                    continue  # 🔒 Игнорируем заблокированные поля
-
-                value = form.cleaned_data.get(field.label)
-                existing_value = FieldValue.objects.filter(submission=submission, field=field).first()
-
-                # Удаление, если значение пустое
-                if value in [None, "", [], (), {}]:
-                    if existing_value:
-                        if field.field_type in ["file", "image"]:
-                            existing_value.files.all().delete()
-                        existing_value.delete()
-                    continue
-
-                # Обновление
-                if field.field_type in ["file", "image"]:
-                    field_value, _ = FieldValue.objects.get_or_create(submission=submission, field=field)
-                    field_value.files.all().delete()
-                    for uploaded_file in request.FILES.getlist(field.label):
-                        FileValue.objects.create(
-                            field_value=field_value, file=uploaded_file, is_image=(field.field_type == "image")
-                        )
-
-                elif field.field_type == "checkbox":
-                    FieldValue.objects.update_or_create(
-                        submission=submission,
-                        field=field,
-                        defaults={"choice_value": value},
-                    )
-
-                elif field.field_type == "select":
-                    FieldValue.objects.update_or_create(
-                        submission=submission,
-                        field=field,
-                        defaults={"choice_value": [value]},
-                    )
-
-                else:
-                    FieldValue.objects.update_or_create(
-                        submission=submission,
-                        field=field,
-                        defaults={"text_value": value},
-                    )
+            files = collect_uploads(form, submission.form, request.POST, request.FILES)
+            if not form.errors:
+                try:
+                    update_submission(submission, form, files)
+                    return redirect("form_submission_detail", pk=submission.pk)
+                except UploadError as error:
+                    form.add_error(None, str(error))
+
+        return render(
+            request,
+            self.template_name,
+            {"form": form, "submission": submission, "direct_uploads": direct_uploads_enabled()},
+        )
+
+
+class AsyncFormSubmissionUpdateView(FormSubmissionUpdateView):
+    async def get(self, request, pk):
+        return await sync_to_async(super().get)(request, pk)
+
+    async def post(self, request, pk):
+        submission = await aget_object_or_404(FormSubmission.objects.select_related("form"), pk=pk)
+        form_class = await sync_to_async(get_form_class)(submission.form)
+        form = form_class(request.POST, request.FILES)
 
-            return redirect("form_submission_detail", pk=submission.pk)
+        if form.is_valid():
+            files = await in_own_thread(collect_uploads)(form, submission.form, request.POST, request.FILES)
+            if not form.errors:
+                try:
+                    await aupdate_submission(submission, form, files)
+                    return redirect("form_submission_detail", pk=submission.pk)
+                except UploadError as error:
+                    form.add_error(None, str(error))
 
-        return render(request, self.template_name, {"form": form, "submission": submission})
+        return await sync_to_async(render)(
+            request,
+            self.template_name,
+            {"form": form, "submission": submission, "direct_uploads": direct_uploads_enabled()},
+        )
 
 
 class AdminRequiredMixin(UserPassesTestMixin):
@@ -280,11 +344,18 @@ class AdminSubmissionListView(AdminRequiredMixin, ListView):
     model = FormSubmission
     template_name = "forms/admin_submission_list.html"
     context_object_name = "submissions"
-    paginate_by = 50
+    per_page = 50
+
+    def get_form_id(self):
+        form_id = self.request.GET.get("form_id", "")
+        return int(form_id) if form_id.isdigit() else None
+
+    def get_search_query(self):
+        return self.request.GET.get("q", "").strip()
 
     def get_queryset(self):
         queryset = FormSubmission.objects.select_related("form", "user").prefetch_related("values__field")
-        form_id = self.request.GET.get("form_id")
+        form_id = self.get_form_id()
         if form_id:
             queryset = queryset.filter(form_id=form_id)
         return queryset
@@ -292,6 +363,40 @@ class AdminSubmissionListView(AdminRequiredMixin, ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["forms"] = DynamicForm.objects.all()
+        query = self.get_search_query()
+        context["query"] = query
+        if query:
+            # Результаты поиска отсортированы по релевантности, а не по ключу списка, поэтому листаются по номеру
+            # страницы; лишняя строка показывает, есть ли следующая
+            page_number = self.request.GET.get("page", "")
+            page_number = int(page_number) if page_number.isdigit() and int(page_number) > 0 else 1
+            ids = search_submissions(
+                query, form_id=self.get_form_id(), limit=self.per_page + 1, offset=(page_number - 1) * self.per_page
+            )
+            submissions = self.object_list.filter(pk__in=ids[: self.per_page]).in_bulk()
+            context["submissions"] = [submissions[pk] for pk in ids[: self.per_page] if pk in submissions]
+            context["search_page"] = {
+                "number": page_number,
+                "has_previous": page_number > 1,
+                "has_next": len(ids) > self.per_page,
+                "previous_number": page_number - 1,
+                "next_number": page_number + 1,
+            }
+            return context
+
+        paginator = KeysetPaginator(self.object_list, self.per_page)
+        page = paginator.get_page(
+            after=self.request.GET.get("after"),
+            before=self.request.GET.get("before"),
+            last="last" in self.request.GET,
+        )
+        context["page"] = page
+        context["submissions"] = page.object_list
+
+        timeout = getattr(settings, "SUBMISSION_COUNT_CACHE_TIMEOUT", 300)
+        if timeout:
+            cache_key = f"submission-count:{self.get_form_id() or 'all'}"
+            context["total_count"] = estimated_count(self.object_list, cache_key, timeout)
         return context
 
 
@@ -303,32 +408,18 @@ class AdminSubmissionDetailView(AdminRequiredMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["field_values"] = FieldValue.objects.filter(submission=self.object).select_related("field")
-        context["file_values"] = FileValue.objects.filter(field_value__submission=self.object)
+        context["file_values"] = attach_file_urls(FileValue.objects.filter(field_value__submission=self.object))
         context["history"] = self.object.history.all().select_related("history_user")
+        context["change_sets"] = self.object.change_sets.select_related("changed_by")
         return context
 
     def post(self, request, *args, **kwargs):
         self.object = self.get_object()
-        field_values = self.object.values.select_related("field")
-
-        with transaction.atomic():
-            for fv in field_values:
-                field_type = fv.field.field_type
-                form_key = f"field_{fv.id}"
-
-                if field_type in ["text", "textarea"]:
-                    new_value = request.POST.get(form_key)
-                    if new_value != fv.text_value:
-                        fv.text_value = new_value
-                        fv.save()
-
-                elif field_type in ["select", "checkbox"]:
-                    new_value = (
-                        request.POST.getlist(form_key) if field_type == "checkbox" else request.POST.get(form_key)
-                    )
-                    if new_value != fv.choice_value:
-                        fv.choice_value = new_value
-                        fv.save()
-
-        messages.success(request, "Ответы формы обновлены.")
+        field_values = list(self.object.values.select_related("field"))
+        user = request.user if request.user.is_authenticated else None
+
+        if apply_admin_changes(self.object, field_values, request.POST, user=user):
+            messages.success(request, "Ответы формы обновлены.")
+        else:
+            messages.info(request, "Изменений нет.")
         return redirect(request.path)
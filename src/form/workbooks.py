@@ -0,0 +1,47 @@
+# Модуль не импортирует Django: его функции выполняются в процессах пула экспорта
+from io import BytesIO
+from openpyxl import Workbook
+from openpyxl.styles import Font, Alignment, Border, Side
+from openpyxl.utils import get_column_letter
+
+
+def render_submission_workbook(payload):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = f"Submission {payload['id']}"
+
+    header_font = Font(bold=True)
+    center_alignment = Alignment(horizontal="center", vertical="center")
+    thin_border = Border(
+        left=Side(style="thin"),
+        right=Side(style="thin"),
+        top=Side(style="thin"),
+        bottom=Side(style="thin"),
+    )
+
+    ws.append(["Поле", "Значение"])
+    for cell in ws[1]:
+        cell.font = header_font
+        cell.alignment = center_alignment
+        cell.border = thin_border
+
+    for i, (field_label, value) in enumerate(payload["rows"], start=2):
+        ws.append([field_label, value])
+        ws[f"A{i}"].border = thin_border
+        ws[f"B{i}"].border = thin_border
+
+    for col in range(1, 3):
+        column_letter = get_column_letter(col)
+        max_length = max(len(str(ws[f"{column_letter}{row}"].value or "")) for row in range(1, ws.max_row + 1))
+        ws.column_dimensions[column_letter].width = min(max_length + 2, 40)
+
+    ws["A1"].alignment = center_alignment
+    ws["B1"].alignment = center_alignment
+
+    buffer = BytesIO()
+    wb.save(buffer)
+    return f"submission_{payload['id']}.xlsx", buffer.getvalue()
+
+
+def render_submission_workbooks(payloads):
+    return [render_submission_workbook(payload) for payload in payloads]
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+class SubmissionWriter:
+    # Единственный поток процесса, который пишет отправки: задания из очереди коммитятся одной транзакцией,
+    # каждое в своей точке сохранения, поэтому ошибка одной отправки не откатывает остальные
+    def __init__(self, batch_size=50):
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="form-writer", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, func, *args, **kwargs):
+        future = Future()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def submit(self, func, *args, **kwargs):
+        return self.enqueue(func, *args, **kwargs).result()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        # Пока пишется одна пачка, в очереди копятся следующие задания; ждать их специально не нужно
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._write(batch)
+            except Exception:
+                # Пачка не закоммитилась (например, на отложенной проверке внешних ключей) — пишем задания по одному
+                logger.warning("Не удалось записать пачку отправок, повтор по одной", exc_info=True)
+                for job in batch:
+                    if not job[0].done():
+                        self._write_one(job)
+            finally:
+                close_old_connections()
+
+    def _write_one(self, job):
+        try:
+            self._write([job])
+        except Exception as exc:
+            job[0].set_exception(exc)
+
+    def _write(self, batch):
+        results = []
+        with transaction.atomic():
+            for future, func, args, kwargs in batch:
+                try:
+                    with transaction.atomic():
+                        results.append((future, func(*args, **kwargs)))
+                except Exception as exc:
+                    future.set_exception(exc)
+        # Результат отдаётся только после коммита всей пачки
+        for future, result in results:
+            future.set_result(result)
+
+
+def get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = SubmissionWriter(batch_size=settings.FORM_WRITER_BATCH_SIZE)
+    return _writer
+
+
+def write(func, *args, **kwargs):
+    # Внутри чужой транзакции пишем на месте, иначе запись ушла бы в другой поток и закоммитилась отдельно
+    if not settings.FORM_SERIAL_WRITER or connection.in_atomic_block:
+        return func(*args, **kwargs)
+    return get_writer().submit(func, *args, **kwargs)
+
+
+async def awrite(func, *args, **kwargs):
+    if not settings.FORM_SERIAL_WRITER:
+        return await sync_to_async(func)(*args, **kwargs)
+    # Результат писателя ждёт цикл событий, а не общий синхронный поток: иначе одновременные отправки
+    # выстраивались бы в нём по одной, не попадая в одну пачку, и задерживали бы остальные синхронные вызовы
+    return await asyncio.wrap_future(get_writer().enqueue(func, *args, **kwargs))